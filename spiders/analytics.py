@@ -0,0 +1,295 @@
+"""
+Cross-race analytics of results, vectorised with NumPy for back-testing betting strategies.
+
+load gives a range of results as a Races, which holds every column as a NumPy array: the hippos
+and disciplines as integer codes, the arrivees as a (races, 4) array and the payouts as a
+(races, 12) float array in the order of records.PAYOUTS, NaN when missing. The aggregates work
+on whole columns, grouping with np.bincount and sorting once, so a million races take well
+under a second, many times quicker than a loop over the rows (see bench_analytics.py).
+    payout_stats gives the number of races, how many paid, the mean and quantiles of a payout
+        for each group, e.g. for each hippodrome and discipline.
+    roi simulates a 1 euro bet on a horse in every race, the favourite or a numero, gagnant or
+        place, and gives the bets, hit rate, stakes, returns and ROI of each group.
+The favourite of a race is the runner with the lowest morning odds, from a runners file written
+with "cli.py --runners FILE". The tables are dicts of column name to array, so
+pandas.DataFrame(table) makes a frame of one. Loading needs pandas, see normalise.load_frame.
+To Run:  cd to this folder, then use the command "python analytics.py SOURCE", e.g.
+         python analytics.py dataset/ --start 2018-01-01 --end 2018-12-31 --bet gagnant \
+             --by hippo discipline --runners runners.jsonl --pick favourite
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+from records import PAYOUTS
+
+GROUPS = ('hippo', 'discipline', 'year')
+BETS = ('gagnant', 'place')
+PLACE_PAYOUTS = ('gagnant_place', 'place_1', 'place_2')  # For the 1st, 2nd and 3rd
+THIRD_PLACE_PARTANTS = 8  # With fewer runners only the first two are paid place
+
+
+class Races():
+    """
+    Results as columns. hippo and discipline are codes into the hippos and disciplines arrays
+    of names ('' when missing), partants, arrivees and favourite are 0 when missing or unknown.
+    """
+
+    def __init__(self, day, hippo, hippos, discipline, disciplines, partants, arrivees, payouts,
+                 race_id=None, favourite=None):
+        self.day = day  # datetime64[D]
+        self.hippo = hippo
+        self.hippos = hippos
+        self.discipline = discipline
+        self.disciplines = disciplines
+        self.partants = partants
+        self.arrivees = arrivees
+        self.payouts = payouts
+        self.race_id = race_id
+        self.favourite = np.zeros(len(day), np.int16) if favourite is None else favourite
+
+    def __len__(self):
+        return len(self.day)
+
+    def __repr__(self):
+        return f'Races: {len(self)}'
+
+    def payout(self, column):
+        """The column of a payout, e.g. 'gagnant'."""
+        return self.payouts[:, PAYOUTS.index(column)]
+
+    def set_favourites(self, favourites):
+        """Sets the favourite of each race from a dict of race_id to numero."""
+        self.favourite = np.array([favourites.get(race_id, 0) for race_id in self.race_id],
+                                  np.int16)
+
+    @classmethod
+    def from_frame(cls, frame):
+        """Returns the Races of a DataFrame of results, see normalise.to_frame."""
+        import pandas
+
+        hippo, hippos = pandas.factorize(frame['hippo'].fillna(''))
+        discipline, disciplines = pandas.factorize(frame['discipline'].fillna(''))
+        return cls(
+            np.array(frame['day'], dtype='datetime64[D]'),
+            hippo.astype(np.int32), np.asarray(hippos, object),
+            discipline.astype(np.int32), np.asarray(disciplines, object),
+            frame['partants'].fillna(0).to_numpy(np.int16),
+            frame[[f'arrivee_{place}' for place in range(1, 5)]].fillna(0).to_numpy(np.int16),
+            frame[list(PAYOUTS)].to_numpy(np.float64),
+            race_id=frame['race_id'].to_numpy(object)
+        )
+
+
+def favourites(path):
+    """
+    Returns a dict of race_id to the numero of its favourite, the runner with the lowest morning
+    odds, from a JSON lines file of RunnerRecords. Races without odds are left out.
+    """
+    import json
+    import math
+    from normalise import parse_float
+
+    best = {}
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            runner = json.loads(line)
+            cote = parse_float(runner['cote'])
+            if not math.isnan(cote) and cote < best.get(runner['race_id'], (math.inf,))[0]:
+                best[runner['race_id']] = cote, runner['numero']
+    return {race_id: numero for race_id, (_, numero) in best.items()}
+
+
+def load(source, start=None, end=None, runners=None):
+    """
+    Returns the results of the YYYY-MM-DD days from start to end as Races, source being any
+    that normalise.load_frame reads. runners is a JSON lines file of RunnerRecords, to know the
+    favourite of each race.
+    """
+    from normalise import load_frame
+
+    races = Races.from_frame(load_frame(source, start, end))
+    if runners is not None:
+        races.set_favourites(favourites(runners))
+    return races
+
+
+def group_by(races, by):
+    """
+    Returns the index of each race's group, and the labels of the groups as a dict of column to
+    array, for the columns by of GROUPS. The groups are sorted, hippos by code.
+    """
+    columns = {}
+    for column in by:
+        if column == 'hippo':
+            columns[column] = races.hippo, races.hippos
+        elif column == 'discipline':
+            columns[column] = races.discipline, races.disciplines
+        elif column == 'year':
+            years = races.day.astype('datetime64[Y]').astype(np.int64) + 1970
+            low = years.min() if len(years) else 0
+            columns[column] = years - low, np.arange(low, years.max() + 1 if len(years) else 0)
+        else:
+            raise ValueError(f'Cannot group by {column}, only by {", ".join(GROUPS)}')
+
+    key = np.zeros(len(races), np.int64)
+    size = 1
+    for codes, labels in columns.values():
+        key = key * len(labels) + codes
+        size *= len(labels)
+    if size <= max(len(races), 2 ** 16):
+        # Few enough possible keys to count them, which is much quicker than np.unique's sort
+        keys = np.flatnonzero(np.bincount(key, minlength=size))
+        numbers = np.zeros(size, np.int64)
+        numbers[keys] = np.arange(len(keys))
+        index = numbers[key]
+    else:
+        keys, index = np.unique(key, return_inverse=True)
+    groups = {}
+    for column, (codes, labels) in reversed(columns.items()):
+        keys, codes = np.divmod(keys, len(labels))
+        groups[column] = labels[codes]
+    return index, {column: groups[column] for column in by}
+
+
+def quantiles(index, values, count, qs):
+    """
+    Returns the qs quantiles (linear, as np.quantile) of the values of each of the count groups,
+    ignoring NaN, as a (count, len(qs)) array. NaN for groups with no values.
+    """
+    known = ~np.isnan(values)
+    index, values = index[known], values[known]
+    # By value, then by group keeping that order, which is quicker than np.lexsort as stable
+    # sorts of 16 bit ints are radix sorts
+    order = np.argsort(values)
+    groups = index[order].astype(np.uint16 if count <= 2 ** 16 else np.int64)
+    values = values[order[np.argsort(groups, kind='stable')]]
+    sizes = np.bincount(index, minlength=count)
+    starts = np.cumsum(sizes) - sizes
+    result = np.full((count, len(qs)), np.nan)
+    if not len(values):
+        return result
+    for column, q in enumerate(qs):
+        position = starts + q * np.maximum(sizes - 1, 0)
+        low = np.minimum(np.floor(position).astype(np.int64), len(values) - 1)
+        high = np.minimum(np.ceil(position).astype(np.int64), len(values) - 1)
+        fraction = position - np.floor(position)
+        result[:, column] = np.where(
+            sizes > 0, values[low] + (values[high] - values[low]) * fraction, np.nan
+        )
+    return result
+
+
+def payout_stats(races, bet='gagnant', by=('hippo', 'discipline'), qs=(0.25, 0.5, 0.75, 0.9)):
+    """
+    Returns a table of the payout bet (a column of records.PAYOUTS) for each group: the races,
+    how many paid, the mean and the qs quantiles of what was paid.
+    """
+    index, table = group_by(races, by)
+    count = len(next(iter(table.values()))) if table else 1
+    values = races.payout(bet)
+    paid = ~np.isnan(values)
+    table['races'] = np.bincount(index, minlength=count)
+    table['paid'] = np.bincount(index, weights=paid, minlength=count).astype(np.int64)
+    total = np.bincount(index, weights=np.where(paid, values, 0), minlength=count)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        table['mean'] = total / table['paid']
+    for q, column in zip(qs, quantiles(index, values, count, qs).T):
+        table[f'q{q * 100:g}'] = column
+    return table
+
+
+def bet_returns(races, bet='gagnant', pick='favourite'):
+    """
+    Returns which races a 1 euro bet on the horse pick (a numero, or 'favourite') is placed in,
+    and what each returns. A bet gagnant pays the gagnant payout when the horse wins, a bet place
+    the payout of its place when it is in the first three, or only the first two in a race of
+    fewer than 8 runners, where 3rd is a lost bet. Races are left out when the horse isn't known
+    or didn't run or the arrivee isn't known, or when the horse is in the money but its payout
+    is missing.
+    """
+    if bet not in BETS:
+        raise ValueError(f'Not a bet: {bet}, only {", ".join(BETS)}')
+    horse = races.favourite if pick == 'favourite' else np.full(len(races), int(pick), np.int16)
+    placed = races.arrivees[:, 0] > 0
+    if bet == 'gagnant':
+        places, payouts = [0], ['gagnant']
+    else:
+        places, payouts = [0, 1, 2], list(PLACE_PAYOUTS)
+    returns = np.zeros(len(races))
+    for place, column in zip(places, payouts):
+        payout = races.payout(column)
+        if place == 2:
+            unpaid = (races.partants > 0) & (races.partants < THIRD_PLACE_PARTANTS)
+            payout = np.where(unpaid, 0, payout)
+        returns = np.where(races.arrivees[:, place] == horse, payout, returns)
+    running = (races.partants == 0) | (horse <= races.partants)
+    betting = (horse > 0) & running & placed & ~np.isnan(returns)
+    return betting, np.where(betting, returns, 0)
+
+
+def roi(races, bet='gagnant', pick='favourite', by=('hippo',)):
+    """
+    Returns a table of 1 euro bets on pick in every race (see bet_returns) for each group: the
+    bets, hits, hit rate, staked, returned and the ROI, (returned - staked) / staked.
+    """
+    index, table = group_by(races, by)
+    count = len(next(iter(table.values()))) if table else 1
+    betting, returns = bet_returns(races, bet, pick)
+    table['bets'] = np.bincount(index, weights=betting, minlength=count).astype(np.int64)
+    table['hits'] = np.bincount(index, weights=returns > 0, minlength=count).astype(np.int64)
+    table['returned'] = np.bincount(index, weights=returns, minlength=count)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        table['hit_rate'] = table['hits'] / table['bets']
+        table['roi'] = (table['returned'] - table['bets']) / table['bets']
+    return table
+
+
+def format_table(table):
+    """The table as lines of text, numbers right aligned."""
+    def cell(value):
+        if isinstance(value, (float, np.floating)):
+            return f'{value:.2f}'
+        return str(value)
+
+    rows = [list(table)] + [[cell(value) for value in row] for row in zip(*table.values())]
+    widths = [max(len(row[column]) for row in rows) for column in range(len(table))]
+    text = [np.asarray(values).dtype.kind in 'OUS' for values in table.values()]
+    return [
+        '  '.join(value.ljust(width) if left else value.rjust(width)
+                  for value, width, left in zip(row, widths, text))
+        for row in rows
+    ]
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('source', help='a dataset or Parquet folder, or a JSON lines file')
+    parser.add_argument('--start', help='YYYY-MM-DD, the first day')
+    parser.add_argument('--end', help='YYYY-MM-DD, the last day')
+    parser.add_argument('--bet', default='gagnant', help='the payout to give the stats of')
+    parser.add_argument('--by', nargs='*', default=['hippo', 'discipline'], choices=GROUPS)
+    parser.add_argument('--runners', metavar='FILE', help='runners, to know the favourites')
+    parser.add_argument('--pick', default='favourite',
+                        help='the horse to back for the ROI, favourite or a numero')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    if args.bet not in PAYOUTS:
+        sys.exit(f'Not a payout: {args.bet}, only {", ".join(PAYOUTS)}')
+    if args.pick == 'favourite' and args.runners is None:
+        sys.exit('--runners is needed to back the favourite, or --pick a numero')
+    races = load(args.source, args.start, args.end, args.runners)
+    print(f'{len(races)} races\n')
+    print('\n'.join(format_table(payout_stats(races, args.bet, args.by))))
+    for bet in BETS:
+        print(f'\n{bet.capitalize()} on {args.pick}')
+        print('\n'.join(format_table(roi(races, bet, args.pick, args.by))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+Scrapes one race, or one reunion, on demand, for when a whole day's crawl is too slow, e.g. to
+get the payouts of a race just after it has been run. E.g.
+    from api import scrape_race, scrape_reunion
+    result = scrape_race('c991181', '2018-07-30')  # or the race's partants or rapports URL
+    results = scrape_reunion('2018-07-30', 'R2')
+Results are RaceResults (see records.py), made by the same extract_stats and
+extract_race_payouts as the spider. The pages are fetched with a requests.Session, whose
+keep-alive connections are reused from call to call. Needs requests ("pip install requests").
+bench_api.py measures the latency against a local stand-in for www.geny.com.
+"""
+
+from collections import OrderedDict
+from datetime import date
+
+import requests
+from requests.adapters import HTTPAdapter
+from scrapy.http import HtmlResponse
+
+from cache import page_date
+from geny_scrape import GenyScrapeSpider
+from partants import extract_stats
+from rapports import extract_race_payouts
+from records import RaceResult
+
+
+class GenyClient():
+    """
+    Fetches and scrapes geny.com pages over a pooled keep-alive session. The races listings of
+    the last few finished days asked about are kept, as they don't change.
+    """
+
+    def __init__(self, base_url=GenyScrapeSpider.SITE, timeout=10, pool_size=10, listings=32):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.max_listings = listings
+        self.listings = OrderedDict()  # Day -> races of its listing, least recently used first
+
+    def __repr__(self):
+        return f'GenyClient: {self.base_url}'
+
+    def close(self):
+        self.session.close()
+
+    def get(self, path):
+        """Returns a page as a Scrapy response, so the spider's extraction can be used on it."""
+        response = self.session.get(f'{self.base_url}{path}', timeout=self.timeout)
+        response.raise_for_status()
+        return self.page(path, response)
+
+    @staticmethod
+    def page(path, response):
+        # The pages are parsed under their geny.com URL, which extract_stats takes the date from
+        return HtmlResponse(url=f'{GenyScrapeSpider.SITE}{path}', body=response.content,
+                            encoding=response.encoding or 'utf-8')
+
+    def get_if_changed(self, path, validators=None):
+        """
+        Conditional GET of a page, validators being the {'etag', 'last_modified'} returned for
+        it last time. Returns the page, or None if it hasn't changed or isn't there (404), and
+        the validators to send next time.
+        """
+        validators = validators or {}
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        response = self.session.get(f'{self.base_url}{path}', headers=headers,
+                                    timeout=self.timeout)
+        if response.status_code in (304, 404):
+            return None, validators
+        response.raise_for_status()
+        validators = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')
+        }
+        return self.page(path, response), validators
+
+    def races(self, day):
+        """Returns the links of every race of a YYYY-MM-DD day, see GenyScrapeSpider.race_links."""
+        if day in self.listings:
+            self.listings.move_to_end(day)
+            return self.listings[day]
+        races = GenyScrapeSpider.race_links(self.get(f'{GenyScrapeSpider.LISTING_PATH}{day}'))
+        if date.fromisoformat(day) < date.today():
+            # Today's listing only gets its rapports links as races are run, so isn't kept
+            self.listings[day] = races
+            if len(self.listings) > self.max_listings:
+                self.listings.popitem(last=False)
+        return races
+
+    def links(self, race, day=None):
+        """
+        Returns the partants and rapports paths of a race given as its partants or rapports URL
+        (or path), or as its id (e.g. 'c991181' or 'nacre_c991181') and YYYY-MM-DD day.
+        """
+        if '/' in race:
+            path = '/' + race.split('://', 1)[-1].split('/', 1)[-1].lstrip('/')
+            for kind in ('partants-pmu', 'rapports-pmu'):
+                if path.startswith(f'/{kind}/'):
+                    slug = path[len(kind) + 2:]
+                    return f'/partants-pmu/{slug}', f'/rapports-pmu/{slug}'
+            raise ValueError(f'Not a partants or rapports URL: {race}')
+        if day is None:
+            raise ValueError('The day is needed to find a race from its id')
+        number = race.rsplit('_', 1)[-1]  # E.g. 'c991181', the same for 'nacre_c991181'
+        for links in self.races(day):
+            if links['pronostics'] is None:
+                continue  # No partants link, so not a race that can be scraped
+            if links['pronostics'].rsplit('_', 1)[-1] == number:
+                slug = links['pronostics'].split('/')[-1]
+                return links['pronostics'], links['rapports'] or f'/rapports-pmu/{slug}'
+        raise LookupError(f'No race {race} on {day}')
+
+    def scrape_race(self, race, day=None):
+        """
+        Returns the RaceResult of a race (see links for how to give it), or None if its
+        rapports haven't been published yet.
+        """
+        partants, rapports = self.links(race, day)
+        day = day or page_date(partants).isoformat()
+        stats = extract_stats(self.get(partants), day)
+        try:
+            payouts = extract_race_payouts(self.get(rapports), day)
+        except requests.HTTPError as error:
+            if error.response is not None and error.response.status_code == 404:
+                return None
+            raise
+        return RaceResult.from_halves(stats, payouts)
+
+    def scrape_reunion(self, day, reunion):
+        """
+        Returns the RaceResults of the races of a reunion (e.g. 'R2') that have been run, in
+        course order.
+        """
+        results = []
+        for links in self.races(day):
+            if links['reunion'] == reunion and links['rapports'] is not None:
+                result = self.scrape_race(links['pronostics'], day)
+                if result is not None:
+                    results.append(result)
+        return results
+
+
+_client = None
+
+
+def client():
+    """The GenyClient shared by scrape_race and scrape_reunion, so its connections are reused."""
+    global _client
+    if _client is None:
+        _client = GenyClient()
+    return _client
+
+
+def scrape_race(race, day=None):
+    return client().scrape_race(race, day)
+
+
+def scrape_reunion(day, reunion):
+    return client().scrape_reunion(day, reunion)
@@ -0,0 +1,362 @@
+"""
+Compressed archive of every page the spider downloads, so the races can be scraped again after
+a fix to extract_stats/extract_race_payouts, or a change to geny.com's markup, without crawling
+history again. E.g.
+    python cli.py --start 01/07/2018 --end 31/07/2018 -o july.xlsx --archive archive/
+    python archive.py archive/
+    python archive.py archive/ --start 01/07/2018 --end 31/07/2018 -o july.jsonl -j 8
+The first archives the pages as they are crawled (-s GENY_ARCHIVE=archive/ does the same for
+scrapy runspider and backfill.py). The second prints what is in the archive. The third re-parses
+the archived pages of the range through the spider's own callbacks and RaceJoinPipeline, over a
+pool of processes and with no network, then merges them into an output like backfill.py does.
+
+Bodies are compressed one by one with zstd, if zstandard is installed ("pip install zstandard"),
+else gzip, and appended to segment files that are never rewritten. Each crawl appends to a
+segment of its own, so several processes can archive at once. An SQLite index gives the segment,
+offset and length of every page by path and day, the latest copy of a page being the one used, so
+pages archived from a stand-in (cli.py --site) are re-parsed like pages of geny.com.
+"""
+
+import argparse
+import gzip
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import deque
+from datetime import date
+from urllib.parse import urlsplit
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse
+
+from cache import page_date
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SEGMENT = 'segment-{:06d}.dat'
+VERSION = 1  # Of the index, 1 being pages keyed by path and query
+
+
+def page_key(url):
+    """A page's path and query, so copies from any host or scheme are the same page."""
+    parts = urlsplit(url)
+    return f'{parts.path}?{parts.query}' if parts.query else parts.path
+
+
+def compress(body):
+    """Returns the compressed body and the codec used."""
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=10).compress(body), 'zstd'
+    return gzip.compress(body, compresslevel=6, mtime=0), 'gzip'
+
+
+def decompress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('zstandard is needed to read this archive ("pip install zstandard")')
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class PageArchive():
+    """
+    The archive in a folder. Pages are added with add, which appends to this archive's own
+    segment (made on the first add), and read back with response. Index writes are committed at
+    least every checkpoint_secs seconds, pages not yet in the index are just skipped bytes.
+    """
+
+    def __init__(self, folder, segment_size=256 * 1024 * 1024, checkpoint_secs=5):
+        self.folder = folder
+        self.segment_size = segment_size
+        self.checkpoint_secs = checkpoint_secs
+        os.makedirs(folder, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(folder, 'index.db'), timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS pages (key TEXT NOT NULL, url TEXT NOT NULL, day TEXT, '
+            'encoding TEXT, fetched REAL NOT NULL, segment INTEGER NOT NULL, '
+            'offset INTEGER NOT NULL, length INTEGER NOT NULL, size INTEGER NOT NULL, '
+            'codec TEXT NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS pages_key ON pages (key)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS pages_day ON pages (day)')
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] < VERSION:
+            # Earlier archives keyed pages by host, path and query
+            self.conn.create_function('page_key', 1, page_key, deterministic=True)
+            self.conn.execute('UPDATE pages SET key = page_key(url)')
+            self.conn.execute(f'PRAGMA user_version = {VERSION}')
+        self.conn.commit()
+        self.segment = None  # Number of the segment being appended to
+        self.file = None
+        self.readers = {}  # Segment number -> file open for reading
+        self.last_checkpoint = time.monotonic()
+        self.pending = 0  # Pages added since the last checkpoint
+
+    def __repr__(self):
+        return f'PageArchive: {self.folder}'
+
+    def new_segment(self):
+        """Makes a segment no other archive is appending to, and appends to it from now on."""
+        if self.file is not None:
+            self.file.close()
+        number = max(self.segments(), default=0) + 1
+        while True:
+            try:
+                # 'x' fails if another process has just made this segment, so each has its own
+                self.file = open(os.path.join(self.folder, SEGMENT.format(number)), 'xb')
+            except FileExistsError:
+                number += 1
+            else:
+                break
+        self.segment = number
+
+    def segments(self):
+        numbers = []
+        for name in os.listdir(self.folder):
+            if name.startswith('segment-') and name.endswith('.dat'):
+                numbers.append(int(name[len('segment-'):-len('.dat')]))
+        return numbers
+
+    def add(self, url, body, encoding=None):
+        """Appends a page's body to the archive."""
+        data, codec = compress(body)
+        if self.file is None or self.file.tell() + len(data) > self.segment_size:
+            self.new_segment()
+        offset = self.file.tell()
+        self.file.write(data)
+        self.file.flush()  # On disk before the index points at it
+        day = page_date(url)
+        self.conn.execute(
+            'INSERT INTO pages (key, url, day, encoding, fetched, segment, offset, length, size, '
+            'codec) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (page_key(url), url, day.isoformat() if day is not None else None, encoding,
+             time.time(), self.segment, offset, len(data), len(body), codec)
+        )
+        self.pending += 1
+        if time.monotonic() - self.last_checkpoint >= self.checkpoint_secs:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Commits every page added so far to the index."""
+        if self.pending:
+            self.conn.commit()
+            self.pending = 0
+        self.last_checkpoint = time.monotonic()
+
+    def read(self, segment, offset, length):
+        if segment not in self.readers:
+            self.readers[segment] = open(os.path.join(self.folder, SEGMENT.format(segment)), 'rb')
+        reader = self.readers[segment]
+        reader.seek(offset)
+        return reader.read(length)
+
+    def response(self, url):
+        """Returns the latest archived copy of a page as a Scrapy response, or None."""
+        row = self.conn.execute(
+            'SELECT url, encoding, segment, offset, length, codec FROM pages WHERE key = ? '
+            'ORDER BY rowid DESC LIMIT 1',
+            (page_key(url),)
+        ).fetchone()
+        if row is None:
+            return None
+        url, encoding, segment, offset, length, codec = row
+        body = decompress(self.read(segment, offset, length), codec)
+        return HtmlResponse(url=url, body=body, encoding=encoding or 'utf-8')
+
+    def keys(self, before=None):
+        """Returns the keys (see page_key) of the pages archived, of days before a date if given."""
+        if before is None:
+            rows = self.conn.execute('SELECT DISTINCT key FROM pages')
+        else:
+            rows = self.conn.execute('SELECT DISTINCT key FROM pages WHERE day < ?',
+                                     (before.isoformat(),))
+        return {key for key, in rows}
+
+    def days(self, start=None, end=None):
+        """Returns the YYYY-MM-DD days with archived pages, from start to end if given."""
+        sql = 'SELECT DISTINCT day FROM pages WHERE day IS NOT NULL'
+        params = []
+        if start is not None:
+            sql += ' AND day >= ?'
+            params.append(start)
+        if end is not None:
+            sql += ' AND day <= ?'
+            params.append(end)
+        return [day for day, in self.conn.execute(sql + ' ORDER BY day', params)]
+
+    def summary(self):
+        """Returns the number of copies, pages and days archived, and their raw and stored bytes."""
+        return self.conn.execute(
+            'SELECT COUNT(*), COUNT(DISTINCT key), COUNT(DISTINCT day), COALESCE(SUM(size), 0), '
+            'COALESCE(SUM(length), 0) FROM pages'
+        ).fetchone()
+
+    def close(self):
+        self.checkpoint()
+        self.conn.close()
+        if self.file is not None:
+            self.file.close()
+        for reader in self.readers.values():
+            reader.close()
+
+
+class ArchiveMiddleware():
+    """
+    Downloader middleware archiving every page downloaded, when GENY_ARCHIVE is set to the
+    archive's folder. Its order (580) is below HttpCompressionMiddleware's, so bodies are
+    archived decompressed. Pages of finished days already in the archive (e.g. served by the
+    HTTP cache) aren't archived again.
+    """
+
+    def __init__(self, folder, stats):
+        self.archive = PageArchive(folder)
+        self.archived = self.archive.keys(before=date.today())  # Pages that won't change
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        folder = crawler.settings.get('GENY_ARCHIVE')
+        if not folder:
+            raise NotConfigured
+        middleware = cls(folder, crawler.stats)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def process_response(self, request, response):
+        if response.status != 200 or not isinstance(response, HtmlResponse):
+            return response
+        key = page_key(response.url)
+        if key not in self.archived:
+            self.archive.add(response.url, response.body, response.encoding)
+            day = page_date(response.url)
+            if day is not None and day < date.today():
+                self.archived.add(key)
+            self.stats.inc_value('geny/archive/pages')
+        return response
+
+    def spider_closed(self, spider):
+        self.archive.close()
+
+
+def replay(folder, days, path):
+    """
+    Re-parses the archived pages of the YYYY-MM-DD days into a JSON lines file of RaceResults,
+    starting from each day's races listing and following the requests the callbacks make, as a
+    crawl would. Pages missing from the archive are skipped. Returns the path and how many pages
+    were parsed and missing.
+    """
+    import scrapy
+    from geny_scrape import GenyScrapeSpider
+    from pipelines import RaceJoinPipeline
+
+    archive = PageArchive(folder)
+    spider = GenyScrapeSpider(dates=','.join(f'{day[8:]}/{day[5:7]}/{day[:4]}' for day in days),
+                              output_format='none', headless=True, jsonl=path)
+    pipeline = RaceJoinPipeline(spider)
+    requests = deque(spider.start_requests())
+    parsed = missing = 0
+    while requests:
+        request = requests.popleft()
+        response = archive.response(request.url)
+        if response is None:
+            missing += 1
+            continue
+        parsed += 1
+        for output in request.callback(response, **request.cb_kwargs) or []:
+            if isinstance(output, scrapy.Request):
+                requests.append(output)
+            else:
+                pipeline.process_item(output)
+    pipeline.close_spider()
+    spider.closed('finished')
+    archive.close()
+    return path, parsed, missing
+
+
+def reparse(folder, output, start=None, end=None, jobs=None):
+    """
+    Re-parses the archived days from the YYYY-MM-DD start to end (both optional) over jobs
+    processes, and merges them into output (see backfill.merge). Returns how many days, pages
+    and races there were, how many pages were missing, and the seconds taken.
+    """
+    from backfill import merge, shard_dates
+
+    started = time.perf_counter()
+    archive = PageArchive(folder)
+    days = archive.days(start, end)
+    archive.close()
+    if not days:
+        raise ValueError(f'No days archived in {folder} from {start} to {end}')
+    jobs = jobs or os.cpu_count() or 1
+    work = tempfile.mkdtemp(prefix='geny-reparse-')
+    try:
+        tasks = [
+            (folder, run, os.path.join(work, f'shard-{index:04d}.jsonl'))
+            for index, run in enumerate(shard_dates(days, jobs))
+        ]
+        with multiprocessing.Pool(min(jobs, len(tasks))) as pool:
+            shards = pool.starmap(replay, tasks, chunksize=1)
+        races = merge([path for path, _, _ in shards], output)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    parsed = sum(pages for _, pages, _ in shards)
+    missing = sum(pages for _, _, pages in shards)
+    return len(days), parsed, races, missing, time.perf_counter() - started
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('archive', help='folder of the archive')
+    parser.add_argument('--start', metavar='DD/MM/YYYY')
+    parser.add_argument('--end', metavar='DD/MM/YYYY')
+    parser.add_argument('-o', '--output',
+                        help='re-parse into this .xlsx, .jsonl or .db (see store.py) file, or '
+                             'else a folder for Parquet files')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='processes to re-parse with, by default one per core')
+    args = parser.parse_args(args)
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    return args
+
+
+def main(args=None):
+    from geny_scrape import Date
+
+    args = parse_args(args)
+    if not os.path.isfile(os.path.join(args.archive, 'index.db')):
+        print(f'No archive in {args.archive}', file=sys.stderr)
+        return 1
+    start = Date(args.start).iso if args.start else None
+    end = Date(args.end).iso if args.end else None
+    if args.output is None:
+        archive = PageArchive(args.archive)
+        copies, pages, days, size, stored = archive.summary()
+        archived = archive.days(start, end)
+        archive.close()
+        print(f'{pages} pages ({copies} copies) of {days} days, {size / 1e6:.2f}MB stored in '
+              f'{stored / 1e6:.2f}MB ({stored / size if size else 0:.0%})')
+        if archived:
+            print(f'Days from {archived[0]} to {archived[-1]}')
+        return 0
+    days, pages, races, missing, seconds = reparse(args.archive, args.output, start, end,
+                                                   args.jobs)
+    print(f'{races} races from {days} days re-parsed in {seconds:.1f}s '
+          f'({pages / seconds:.0f} pages/sec, {missing} pages not archived), saved to '
+          f'{args.output}')
+    if not races:
+        print(f'No races re-parsed from {args.archive}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
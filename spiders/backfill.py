@@ -0,0 +1,187 @@
+"""
+Backfills a long range of days on every core. The range is split into shards of consecutive days
+and each shard is crawled by GenyScrapeSpider in its own process, writing its races to a JSON lines
+file. The shards are then merged into one output, sorted by day then like order_rows (reunion,
+then course), so the output is the same however many processes were used. E.g.
+    python backfill.py --start 01/01/2017 --end 31/12/2017 -j 8 -o 2017.xlsx
+    python backfill.py --start 01/01/2017 --end 31/12/2017 -o parquet/   (one file per day)
+    python backfill.py --start 01/01/2017 --end 31/12/2017 -o results.db   (see store.py)
+    python backfill.py --start 01/07/2018 --end 31/07/2018 -o july.jsonl -j 8 --scaling
+--scaling crawls the range with 1, 2, 4 ... up to --jobs processes and reports the races/sec of
+each. --site crawls another copy of the site instead, e.g. the stand-in of standin.py.
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from geny_scrape import Date
+from store import ResultsStore
+from writers import JsonLinesWriter, ParquetWriter, XlsxWriter, read_json_lines
+
+
+def shard_dates(dates, shards):
+    """Splits the dates into at most shards runs of consecutive days, as evenly as possible."""
+    shards = max(1, min(shards, len(dates)))
+    size, extra = divmod(len(dates), shards)
+    runs = []
+    start = 0
+    for shard in range(shards):
+        end = start + size + (1 if shard < extra else 0)
+        runs.append(dates[start:end])
+        start = end
+    return runs
+
+
+def crawl_shard(dates, path, settings, site=None):
+    """
+    Crawls the DD/MM/YYYY dates into a JSON lines file, in a process of its own as Twisted's
+    reactor can only be started once. settings win over the spider's custom_settings, like
+    "scrapy -s". Returns the path, how the crawl finished (Scrapy's finish_reason, None if it
+    never started) and how many errors it logged.
+    """
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.settings import Settings
+    from geny_scrape import GenyScrapeSpider
+
+    # Shards start at once and would race for the telnet console's ports, which none needs
+    crawl_settings = Settings({'LOG_LEVEL': 'WARNING', 'TELNETCONSOLE_ENABLED': False})
+    crawl_settings.setdict(settings, priority='cmdline')
+    kwargs = {'site': site} if site is not None else {}
+    process = CrawlerProcess(crawl_settings)
+    crawler = process.create_crawler(GenyScrapeSpider)
+    process.crawl(crawler, dates=','.join(dates), output_format='none', headless=True,
+                  jsonl=path, **kwargs)
+    process.start()
+    try:
+        stats = crawler.stats.get_stats()
+    except RuntimeError:
+        stats = {}  # The crawl never started, e.g. the spider couldn't be made
+    return path, stats.get('finish_reason'), stats.get('log_count/ERROR', 0)
+
+
+def merge(paths, output):
+    """
+    Merges the shard files into output, which is an .xlsx or .jsonl file, a .db results store
+    (see store.py), or else a folder of Parquet files. Returns how many races were written.
+    """
+    results = [result for path in paths for result in read_json_lines(path)]
+    results.sort(key=lambda result: (result.day, *result.sort_key(), result.race_id))
+    if output.lower().endswith('.xlsx'):
+        writer = XlsxWriter(output, sorted({result.day for result in results}))
+    elif output.lower().endswith('.jsonl'):
+        writer = JsonLinesWriter(output)
+    elif output.lower().endswith('.db'):
+        writer = ResultsStore(output)
+    else:
+        writer = ParquetWriter(output)
+    for result in results:
+        writer.write(result)
+    writer.close()
+    return len(results)
+
+
+def backfill(dates, jobs, output, settings=None, shards=None, site=None):
+    """
+    Crawls the dates with jobs processes, from site if given, and merges them into output.
+    Returns how many races were written and the seconds taken. Raises RuntimeError, leaving
+    output as it was, if any shard didn't finish or logged errors (e.g. pages that couldn't be
+    downloaded), as its days would be missing races.
+    """
+    start = time.perf_counter()
+    runs = shard_dates(dates, shards or jobs)
+    folder = tempfile.mkdtemp(prefix='geny-backfill-')
+    try:
+        tasks = [
+            ([date.date for date in run], os.path.join(folder, f'shard-{index:04d}.jsonl'),
+             settings or {}, site)
+            for index, run in enumerate(runs)
+        ]
+        # Spawned processes, each used for a single shard, so every crawl gets a fresh reactor
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(min(jobs, len(tasks)), maxtasksperchild=1) as pool:
+            shards = pool.starmap(crawl_shard, tasks, chunksize=1)
+        failed = [
+            f'{run[0]} to {run[-1]} ({reason or "never started"}, {errors} errors)'
+            for (run, _, _, _), (_, reason, errors) in zip(tasks, shards)
+            if reason != 'finished' or errors
+        ]
+        if failed:
+            raise RuntimeError(f'{len(failed)} of {len(tasks)} shards failed, {output} not '
+                               f'written: ' + '; '.join(failed))
+        races = merge([path for path, _, _ in shards], output)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return races, time.perf_counter() - start
+
+
+def scaling(dates, jobs, output, settings=None, site=None):
+    """Backfills the dates with 1, 2, 4 ... jobs processes, printing the throughput of each."""
+    counts = []
+    count = 1
+    while count < jobs:
+        counts.append(count)
+        count *= 2
+    counts.append(jobs)
+
+    print(f'{"Processes":<12}{"Races":>8}{"Seconds":>10}{"Races/sec":>11}{"Speedup":>9}')
+    base = None
+    for count in counts:
+        races, seconds = backfill(dates, count, output, settings, site=site)
+        rate = races / seconds if seconds else 0
+        base = base or rate
+        print(f'{count:<12}{races:>8}{seconds:>10.2f}{rate:>11.1f}'
+              f'{(rate / base if base else 0):>8.2f}x')
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--start', required=True, metavar='DD/MM/YYYY')
+    parser.add_argument('--end', required=True, metavar='DD/MM/YYYY')
+    parser.add_argument('-o', '--output', required=True,
+                        help='.xlsx, .jsonl or .db (see store.py) file, or else a folder for '
+                             'Parquet files')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='processes to crawl with, by default one per core')
+    parser.add_argument('--shards', type=int,
+                        help='runs of days to split the range into, by default one per process')
+    parser.add_argument('--scaling', action='store_true',
+                        help='report the throughput of 1, 2, 4 ... up to --jobs processes')
+    parser.add_argument('--site', metavar='URL',
+                        help='request the pages from here rather than https://www.geny.com, '
+                             'e.g. the stand-in of standin.py')
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='Scrapy setting for every crawl, can be given more than once')
+    args = parser.parse_args(args)
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    for setting in args.set:
+        if '=' not in setting:
+            parser.error(f'settings must be NAME=VALUE, not {setting}')
+    return args
+
+
+def main(args=None):
+    args = parse_args(args)
+    dates = Date.range(args.start, args.end)
+    settings = dict(setting.split('=', 1) for setting in args.set)
+    try:
+        if args.scaling:
+            scaling(dates, args.jobs, args.output, settings, args.site)
+            return 0
+        races, seconds = backfill(dates, args.jobs, args.output, settings, args.shards,
+                                  args.site)
+    except RuntimeError as error:
+        print(error, file=sys.stderr)
+        return 1
+    print(f'{races} races from {len(dates)} days in {seconds:.1f}s '
+          f'with {min(args.jobs, len(dates))} processes, saved to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Times the aggregates of analytics.py over a million made up races, and checks them against plain
+Python loops over the rows, which are also timed on a sample to show what the vectorising saves.
+To Run:  cd to this folder, then use the command "python bench_analytics.py [races] [sample]".
+"""
+
+import math
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from analytics import PLACE_PAYOUTS, Races, payout_stats, roi
+from bench_store import HIPPOS
+from corpus import load_golden
+from normalise import to_frame
+from records import PAYOUTS, RaceResult
+
+
+def made_up_races(count, seed=0):
+    """Races of count made up races from 2010, the favourite winning about a third of them."""
+    rng = np.random.default_rng(seed)
+    partants = rng.integers(6, 19, count).astype(np.int16)
+    # The arrivees are the first 4 of a shuffle of each race's runners
+    draws = rng.random((count, 18))
+    draws[np.arange(18) >= partants[:, None]] = np.inf
+    arrivees = (np.argsort(draws, axis=1)[:, :4] + 1).astype(np.int16)
+    favourite = np.where(rng.random(count) < 0.3, arrivees[:, 0],
+                         rng.integers(1, partants + 1)).astype(np.int16)
+    payouts = rng.lognormal(np.log([5, 2, 2, 2, 40, 80, 15, 15, 15, 200, 900, 4000]), 0.8,
+                            (count, len(PAYOUTS))).round(2) + 1
+    payouts[rng.random(payouts.shape) < 0.1] = np.nan
+    payouts[partants < 8, PAYOUTS.index('place_2')] = np.nan  # Only 2 placed
+    return Races(
+        np.datetime64('2010-01-01') + np.sort(rng.integers(0, 3650, count)),
+        rng.integers(0, len(HIPPOS), count).astype(np.int32), np.array(HIPPOS, object),
+        rng.integers(0, 3, count).astype(np.int32), np.array(['T', 'P', 'O'], object),
+        partants, arrivees, payouts, favourite=favourite
+    )
+
+
+def rows_of(races, count):
+    """The first count races as dicts, as a row by row script would have them."""
+    return [
+        {'hippo': races.hippos[races.hippo[n]],
+         'discipline': races.disciplines[races.discipline[n]],
+         'partants': int(races.partants[n]),
+         'arrivees': [int(value) for value in races.arrivees[n]],
+         'favourite': int(races.favourite[n]),
+         **{column: float(value) for column, value in zip(PAYOUTS, races.payouts[n])}}
+        for n in range(count)
+    ]
+
+
+def loop_payout_stats(rows, bet):
+    """payout_stats by hippo and discipline, the median for q50, one row at a time."""
+    groups = defaultdict(lambda: [0, []])
+    for row in rows:
+        group = groups[row['hippo'], row['discipline']]
+        group[0] += 1
+        if not math.isnan(row[bet]):
+            group[1].append(row[bet])
+    return {key: (races, len(paid), statistics.fmean(paid) if paid else math.nan,
+                  statistics.median(paid) if paid else math.nan)
+            for key, (races, paid) in groups.items()}
+
+
+def loop_roi(rows, bet):
+    """roi on the favourite by hippo, one row at a time."""
+    groups = defaultdict(lambda: [0, 0, 0.0])
+    for row in rows:
+        horse = row['favourite']
+        if not horse or row['arrivees'][0] == 0 or horse > row['partants']:
+            continue
+        places = PLACE_PAYOUTS if bet == 'place' else ['gagnant']
+        returned = 0.0
+        for place, column in enumerate(places):
+            if row['arrivees'][place] == horse:
+                # Only 2 are paid place in a race of fewer than 8, so 3rd returns nothing
+                returned = 0.0 if place == 2 and 0 < row['partants'] < 8 else row[column]
+        if math.isnan(returned):
+            continue
+        group = groups[row['hippo']]
+        group[0] += 1
+        group[1] += returned > 0
+        group[2] += returned
+    return {key: tuple(group) for key, group in groups.items()}
+
+
+def sample_of(races, count):
+    return Races(races.day[:count], races.hippo[:count], races.hippos,
+                 races.discipline[:count], races.disciplines, races.partants[:count],
+                 races.arrivees[:count], races.payouts[:count], favourite=races.favourite[:count])
+
+
+def check(races, rows):
+    """Checks the vectorised aggregates of the races give what the loops over rows give."""
+    for bet in ('gagnant', 'super4'):
+        table = payout_stats(races, bet, qs=(0.5,))
+        vectorised = {
+            (hippo, discipline): (races_, paid, mean, median)
+            for hippo, discipline, races_, paid, mean, median in zip(*table.values())
+        }
+        expected = loop_payout_stats(rows, bet)
+        if vectorised.keys() != expected.keys() or not all(
+            a == b and c == d and math.isclose(e, g) and math.isclose(f, h)
+            for (a, c, e, f), (b, d, g, h) in
+            ((vectorised[key], expected[key]) for key in expected)
+        ):
+            raise AssertionError(f'payout_stats of {bet} differs from the loop')
+    for bet in ('gagnant', 'place'):
+        table = roi(races, bet)
+        vectorised = dict(zip(table['hippo'],
+                              zip(table['bets'], table['hits'], table['returned'])))
+        expected = loop_roi(rows, bet)
+        if vectorised.keys() != expected.keys() or not all(
+            a == b and c == d and math.isclose(e, f)
+            for (a, c, e), (b, d, f) in ((vectorised[key], expected[key]) for key in expected)
+        ):
+            raise AssertionError(f'roi of {bet} differs from the loop')
+
+
+def check_golden():
+    """
+    Checks roi on the rows of fixtures/golden.json, worked out by hand. Backing number 2 place,
+    the trotting races are the 2nd row (6 runners, 2 came 3rd, unpaid so lost) and the 3rd (2
+    came 2nd, paying 2,30): 2 bets returning 2.30.
+    """
+    results = [RaceResult(f'c{n}', day, *row)
+               for day, rows in load_golden()['rows'].items() for n, row in enumerate(rows)]
+    table = roi(Races.from_frame(to_frame(results)), 'place', pick=2, by=('discipline',))
+    trot = list(table['discipline']).index('T')
+    got = table['bets'][trot], table['hits'][trot], round(table['returned'][trot], 2)
+    if got != (2, 1, 2.3):
+        raise AssertionError(f'Place on 2 in the trotting races: {got} != (2, 1, 2.3)')
+
+
+def best_of(repeats, function, *args, **kwargs):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(count=1_000_000, sample=100_000, repeats=3):
+    start = time.perf_counter()
+    races = made_up_races(count)
+    print(f'{len(races)} races made up in {time.perf_counter() - start:.1f}s')
+    check_golden()
+    rows = rows_of(races, sample)
+    check(sample_of(races, sample), rows)
+    print(f'Same aggregates as loops over the rows of {sample} races\n')
+
+    jobs = {
+        'gagnant stats by hippo, discipline': (payout_stats, 'gagnant', ('hippo', 'discipline'),
+                                               loop_payout_stats, 'gagnant'),
+        'super4 stats by year': (payout_stats, 'super4', ('year',), None, None),
+        'gagnant ROI of favourite by hippo': (roi, 'gagnant', ('hippo',), loop_roi, 'gagnant'),
+        'place ROI of favourite by hippo': (roi, 'place', ('hippo',), loop_roi, 'place'),
+    }
+    print(f'{"Aggregate":<38}{"Vectorised ms":>15}{"Loop ms":>10}{"Speedup":>9}')
+    for name, (function, bet, by, loop, loop_bet) in jobs.items():
+        seconds = best_of(repeats, function, races, bet, by=by)
+        if loop is None:
+            print(f'{name:<38}{seconds * 1000:>15.1f}')
+            continue
+        # The loop only runs over the sample, scaled up to all the races
+        looped = best_of(1, loop, rows, loop_bet) * count / sample
+        print(f'{name:<38}{seconds * 1000:>15.1f}{looped * 1000:>10.0f}'
+              f'{looped / seconds:>8.0f}x')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
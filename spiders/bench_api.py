@@ -0,0 +1,112 @@
+"""
+Measures the latency of api.scrape_race against a local stand-in for www.geny.com serving the
+saved pages in fixtures/, with a shared keep-alive GenyClient and with a new client (so a new
+connection) for every call.
+To Run:  cd to this folder, then use the command "python bench_api.py [calls] [latency ms]",
+         the latency being added by the stand-in to every response, to act like a real network.
+"""
+
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from api import GenyClient
+from corpus import FIXTURES, load_golden
+
+
+class FixturesHandler(BaseHTTPRequestHandler):
+    """Serves fixtures/<path with '/' as '__'>.html, see corpus.py."""
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+    disable_nagle_algorithm = True  # Else a kept-alive connection waits on delayed ACKs
+    latency = 0
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        FixturesHandler.connections += 1
+
+    def do_GET(self):
+        name = self.path.lstrip('/').replace('?date=', '__').replace('/', '__')
+        path = os.path.join(FIXTURES, f'{name}.html')
+        time.sleep(self.latency)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(latency=0):
+    """Starts the stand-in on a free port in a thread. Returns the server."""
+    FixturesHandler.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixturesHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(latencies, percent):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * percent / 100))]
+
+
+def measure(calls, scrape):
+    """Returns the latencies of calls calls of scrape(), in seconds."""
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        scrape()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main(calls=200, latency_ms=0):
+    server = serve(latency_ms / 1000)
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    url = ('https://www.geny.com/rapports-pmu/'
+           '2018-07-30-clairefontaine-deauville-pmu-prix-de-la-cote-de-nacre_c991181')
+
+    shared = GenyClient(base_url)
+    expected = load_golden()['rows']['2018-07-30'][0]
+    if shared.scrape_race(url).as_row() != expected:
+        raise AssertionError('scrape_race differs from fixtures/golden.json')
+    if [result.race_id for result in shared.scrape_reunion('2018-07-30', 'R2')] != \
+            ['sources_c991250', 'celestins_c991252']:
+        raise AssertionError('scrape_reunion did not find the run races of R2')
+
+    def new_client(race, day=None):
+        client = GenyClient(base_url)
+        try:
+            return client.scrape_race(race, day)
+        finally:
+            client.close()
+
+    cases = {
+        'shared client, by URL': lambda: shared.scrape_race(url),
+        'shared client, by id': lambda: shared.scrape_race('c991181', '2018-07-30'),
+        'new client, by URL': lambda: new_client(url),
+        'new client, by id': lambda: new_client('c991181', '2018-07-30')
+    }
+    print(f'{calls} calls, {latency_ms} ms added to each response\n')
+    print(f'{"":<24}{"p50 ms":>9}{"p90 ms":>9}{"p99 ms":>9}{"connections":>13}')
+    for name, scrape in cases.items():
+        FixturesHandler.connections = 0
+        latencies = measure(calls, scrape)
+        print(f'{name:<24}' + ''.join(
+            f'{percentile(latencies, percent) * 1000:>9.2f}' for percent in (50, 90, 99)
+        ) + f'{FixturesHandler.connections:>13}')
+    shared.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,157 @@
+"""
+End to end load benchmark: crawls days of made up races from the stand-in of standin.py (run in
+a process of its own, with latency and errors) with GenyScrapeSpider, once for each
+CONCURRENT_REQUESTS given, every crawl in a fresh process. Reports the pages/sec, the time to
+the first combined row, the peak RSS, how the CPU time splits between the callbacks and the
+rest (Scrapy, Twisted and the network), and the KB sent per page and connections opened by the
+stand-in, so releases can be compared on crawl throughput.
+To Run:  cd to this folder, then use the command "python bench_crawl.py", e.g.
+         python bench_crawl.py --days 3 --reunions 8 --races 8 --latency 50 --errors 0.01 \
+             --concurrency 8 16 32 --parse-workers 0
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import date, timedelta
+
+from geny_scrape import GenyScrapeSpider
+
+
+class TimedSpider(GenyScrapeSpider):
+    """Notes when the first combined row completes, and how many rows there are."""
+    name = 'geny-scrape'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.first_row = None
+        self.rows = 0
+
+    def race_completed(self, result):
+        if self.first_row is None:
+            self.first_row = time.perf_counter()
+        self.rows += 1
+        super().race_completed(result)
+
+
+def crawl(site, days, settings, spider_kwargs):
+    """Crawls the days from site in this process. Returns the figures of the crawl."""
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.settings import Settings
+
+    # At the priority of "scrapy -s", so the HTTP cache of the spider's custom_settings is off
+    process = CrawlerProcess(Settings(dict(settings, LOG_LEVEL='ERROR', HTTPCACHE_ENABLED=False),
+                                      priority='cmdline'))
+    crawler = process.create_crawler(TimedSpider)
+    process.crawl(crawler, dates=','.join(days), output_format='none', headless=True, site=site,
+                  **spider_kwargs)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    process.start()
+    seconds = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF)
+
+    stats = crawler.stats.get_stats()
+    spider = crawler.spider
+    rss = after.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)  # Bytes
+    return {
+        'pages': stats.get('response_received_count', 0),
+        'rows': spider.rows,
+        'retries': stats.get('retry/count', 0),
+        'seconds': seconds,
+        'first_row': spider.first_row - start if spider.first_row is not None else None,
+        'rss': rss,
+        'user': after.ru_utime - usage.ru_utime,
+        'system': after.ru_stime - usage.ru_stime,
+        'callbacks': sum(value for key, value in stats.items()
+                         if key.startswith('geny/callback/') and key.endswith('/cpu_seconds'))
+    }
+
+
+def standin_stats(site):
+    with urllib.request.urlopen(f'{site}/standin-stats') as response:
+        return json.load(response)
+
+
+def start_standin(args):
+    """Runs standin.py in a process of its own. Returns the process and its URL."""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'standin.py'),
+         '--port', '0', '--reunions', str(args.reunions), '--races', str(args.races),
+         '--latency', str(args.latency), '--jitter', str(args.jitter),
+         '--errors', str(args.errors)] + ([] if args.compression else ['--no-compression']),
+        stdout=subprocess.PIPE, text=True
+    )
+    line = process.stdout.readline()
+    if not line.startswith('Serving on '):
+        process.kill()
+        raise RuntimeError('standin.py did not start')
+    return process, line.split()[-1]
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--days', type=int, default=3)
+    parser.add_argument('--reunions', type=int, default=8, help='reunions a day')
+    parser.add_argument('--races', type=int, default=8, help='races a reunion')
+    parser.add_argument('--latency', type=float, default=50, help='ms added to every response')
+    parser.add_argument('--jitter', type=float, default=10, help='ms the latency varies by')
+    parser.add_argument('--errors', type=float, default=0.01,
+                        help='fraction of responses that are 503 errors')
+    parser.add_argument('--no-compression', dest='compression', action='store_false',
+                        help='the stand-in never gzips the pages')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 16, 32],
+                        help='CONCURRENT_REQUESTS to crawl with, one crawl each')
+    parser.add_argument('--parse-workers', type=int, default=0,
+                        help='parse in a pool of this many threads, see parsing.py')
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='Scrapy setting for every crawl, can be given more than once')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    first = date(2018, 7, 30)
+    days = [(first + timedelta(days=n)).strftime('%d/%m/%Y') for n in range(args.days)]
+    races = args.days * args.reunions * args.races
+    spider_kwargs = {'parse_workers': args.parse_workers} if args.parse_workers else {}
+    standin, site = start_standin(args)
+    print(f'{args.days} days of {args.reunions} reunions of {args.races} races ({races} races, '
+          f'{args.days + 2 * races} pages) from {site}, {args.latency:g}±{args.jitter:g} ms '
+          f'latency, {args.errors:.1%} errors\n')
+    print(f'{"Concurrency":<13}{"Pages/sec":>10}{"First row s":>13}{"Peak RSS MB":>13}'
+          f'{"CPU s":>8}{"callbacks":>11}{"rest":>8}{"Retries":>9}{"KB/page":>9}'
+          f'{"Connections":>13}')
+    context = multiprocessing.get_context('spawn')
+    try:
+        for concurrency in args.concurrency:
+            settings = {'CONCURRENT_REQUESTS': concurrency,
+                        'CONCURRENT_REQUESTS_PER_DOMAIN': concurrency}
+            settings.update(setting.split('=', 1) for setting in args.set)
+            before = standin_stats(site)
+            with context.Pool(1, maxtasksperchild=1) as pool:
+                result = pool.apply(crawl, (site, days, settings, spider_kwargs))
+            after = standin_stats(site)
+            connections = after['connections'] - before['connections']
+            sent = (after['bytes'] - before['bytes']) / max(result['pages'], 1) / 1024
+            if result['rows'] != races:
+                print(f'Only {result["rows"]} of {races} races were completed', file=sys.stderr)
+            cpu = result['user'] + result['system']
+            first_row = f'{result["first_row"]:.2f}' if result['first_row'] is not None else '-'
+            print(f'{concurrency:<13}{result["pages"] / result["seconds"]:>10.1f}{first_row:>13}'
+                  f'{result["rss"] / 2 ** 20:>13.0f}{cpu:>8.2f}{result["callbacks"]:>11.2f}'
+                  f'{cpu - result["callbacks"]:>8.2f}{result["retries"]:>9}{sent:>9.1f}'
+                  f'{connections:>13}')
+    finally:
+        standin.terminate()
+        standin.wait()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
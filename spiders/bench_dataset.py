@@ -0,0 +1,72 @@
+"""
+Times a daily run adding to a dataset (see writers.DatasetWriter) with more and more history, to
+check its work depends on the days scraped and not on the size of the dataset. The run adds a new
+day of races, changes two races of an old day and scrapes yesterday again unchanged, which must
+leave yesterday's file untouched.
+To Run:  cd to this folder, then use the command "python bench_dataset.py [races per day]".
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from datetime import date, timedelta
+from itertools import groupby
+
+from bench_store import made_up_races
+from writers import DatasetWriter, read_json_lines
+
+
+def daily_run(folder, history, run):
+    """
+    Runs the day run + 1 days after history's last day, run being how many were run before.
+    Returns the seconds taken by close.
+    """
+    days = [list(races) for _, races in groupby(history, key=lambda result: result.day)]
+    yesterday, old = days[-1], days[len(days) // 2]
+    new_day = (date.fromisoformat(yesterday[0].day) + timedelta(days=run + 1)).isoformat()
+    gagnant = f'{run + 90},90'
+    before = os.stat(os.path.join(folder, f'{yesterday[0].day}.jsonl')).st_mtime_ns
+
+    writer = DatasetWriter(folder)
+    for result in yesterday:
+        writer.write(result)
+    for result in old[:2]:
+        writer.write(replace(result, gagnant=gagnant))
+    for result in yesterday:
+        writer.write(replace(result, race_id=f'{new_day}{result.race_id[10:]}', day=new_day))
+    start = time.perf_counter()
+    writer.close()
+    seconds = time.perf_counter() - start
+
+    if writer.updated != {old[0].day: 2, new_day: len(yesterday)}:
+        raise AssertionError(f'Wrong days updated: {writer.updated}')
+    if os.stat(os.path.join(folder, f'{yesterday[0].day}.jsonl')).st_mtime_ns != before:
+        raise AssertionError('An unchanged day was rewritten')
+    merged = list(read_json_lines(os.path.join(folder, f'{old[0].day}.jsonl')))
+    if len(merged) != len(old) or [result.gagnant for result in merged[:2]] != [gagnant] * 2:
+        raise AssertionError('Changed races were not merged into their day')
+    return seconds
+
+
+def main(per_day=40):
+    print(f'{"History":<12}{"Races":>10}{"Days":>7}{"Run ms":>9}')
+    for years in (1, 5, 10):
+        folder = tempfile.mkdtemp()
+        try:
+            history = list(made_up_races(years, per_day))
+            writer = DatasetWriter(folder)
+            for result in history:
+                writer.write(result)
+            writer.close()
+            seconds = min(daily_run(folder, history, run) for run in range(3))
+            print(f'{f"{years} years":<12}{len(history):>10}{len(os.listdir(folder)):>7}'
+                  f'{seconds * 1000:>9.1f}')
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,160 @@
+"""
+Runs the saved pages in fixtures/ through parse_races, parse_pronostics and parse_rapports with no
+network. Checks the requests and combined rows against fixtures/golden.json, and that they are
+the same with each selector backend (see xpaths.py). Then reports the pages/sec and latency
+percentiles of each callback with each backend, and how each schedule (see parse_races) orders
+the race pages.
+To Run:  cd to this folder, then use the command "python bench_parsers.py [repeats]".
+         Use "python bench_parsers.py --update-golden" after a change that is meant to alter the
+         scraped rows, and check the diff of golden.json.
+"""
+
+import argparse
+import time
+from collections import defaultdict
+
+import scrapy
+
+from corpus import load_golden, load_pages, save_golden
+from geny_scrape import GenyScrapeSpider
+from pipelines import RaceJoinPipeline
+from xpaths import SELECTORS
+
+
+def new_spider(pages, schedule='races', selectors='parsel'):
+    days = sorted({page.day for page in pages})
+    return GenyScrapeSpider(dates=','.join(f'{day[8:]}/{day[5:7]}/{day[:4]}' for day in days),
+                            schedule=schedule, selectors=selectors)
+
+
+def run_page(spider, pipeline, page, requests=None):
+    """
+    Feeds a saved page to its callback, passing the items it yields through the pipeline.
+    Returns the requests it made, also appending the Request objects to requests if given.
+    """
+    made = []
+    for output in getattr(spider, page.callback)(page.response(), day=page.day) or []:
+        if isinstance(output, scrapy.Request):
+            made.append([output.callback.__name__, output.url])
+            if requests is not None:
+                requests.append(output)
+        else:
+            pipeline.process_item(output)
+    return made
+
+
+def crawl_order(pages, schedule):
+    """
+    Feeds the race pages to the spider in the order Scrapy's default scheduler would fetch the
+    listing's requests (highest priority first, last in first out within a priority), one at a
+    time. Returns the pages fetched before the first row completed and the most halves that
+    were waiting in the join at once.
+    """
+    spider = new_spider(pages, schedule)
+    pipeline = RaceJoinPipeline(spider)
+    by_url = {page.url: page for page in pages}
+    requests = []
+    for page in pages:
+        if page.callback == 'parse_races':
+            run_page(spider, pipeline, page, requests)
+    queue = sorted(reversed(requests), key=lambda request: -request.priority)
+    first_row = None
+    peak = 0
+    for fetched, request in enumerate(queue, start=1):
+        if request.url in by_url:
+            run_page(spider, pipeline, by_url[request.url])
+        peak = max(peak, len(pipeline.join))
+        if first_row is None and spider.results:
+            first_row = fetched
+    return first_row, peak
+
+
+def scrape(pages, schedule='races', selectors='parsel'):
+    """Scrapes the saved pages. Returns the requests made, rows and unmatched races."""
+    spider = new_spider(pages, schedule, selectors)
+    pipeline = RaceJoinPipeline(spider)
+    requests = []
+    for page in pages:
+        requests += run_page(spider, pipeline, page)
+    return {
+        'requests': requests,
+        'rows': {day: spider.order_rows(results)
+                 for day, results in sorted(spider.results.items())},
+        'unmatched': pipeline.join.unmatched()
+    }
+
+
+def check_golden(scraped):
+    golden = load_golden()
+    for key in golden:
+        if scraped[key] != golden[key]:
+            raise AssertionError(f'{key} differ from fixtures/golden.json:\n'
+                                 f'{scraped[key]}\n!=\n{golden[key]}')
+
+
+def percentile(latencies, percent):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * percent / 100))]
+
+
+def benchmark(pages, repeats, selectors='parsel'):
+    """Returns the latencies of each callback, in seconds, and the total time taken."""
+    latencies = defaultdict(list)
+    total = 0
+    for _ in range(repeats):
+        spider = new_spider(pages, selectors=selectors)
+        pipeline = RaceJoinPipeline(spider)
+        for page in pages:
+            start = time.perf_counter()
+            run_page(spider, pipeline, page)
+            latency = time.perf_counter() - start
+            latencies[page.callback].append(latency)
+            total += latency
+    return latencies, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('repeats', type=int, nargs='?', default=200)
+    parser.add_argument('--update-golden', action='store_true',
+                        help='write the scraped rows to fixtures/golden.json')
+    args = parser.parse_args()
+
+    pages = load_pages()
+    scraped = scrape(pages)
+    if args.update_golden:
+        save_golden(scraped)
+        print('fixtures/golden.json updated')
+    else:
+        check_golden(scraped)
+        print(f'{len(pages)} pages, output matches fixtures/golden.json')
+
+    # The schedules only change the order pages are requested in, never what is scraped
+    halves = scrape(pages, 'halves')
+    if (halves['rows'], halves['unmatched']) != (scraped['rows'], scraped['unmatched']) or \
+            sorted(halves['requests']) != sorted(scraped['requests']):
+        raise AssertionError('schedule=halves scrapes differently to schedule=races')
+    # Nor do the selector backends
+    for selectors in SELECTORS[1:]:
+        if scrape(pages, selectors=selectors) != scraped:
+            raise AssertionError(f'selectors={selectors} scrapes differently to '
+                                 f'selectors={SELECTORS[0]}')
+
+    for selectors in SELECTORS:
+        latencies, total = benchmark(pages, args.repeats, selectors)
+        print(f'\n{len(pages) * args.repeats / total:.0f} pages/sec over {args.repeats} repeats '
+              f'with selectors={selectors}\n')
+        print(f'{"Callback":<18}{"p50 ms":>9}{"p90 ms":>9}{"p99 ms":>9}{"max ms":>9}')
+        for callback, times in latencies.items():
+            print(f'{callback:<18}' + ''.join(
+                f'{percentile(times, percent) * 1000:>9.3f}' for percent in (50, 90, 99, 100)
+            ))
+
+    print(f'\n{"Schedule":<18}{"pages to first row":>20}{"peak halves in join":>21}')
+    for schedule in GenyScrapeSpider.SCHEDULES:
+        first_row, peak = crawl_order(pages, schedule)
+        print(f'{schedule:<18}{first_row:>20}{peak:>21}')
+
+
+if __name__ == '__main__':
+    main()
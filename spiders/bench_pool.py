@@ -0,0 +1,133 @@
+"""
+Benchmarks parsing the saved pages in fixtures/ on the event loop, as the spider does by default,
+against parsing them in a ParsePool (see parsing.py) of 1, 2, 4 ... threads or processes. First
+checks that the spider's callbacks give the same requests and rows with each kind of pool.
+For each pool size, reports the pages/sec and the longest the event loop (the reactor, in a
+crawl) was held up, during which no download could have been started or finished.
+To Run:  cd to this folder, then use the command "python bench_pool.py [repeats] [workers]".
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import scrapy
+
+from bench_parsers import check_golden, new_spider, scrape
+from corpus import load_pages
+from parsing import POOLS, ParsePool, extract
+from pipelines import RaceJoinPipeline
+
+KINDS = {'parse_races': 'races', 'parse_pronostics': 'pronostics', 'parse_rapports': 'rapports'}
+
+
+async def scrape_in_pool(pages, kind):
+    """bench_parsers.scrape, but with the spider's callbacks awaiting a pool of 2 workers."""
+    spider = new_spider(pages)
+    spider.parse_pool = ParsePool(kind, 2)
+    pipeline = RaceJoinPipeline(spider)
+    requests = []
+    try:
+        for page in pages:
+            async for output in getattr(spider, page.callback)(page.response(), day=page.day):
+                if isinstance(output, scrapy.Request):
+                    requests.append([output.callback.__name__, output.url])
+                else:
+                    pipeline.process_item(output)
+    finally:
+        spider.parse_pool.close()
+    return {
+        'requests': requests,
+        'rows': {day: spider.order_rows(results)
+                 for day, results in sorted(spider.results.items())},
+        'unmatched': pipeline.join.unmatched()
+    }
+
+
+async def parse_all(pages, repeats, pool=None):
+    """
+    Parses every page repeats times (with runners), on the loop one at a time if pool is None,
+    else all handed to the pool at once as a busy crawl would. Returns the seconds taken and
+    the longest the loop was held up.
+    """
+    tick = 0.001
+    stall = 0
+    parsing = True
+
+    async def heartbeat():
+        nonlocal stall
+        last = time.perf_counter()
+        while parsing:
+            await asyncio.sleep(tick)
+            now = time.perf_counter()
+            stall = max(stall, now - last - tick)
+            last = now
+
+    beat = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    work = [(KINDS[page.callback], page) for _ in range(repeats) for page in pages]
+    if pool is None:
+        for kind, page in work:
+            extract(kind, page.response(), page.day, runners=True)
+            await asyncio.sleep(0)  # Back to the loop between callbacks, as the reactor does
+    else:
+        await asyncio.gather(*(
+            pool.extract(kind, page.response(), page.day, runners=True) for kind, page in work
+        ))
+    seconds = time.perf_counter() - start
+    parsing = False
+    await beat
+    return seconds, stall
+
+
+def sizes(workers):
+    counts = []
+    count = 1
+    while count < workers:
+        counts.append(count)
+        count *= 2
+    return counts + [workers]
+
+
+async def benchmark(pages, repeats, workers):
+    total = len(pages) * repeats
+    print(f'{"Parsing on":<22}{"Pages/sec":>11}{"Speedup":>9}{"Loop stall ms":>15}')
+    seconds, stall = await parse_all(pages, repeats)
+    base = total / seconds
+    print(f'{"event loop":<22}{base:>11.0f}{1:>8.2f}x{stall * 1000:>15.1f}')
+    for kind in POOLS:
+        for count in sizes(workers):
+            pool = ParsePool(kind, count)
+            try:
+                await parse_all(pages, 1, pool)  # Starts the workers before timing
+                seconds, stall = await parse_all(pages, repeats, pool)
+            finally:
+                pool.close()
+            rate = total / seconds
+            label = f'{kind} pool of {count}'
+            print(f'{label:<22}{rate:>11.0f}{rate / base:>8.2f}x{stall * 1000:>15.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('repeats', type=int, nargs='?', default=50)
+    parser.add_argument('workers', type=int, nargs='?', default=os.cpu_count() or 1,
+                        help='largest pool to try, by default one worker per core')
+    args = parser.parse_args()
+
+    pages = load_pages()
+    inline = scrape(pages)
+    check_golden(inline)
+    for kind in POOLS:
+        if asyncio.run(scrape_in_pool(pages, kind)) != inline:
+            raise AssertionError(f'Parsing in a {kind} pool scrapes differently to inline')
+    print(f'{len(pages)} pages, same requests and rows inline and in thread and process pools '
+          f'({os.cpu_count()} cores)\n')
+
+    asyncio.run(benchmark(pages, args.repeats, args.workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Benchmarks the single pass rapports extractor against the XPath queries parse_rapports used to
+run, one per payout. Both must give the same payouts on every saved rapports page.
+To Run:  cd to this folder, then use the command "python bench_rapports.py [repeats]".
+"""
+
+import re
+import sys
+import time
+
+from corpus import load_pages
+from rapports import extract_payouts
+
+
+def load_rapports():
+    """Returns every saved rapports page as a response, with the number of runners."""
+    responses = []
+    for page in load_pages('rapports-pmu'):
+        response = page.response()
+        partpants = response.xpath('//table[@id="arrivees"]//tr/td[2]/text()').extract()
+        partpants = max(int(p.strip()) for p in partpants if p.strip().isdigit())
+        responses.append((response, partpants))
+    return responses
+
+
+def legacy_extract_payouts(response, partpants):
+    """The payout XPaths of parse_rapports before the single pass extractor."""
+    GAGNANT = ''
+    GAGNANT_PLACE = ''
+    PLACE1 = ''
+    PLACE2 = ''
+    CG = ''
+    CO = ''
+    CP1 = ''
+    CP2 = ''
+    CP3 = ''
+    Désordre = ''
+    Ordre = ''
+    SUPER4 = ''
+    ecurie = ''
+
+    # Index 1
+    GAGNANT = response.xpath(
+        '//table[@id="lesSolos"]//tr/td[*//i[text() = "PMU"]]//'
+        'tr[*//div[normalize-space() = "Gagnant"]]/td[2]//b/text()'
+    ).extract_first()
+    # Index 2
+    GAGNANT_PLACE = response.xpath(
+        '//table[@id="lesSolos"]//tr/td[*//i[text() = "PMU"]]//'
+        'tr[*//div[normalize-space() = "Placé"]][1]/td[2]//text()'
+    ).extract_first()
+    # Index 3
+    PLACE1 = response.xpath(
+        '//table[@id="lesSolos"]//tr/td[*//i[text() = "PMU"]]//'
+        'tr[*//div[normalize-space() = "Placé"]][2]/td[2]//text()'
+    ).extract_first()
+    # Index 4
+    PLACE2 = response.xpath(
+        '//table[@id="lesSolos"]//tr/td[*//i[text() = "PMU"]]//'
+        'tr[*//div[normalize-space() = "Placé"]][3]/td[2]//text()'
+    ).extract_first()
+
+    ecurie = response.xpath(
+        '//table[@id="lesSolos"]//tr/'
+        'td[*//i[text() = "PMU"]]/div/span/text()'
+    ).extract_first()
+
+    if ecurie is not None:
+        ecurie = re.sub('\xa0', '', ecurie)  # Cleans encoding
+        ecurie = re.sub('Ecurie : ', '', ecurie)  # Makes the "ecuire" numbers easier to read
+
+    if partpants > 7:
+        # Index 1
+        CG = response.xpath(
+            '//table[@id="lesDuos"]//tr/td[*//i[text() = "PMU"]]//'
+            'tr[*//div[normalize-space() = "Gagnant"]]/td[2]//b/text()'
+        ).extract_first()
+        # Index 2
+        CP1 = response.xpath(
+            '//table[@id="lesDuos"]//tr/td[*//i[text() = "PMU"]]//'
+            'tr[*//div[normalize-space() = "Placé"]][1]/td[2]//text()'
+        ).extract_first()
+        # Index 3
+        CP2 = response.xpath(
+            '//table[@id="lesDuos"]//tr/td[*//i[text() = "PMU"]]//'
+            'tr[*//div[normalize-space() = "Placé"]][2]/td[2]//text()'
+        ).extract_first()
+        # Index 4
+        CP3 = response.xpath(
+            '//table[@id="lesDuos"]//tr/td[*//i[text() = "PMU"]]//'
+            'tr[*//div[normalize-space() = "Placé"]][3]/td[2]//text()'
+        ).extract_first()
+
+    Désordre = response.xpath(
+        '//table[@id="lesTrios"]//tr/td[*//i[text() = "PMU"]]/table[1]//tr[2]/td[2]/b/text()'
+    ).extract_first()
+    # Index 5
+    CO = response.xpath(
+        '//table[@id="lesDuos"]//tr/td[*//i[text() = "PMU"]]//'
+        'tr[*//div[normalize-space() = "Ordre"]]/td[2]//text()'
+    ).extract_first()
+
+    if partpants < 8:
+        Ordre = response.xpath(
+            '//table[@id="lesTrios"]//tr/td[*//i[text() = "PMU"]]//'
+            'tr[*//div[normalize-space() = "Ordre"]]/td[2]//text()'
+        ).extract_first()
+        SUPER4 = response.xpath(
+            '//table[@id="lesQuartos"]//tr/td[*//i[text() = "PMU"]]//'
+            'tr[*[normalize-space() = "Super 4"]]/td[2]//text()'
+        ).extract_first()
+
+    return [
+        GAGNANT,
+        GAGNANT_PLACE,
+        PLACE1,
+        PLACE2,
+        CG,
+        CO,
+        CP1,
+        CP2,
+        CP3,
+        Désordre,
+        Ordre,
+        SUPER4,
+        ecurie
+    ]
+
+
+def time_per_page(extract, pages, repeats):
+    """Returns the mean seconds taken to extract the payouts of a page, not counting parsing."""
+    total = 0
+    for _ in range(repeats):
+        for response, partpants in pages:
+            # A freshly parsed page each time, so nothing is shared between runs
+            response = response.replace(body=response.body)
+            response.selector
+            start = time.perf_counter()
+            extract(response, partpants)
+            total += time.perf_counter() - start
+    return total / (repeats * len(pages))
+
+
+def main(repeats=200):
+    pages = load_rapports()
+    for response, partpants in pages:
+        legacy = legacy_extract_payouts(response, partpants)
+        single_pass = extract_payouts(response, partpants)
+        if legacy != single_pass:
+            raise AssertionError(f'{response.url}\n{legacy}\n!=\n{single_pass}')
+    print(f'{len(pages)} rapports pages, identical payouts from both extractors')
+
+    legacy = time_per_page(legacy_extract_payouts, pages, repeats)
+    single_pass = time_per_page(extract_payouts, pages, repeats)
+    print(f'XPath per payout: {legacy * 1000:.3f} ms/page')
+    print(f'Single pass:      {single_pass * 1000:.3f} ms/page')
+    print(f'Speedup:          {legacy / single_pass:.2f}x')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,85 @@
+"""
+Compares the memory held by 100,000 races (by default) as the old positional lists against the
+slotted RaceStats/RacePayouts/RaceResult records of records.py, measured with tracemalloc. Every
+text value is a string of its own, as the callbacks parse each one out of its page. RaceStats
+interns the values the races of a day share, so the lists are also measured with the same values
+interned: records against interned lists is what slots save, lists against interned lists what
+interning saves.
+To Run:  cd to this folder, then use the command "python bench_records.py [races]".
+"""
+
+import sys
+import tracemalloc
+
+from records import RacePayouts, RaceResult, RaceStats, intern
+
+
+def parsed(text):
+    """A copy of text, as parsing a page gives."""
+    return text.encode().decode()
+
+
+def halves(n):
+    """The values of both halves of the nth race, as the callbacks scrape them."""
+    stats = [f'c{991181 + n}', '30/07/2018', '13h50', 'R1', 'Clairefontaine', 'P', n % 9 + 1, 14]
+    payouts = [f'c{991181 + n}', 8, 12, 3, 14, 6, '2,90', '1,60', '2,10', '7,70', '18,90',
+               '5,40', '11,30', '9,00', 263, '1 254,20', '6 820,10', '']
+    return ([parsed(value) if type(value) is str else value for value in stats],
+            [parsed(value) if type(value) is str else value for value in payouts])
+
+
+def interned_halves(n):
+    """halves, with the date, heure, reunion and hippo interned as RaceStats does."""
+    stats, payouts = halves(n)
+    return stats[:1] + [intern(value) for value in stats[1:5]] + stats[5:], payouts
+
+
+def list_halves(races, make=halves):
+    """Halves waiting in the join, as [race_id] + values lists like before records.py."""
+    return [make(n) for n in range(races)]
+
+
+def record_halves(races):
+    """Halves waiting in the join, as RaceStats and RacePayouts."""
+    day = '2018-07-30'
+    return [
+        (RaceStats(stats[0], day, *stats[1:]), RacePayouts(payouts[0], day, *payouts[1:]))
+        for stats, payouts in map(halves, range(races))
+    ]
+
+
+def list_results(races, make=halves):
+    """Completed races held for the .xls workbook, as combined rows like before records.py."""
+    return [stats[1:] + payouts[1:] for stats, payouts in map(make, range(races))]
+
+
+def record_results(races):
+    """Completed races held for the .xls workbook, as RaceResults."""
+    return [RaceResult.from_halves(stats, payouts) for stats, payouts in record_halves(races)]
+
+
+def measure(build, races, *args):
+    """Returns the bytes still allocated after building races rows with build."""
+    tracemalloc.start()
+    rows = build(races, *args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del rows
+    return size
+
+
+def main(races=100000):
+    print(f'{races} races{"lists":>18}{"interned":>12}{"records":>12}'
+          f'{"interning":>12}{"slots":>8}')
+    for name, build_lists, build_records in [('halves in join', list_halves, record_halves),
+                                             ('results', list_results, record_results)]:
+        lists = measure(build_lists, races)
+        interned = measure(build_lists, races, interned_halves)
+        records = measure(build_records, races)
+        # The share of the memory left by each: interning the lists, then records rather than them
+        print(f'{name:<16}{lists / 2 ** 20:>9.1f} MB{interned / 2 ** 20:>9.1f} MB'
+              f'{records / 2 ** 20:>9.1f} MB{interned / lists:>12.0%}{records / interned:>8.0%}')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
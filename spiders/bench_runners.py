@@ -0,0 +1,84 @@
+"""
+Benchmarks the one pass runners extractor of partants.py against running an XPath per runner and
+field over the page. Both must give the same runners on every saved partants page.
+To Run:  cd to this folder, then use the command "python bench_runners.py [repeats]".
+"""
+
+import statistics
+import sys
+import time
+
+from corpus import load_pages
+from partants import HEADINGS, SPACE, as_number, extract_runners
+from records import RunnerRecord
+
+
+def xpath_extract_runners(response, day):
+    """The runners found with an XPath query per runner and field."""
+    race_id = response.url.split('/')[4].split('-')[-1]
+    table = '//table[@id="tableau_partants"]'
+    fields = [
+        HEADINGS.get(SPACE.sub(' ', heading).strip())
+        for heading in response.xpath(f'{table}/thead/tr/th').xpath('string()').extract()
+    ]
+    rows = len(response.xpath(f'{table}/tbody/tr'))
+
+    runners = []
+    for row in range(1, rows + 1):
+        values = {'poids': '', 'distance': ''}
+        for column, field in enumerate(fields, 1):
+            if field is not None:
+                text = response.xpath(
+                    f'string({table}/tbody/tr[{row}]/td[{column}])'
+                ).extract_first()
+                values[field] = SPACE.sub(' ', text).strip()
+        if not values.get('numero', '').isdigit():
+            continue
+        runners.append(RunnerRecord(
+            race_id, day, int(values['numero']), values.get('cheval', ''),
+            values.get('sexe_age', ''), as_number(values['poids']),
+            as_number(values['distance']), values.get('jockey', ''),
+            values.get('entraineur', ''), as_number(values.get('cote', ''))
+        ))
+    return runners
+
+
+def times_per_page(extract, pages, repeats):
+    """Returns the seconds taken to extract the runners of each page, not counting parsing."""
+    times = []
+    for _ in range(repeats):
+        for page, response in pages:
+            # A freshly parsed page each time, so nothing is shared between runs
+            response = response.replace(body=response.body)
+            response.selector
+            start = time.perf_counter()
+            extract(response, page.day)
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def summary(times):
+    cuts = statistics.quantiles(times, n=10)
+    return f'p50 {cuts[4] * 1000:.3f} ms/page, p90 {cuts[8] * 1000:.3f} ms/page'
+
+
+def main(repeats=200):
+    pages = [(page, page.response()) for page in load_pages('partants-pmu')]
+    runners = 0
+    for page, response in pages:
+        one_pass = extract_runners(response, page.day)
+        per_field = xpath_extract_runners(response, page.day)
+        if one_pass != per_field:
+            raise AssertionError(f'{response.url}\n{per_field}\n!=\n{one_pass}')
+        runners += len(one_pass)
+    print(f'{len(pages)} partants pages, {runners} runners, identical from both extractors')
+
+    per_field = times_per_page(xpath_extract_runners, pages, repeats)
+    one_pass = times_per_page(extract_runners, pages, repeats)
+    print(f'XPath per field: {summary(per_field)}')
+    print(f'One pass:        {summary(one_pass)}')
+    print(f'Speedup (p50):   {statistics.median(per_field) / statistics.median(one_pass):.2f}x')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,58 @@
+"""
+Measures how long cli.py takes to start, and fails if it goes over the budget given in cli.py or
+imports the GUI or writer libraries before they are needed.
+To Run:  cd to this folder, then use the command "python bench_startup.py [repeats]".
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BUDGETS = {
+    'python cli.py --help': ([sys.executable, 'cli.py', '--help'], 0.25),
+    'import geny_scrape': ([sys.executable, '-c', 'import geny_scrape'], 1.5)
+}
+LAZY_MODULES = ['tkinter', 'xlwt', 'xlsxwriter', 'pyarrow']
+
+
+def best_time(command, repeats):
+    """Returns the quickest of repeats runs of a command, in seconds."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=HERE, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def lazy_modules_imported():
+    """Returns the modules that should be lazy but are imported by geny_scrape and cli."""
+    check = ('import sys, cli, geny_scrape; '
+             f'print(",".join(m for m in {LAZY_MODULES!r} if m in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', check], cwd=HERE, check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout.strip()
+    return [module for module in output.split(',') if module]
+
+
+def main(repeats=5):
+    failed = False
+    for name, (command, budget) in BUDGETS.items():
+        seconds = best_time(command, repeats)
+        over = seconds > budget
+        failed |= over
+        print(f'{name:<22}{seconds * 1000:>8.0f} ms   (budget {budget * 1000:.0f} ms)'
+              + ('   OVER BUDGET' if over else ''))
+
+    imported = lazy_modules_imported()
+    if imported:
+        failed = True
+        print(f'Imported at startup but should be lazy: {", ".join(imported)}')
+    else:
+        print(f'Not imported at startup: {", ".join(LAZY_MODULES)}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:2]]))
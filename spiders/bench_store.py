@@ -0,0 +1,99 @@
+"""
+Fills a results store (see store.py) with years of made up races, then times typical queries
+against the 100ms budget. Fetching a whole year of races is also timed, but not held to the
+budget, as its time is mostly Python making the 15,000 rows.
+To Run:  cd to this folder, then use the command "python bench_store.py [years] [races per day]".
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from records import RaceResult
+from store import ResultsStore
+
+BUDGET = 0.1
+HIPPOS = ['Vincennes', 'Longchamp', 'Chantilly', 'Deauville', 'Clairefontaine-Deauville',
+          'Auteuil', 'Enghien', 'Cagnes-sur-Mer', 'Vichy', 'Pau', 'Saint-Cloud', 'Lyon-Parilly',
+          'Marseille-Borely', 'Caen', 'Cabourg', 'Laval', 'Nantes', 'Bordeaux', 'Toulouse',
+          'Compiegne']
+
+
+def payout(rng, low, high):
+    """A payout as scraped, e.g. '5,20' or 3, or '' when missing."""
+    if rng.random() < 0.1:
+        return ''
+    value = round(rng.uniform(low, high), 2)
+    return int(value) if value == int(value) else f'{value:.2f}'.replace('.', ',')
+
+
+def made_up_races(years, per_day, seed=0):
+    """Yields races_per_day RaceResults for every day of years years, from 2010."""
+    rng = random.Random(seed)
+    day = date(2010, 1, 1)
+    for _ in range(years * 365):
+        iso = day.isoformat()
+        for number in range(per_day):
+            reunion, course = divmod(number, 8)
+            partants = rng.randint(6, 18)
+            arrivees = rng.sample(range(1, partants + 1), 4)
+            yield RaceResult(
+                f'{iso}_c{number}', iso, day.strftime('%d/%m/%Y'),
+                f'{13 + course}h{rng.choice(["05", "35"])}', f'R{reunion + 1}',
+                HIPPOS[(day.toordinal() + reunion) % len(HIPPOS)], rng.choice('TTPPO'),
+                course + 1, partants, *arrivees,
+                payout(rng, 1.1, 30), payout(rng, 1.1, 12), payout(rng, 1.1, 12),
+                payout(rng, 1.1, 12), payout(rng, 5, 300), payout(rng, 5, 600),
+                payout(rng, 2, 80), payout(rng, 2, 80), payout(rng, 2, 80),
+                payout(rng, 10, 2000), payout(rng, 50, 9000), payout(rng, 100, 90000), ''
+            )
+        day += timedelta(days=1)
+
+
+QUERIES = {
+    'trot at Vincennes in 2018, super4 > 5000': dict(start='2018-01-01', end='2018-12-31',
+                                                      hippo='vincennes', discipline='T',
+                                                      bet='super4', above=5000),
+    'one day': dict(start='2015-06-14', end='2015-06-14'),
+    'plat at Longchamp, every year': dict(hippo='Longchamp', discipline='P'),
+    'obstacle in a month, cg < 20': dict(start='2016-03-01', end='2016-03-31', discipline='O',
+                                         bet='cg', below=20),
+    'how many races in a year': dict(start='2017-01-01', end='2017-12-31')
+}
+COUNTS = ['how many races in a year']
+EXPORTS = {'a year of races': dict(start='2017-01-01', end='2017-12-31')}
+
+
+def main(years=10, per_day=40, repeats=5):
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'results.db')
+    store = ResultsStore(path)
+    start = time.perf_counter()
+    store.write_many(made_up_races(years, per_day))
+    print(f'{len(store)} races ({years} years) stored in {time.perf_counter() - start:.1f}s, '
+          f'{os.path.getsize(path) / 2 ** 20:.0f} MB\n')
+
+    failed = False
+    print(f'{"Query":<44}{"Races":>8}{"Best ms":>10}')
+    for name, query in list(QUERIES.items()) + list(EXPORTS.items()):
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            races = store.count(**query) if name in COUNTS else len(store.query(**query))
+            times.append(time.perf_counter() - start)
+        over = name in QUERIES and min(times) > BUDGET
+        failed |= over
+        print(f'{name:<44}{races:>8}{min(times) * 1000:>10.1f}'
+              + ('   OVER BUDGET' if over else '' if name in QUERIES else '   (no budget)'))
+    store.close()
+    for name in os.listdir(folder):
+        os.remove(os.path.join(folder, name))
+    os.rmdir(folder)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:3]]))
@@ -0,0 +1,120 @@
+"""
+On disk HTTP cache for www.geny.com pages.
+
+Once a day's races have been run its races listing, partants and rapports pages don't change, so
+they are cached forever (gzipped). Pages of today's, or future, races are never cached as they are
+still being updated. The cache is kept under GENY_HTTPCACHE_MAX_SIZE bytes by evicting the least
+recently used pages.
+"""
+
+import os
+import re
+import shutil
+from collections import OrderedDict
+from datetime import date
+
+from scrapy.extensions.httpcache import DummyPolicy, FilesystemCacheStorage
+
+# Races listing: ...reunions-courses-pmu?date=2018-07-30
+# Partants and rapports: .../partants-pmu/2018-07-30-clairefontaine-deauville-pmu-...
+PAGE_DATE = re.compile(r'(?:date=|/)(\d{4})-(\d{2})-(\d{2})')
+
+
+def page_date(url):
+    """Returns the date of the races a geny.com page is about, or None if it can't be told."""
+    match = PAGE_DATE.search(url)
+    if match is None:
+        return None
+    try:
+        return date(*(int(part) for part in match.groups()))
+    except ValueError:
+        return None
+
+
+class GenyCachePolicy(DummyPolicy):
+    """Caches the pages of finished days forever, never caches today's or future races."""
+
+    def should_cache_request(self, request):
+        day = page_date(request.url)
+        return (
+            super().should_cache_request(request)
+            and day is not None
+            and day < date.today()
+        )
+
+    def should_cache_response(self, response, request):
+        return (
+            super().should_cache_response(response, request)
+            and self.should_cache_request(request)
+        )
+
+
+class LRUCacheStorage(FilesystemCacheStorage):
+    """Filesystem cache storage that evicts the least recently used pages over a size cap."""
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.max_size = settings.getint('GENY_HTTPCACHE_MAX_SIZE')
+        self.pages = OrderedDict()  # Cached page folder -> size in bytes, least recently used first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def open_spider(self, spider):
+        super().open_spider(spider)
+        spider_dir = os.path.join(self.cachedir, spider.name)
+        pages = []
+        if os.path.isdir(spider_dir):
+            for prefix in os.scandir(spider_dir):
+                if prefix.is_dir():
+                    for page in os.scandir(prefix.path):
+                        if page.is_dir():
+                            pages.append((page.stat().st_mtime, page.path))
+        for _, path in sorted(pages):
+            self.pages[path] = self.folder_size(path)
+        self.size = sum(self.pages.values())
+
+    def close_spider(self, spider):
+        super().close_spider(spider)
+        stats = spider.crawler.stats
+        stats.set_value('httpcache/lru_hits', self.hits)
+        stats.set_value('httpcache/lru_misses', self.misses)
+        stats.set_value('httpcache/lru_evicted', self.evicted)
+        stats.set_value('httpcache/lru_size', self.size)
+        total = self.hits + self.misses
+        spider.logger.info(f'HTTP cache: {self.hits} hits, {self.misses} misses '
+                           f'({self.hits / total if total else 0:.0%} hit rate), '
+                           f'{self.evicted} evicted, {self.size / 1024 / 1024:.1f} MB on disk')
+
+    @staticmethod
+    def folder_size(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+    def retrieve_response(self, spider, request):
+        response = super().retrieve_response(spider, request)
+        if response is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        path = self._get_request_path(spider, request)
+        os.utime(path)  # Marks the page as recently used for the next run
+        if path in self.pages:
+            self.pages.move_to_end(path)
+        return response
+
+    def store_response(self, spider, request, response):
+        super().store_response(spider, request, response)
+        path = self._get_request_path(spider, request)
+        self.size -= self.pages.pop(path, 0)
+        self.pages[path] = self.folder_size(path)
+        self.size += self.pages[path]
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used pages until the cache is under its size cap."""
+        while self.size > self.max_size and len(self.pages) > 1:
+            path, size = self.pages.popitem(last=False)
+            shutil.rmtree(path, ignore_errors=True)
+            self.size -= size
+            self.evicted += 1
@@ -0,0 +1,214 @@
+"""
+Checks the HTTP cache of cache.py. GenyCachePolicy must cache the pages of past days, but not
+those of today or later days, nor 404s. LRUCacheStorage must evict the least recently used pages
+and count its hits, misses and evictions. The storage is first checked on its own, with pages of
+known sizes. Then the spider crawls a past day, today and tomorrow from the stand-in of
+standin.py, plus a missing page, twice with one cache folder and a small GENY_HTTPCACHE_MAX_SIZE.
+What the stand-in serves shows what came from the cache.
+To Run:  cd to this folder, then use the command "python check_cache.py".
+"""
+
+import gzip
+import multiprocessing
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+import scrapy
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from cache import GenyCachePolicy, LRUCacheStorage
+from geny_scrape import GenyScrapeSpider
+from standin import StandinHandler, serve
+
+PAST = '2018-07-30'
+MAX_SIZE = 20 * 1024  # Bytes, so the past day's pages can't all stay cached
+
+
+class MissingPageSpider(GenyScrapeSpider):
+    """Also requests a partants page of the past day that the stand-in doesn't have."""
+    name = 'geny-scrape'
+
+    def start_requests(self):
+        yield from super().start_requests()
+        yield scrapy.Request(f'{self.site}/partants-pmu/{PAST}-nulle-part_c999999',
+                             callback=self.missing)
+
+    def missing(self, response):
+        return []
+
+
+class RecordingHandler(StandinHandler):
+    """The stand-in's handler, noting the path of every page asked for."""
+
+    def do_GET(self):
+        if not self.path.startswith('/standin-stats'):
+            with self.server.lock:
+                self.server.paths.append(self.path)
+        super().do_GET()
+
+
+def crawl(site, days, folder):
+    """Crawls the days from site in this process, caching in folder. Returns Scrapy's stats."""
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.settings import Settings
+
+    process = CrawlerProcess(Settings({'LOG_LEVEL': 'ERROR', 'HTTPCACHE_DIR': folder,
+                                       'GENY_HTTPCACHE_MAX_SIZE': MAX_SIZE,
+                                       'TELNETCONSOLE_ENABLED': False}, priority='cmdline'))
+    crawler = process.create_crawler(MissingPageSpider)
+    process.crawl(crawler, dates=','.join(days), output_format='none', headless=True, site=site)
+    process.start()
+    return crawler.stats.get_stats()
+
+
+def cached_pages(folder):
+    """The URL and status of every page in the cache folder."""
+    pages = []
+    for root, _, files in os.walk(folder):
+        if 'pickled_meta' in files:
+            with gzip.open(os.path.join(root, 'pickled_meta'), 'rb') as f:  # HTTPCACHE_GZIP
+                meta = pickle.load(f)
+            pages.append((meta['url'], meta['status']))
+    return pages
+
+
+def check_policy():
+    """The policy on its own, for pages of each kind of day."""
+    crawler = get_crawler(GenyScrapeSpider)
+    policy = GenyCachePolicy(crawler.settings)
+    today = date.today()
+    for day, cached in [(today - timedelta(days=1), True), (today, False),
+                        (today + timedelta(days=1), False)]:
+        for url in [f'https://www.geny.com/reunions-courses-pmu?date={day}',
+                    f'https://www.geny.com/rapports-pmu/{day}-vincennes-prix-de-paris_c1']:
+            request = scrapy.Request(url)
+            response = HtmlResponse(url, body=b'<html></html>')
+            if policy.should_cache_request(request) != cached or \
+                    policy.should_cache_response(response, request) != cached:
+                raise AssertionError(f'{url} cached: {not cached}')
+    request = scrapy.Request(f'https://www.geny.com/partants-pmu/{PAST}-nulle-part_c1')
+    if policy.should_cache_response(HtmlResponse(request.url, status=404), request):
+        raise AssertionError('A 404 would be cached')
+    if policy.should_cache_request(scrapy.Request('https://www.geny.com/')):
+        raise AssertionError('A page with no date would be cached')
+
+
+def check_storage(folder):
+    """
+    Stores pages a, b and c of 10KB with room for 2, so a is evicted. b is then read, which
+    makes c the least recently used page, evicted when d is stored. A storage opened afterwards
+    orders the pages by when they were last used, so storing e evicts b.
+    """
+    crawler = get_crawler(scrapy.Spider, {'HTTPCACHE_DIR': folder, 'HTTPCACHE_GZIP': True,
+                                          'GENY_HTTPCACHE_MAX_SIZE': 25 * 1024})
+    spider = scrapy.Spider.from_crawler(crawler, name='check')
+    pages = {name: (scrapy.Request(f'https://www.geny.com/partants-pmu/{PAST}-{name}_c1'),
+                    HtmlResponse(f'https://www.geny.com/partants-pmu/{PAST}-{name}_c1',
+                                 body=os.urandom(10 * 1024)))
+             for name in 'abcde'}
+
+    def is_cached(storage, name):
+        return os.path.isdir(storage._get_request_path(spider, pages[name][0]))
+
+    storage = LRUCacheStorage(crawler.settings)
+    storage.open_spider(spider)
+    for name in 'abc':
+        storage.store_response(spider, pages[name][0], pages[name][1])
+        time.sleep(0.01)  # Apart in mtime, which orders the pages when the cache is reopened
+    if is_cached(storage, 'a') or storage.evicted != 1:
+        raise AssertionError('a should have been evicted')
+    if storage.retrieve_response(spider, pages['b'][0]).body != pages['b'][1].body:
+        raise AssertionError('b should be served from the cache')
+    if storage.retrieve_response(spider, pages['a'][0]) is not None:
+        raise AssertionError('a should be a miss')
+    time.sleep(0.01)
+    storage.store_response(spider, *pages['d'])
+    if is_cached(storage, 'c') or not is_cached(storage, 'b'):
+        raise AssertionError('c, the least recently used, should have been evicted, not b')
+    counts = storage.hits, storage.misses, storage.evicted
+    if counts != (1, 1, 2):
+        raise AssertionError(f'Hits, misses and evictions: {counts} != (1, 1, 2)')
+    storage.close_spider(spider)
+    if crawler.stats.get_value('httpcache/lru_evicted') != 2 or \
+            crawler.stats.get_value('httpcache/lru_size') > 25 * 1024:
+        raise AssertionError(f'Stats: {crawler.stats.get_stats()}')
+
+    reopened = LRUCacheStorage(crawler.settings)
+    reopened.open_spider(spider)
+    reopened.store_response(spider, *pages['e'])
+    if is_cached(reopened, 'b') or not is_cached(reopened, 'd') or reopened.evicted != 1:
+        raise AssertionError('b, the least recently used since it was read, should be evicted')
+
+
+def check_crawls(folder):
+    """Crawls the stand-in twice with one cache. Returns the pages served by each crawl."""
+    server = serve(reunions=2, races=3)
+    server.RequestHandlerClass = RecordingHandler
+    server.paths = []
+    today = date.today()
+    days = [date.fromisoformat(PAST), today, today + timedelta(days=1)]
+    context = multiprocessing.get_context('spawn')
+    runs = []
+    try:
+        for _ in range(2):
+            served = len(server.paths)
+            with context.Pool(1, maxtasksperchild=1) as pool:
+                stats = pool.apply(crawl, (server.url, [day.strftime('%d/%m/%Y') for day in days],
+                                           folder))
+            runs.append((stats, Counter(server.paths[served:])))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    def past(paths):
+        return Counter({path: count for path, count in paths.items() if PAST in path})
+
+    (first, first_paths), (second, second_paths) = runs
+    pages = len(first_paths)
+    past_pages = len(past(first_paths))  # With the missing page
+    if pages != 3 * 13 + 1 or set(first_paths.values()) != {1}:
+        raise AssertionError(f'The first crawl should ask for every page once: {first_paths}')
+    if first.get('httpcache/lru_hits') or first['httpcache/lru_misses'] != past_pages or \
+            not first['httpcache/lru_evicted'] or first['httpcache/lru_size'] > MAX_SIZE:
+        raise AssertionError(f'First crawl: {first}')
+    cached = cached_pages(folder)
+    if not cached or any(PAST not in url or status != 200 for url, status in cached):
+        raise AssertionError(f'Only 200s of the past day should be cached: {cached}')
+
+    # Today's and tomorrow's pages, and the 404, are asked for again, the past day's misses too
+    again = {path for path in first_paths if PAST not in path or 'nulle-part' in path}
+    if not again <= set(second_paths) or \
+            sum(past(second_paths).values()) != second['httpcache/lru_misses'] or \
+            second['httpcache/lru_hits'] + second['httpcache/lru_misses'] != past_pages or \
+            not second['httpcache/lru_hits'] or second['httpcache/lru_size'] > MAX_SIZE:
+        raise AssertionError(f'Second crawl: {second}, served {second_paths}')
+    return first, second, pages, len(second_paths)
+
+
+def main():
+    folder = tempfile.mkdtemp(prefix='geny-check-cache-')
+    try:
+        check_policy()
+        check_storage(os.path.join(folder, 'storage'))
+        first, second, pages, served = check_crawls(os.path.join(folder, 'crawls'))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    print('Policy: past days cached, today, tomorrow and 404s not')
+    print('Storage: least recently used evicted, before and after reopening, counters right')
+    for name, stats, count in [('First', first, pages), ('Second', second, served)]:
+        print(f'{name} crawl: {count} pages from the stand-in, {stats["httpcache/lru_hits"]} '
+              f'hits, {stats["httpcache/lru_misses"]} misses, '
+              f'{stats["httpcache/lru_evicted"]} evicted, '
+              f'{stats["httpcache/lru_size"] / 1024:.0f}KB of {MAX_SIZE // 1024}KB cached')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
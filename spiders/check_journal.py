@@ -0,0 +1,100 @@
+"""
+Checks that a crawl rerun with the same journal (see journal.py) takes the races it already has
+from it. The spider crawls two days from the stand-in of standin.py with a journal, then again:
+the rerun must only ask for the races listings, and write the same rows. Then the rapports half
+of one race and the partants half of another are dropped from the journal, and a third run must
+ask for just those two pages besides the listings, still writing the same rows.
+To Run:  cd to this folder, then use the command "python check_journal.py".
+"""
+
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from collections import Counter
+
+from check_cache import RecordingHandler
+from geny_scrape import GenyScrapeSpider
+from standin import serve
+
+DAYS = ['30/07/2018', '31/07/2018']
+
+
+def crawl(site, journal, path):
+    """Crawls the days from site in this process with the journal, into a JSON lines file."""
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.settings import Settings
+
+    # The HTTP cache is off, so every page not in the journal is asked of the stand-in
+    process = CrawlerProcess(Settings({'LOG_LEVEL': 'ERROR', 'HTTPCACHE_ENABLED': False,
+                                       'TELNETCONSOLE_ENABLED': False}, priority='cmdline'))
+    process.crawl(GenyScrapeSpider, dates=','.join(DAYS), output_format='none', headless=True,
+                  site=site, journal=journal, jsonl=path)
+    process.start()
+
+
+def read_rows(path):
+    with open(path, encoding='utf-8') as f:
+        return sorted(f)
+
+
+def drop_halves(journal):
+    """Drops a race's rapports and another's pronostics from the journal. Returns their pages."""
+    conn = sqlite3.connect(journal)
+    (first,), (second,) = conn.execute('SELECT race_id FROM races ORDER BY race_id LIMIT 2')
+    conn.execute('UPDATE races SET rapports = NULL WHERE race_id = ?', (first,))
+    conn.execute('UPDATE races SET pronostics = NULL WHERE race_id = ?', (second,))
+    conn.commit()
+    conn.close()
+    return {('rapports-pmu', first), ('partants-pmu', second)}
+
+
+def main():
+    folder = tempfile.mkdtemp(prefix='geny-check-journal-')
+    journal = os.path.join(folder, 'crawl.db')
+    server = serve(reunions=2, races=3)
+    server.RequestHandlerClass = RecordingHandler
+    server.paths = []
+    context = multiprocessing.get_context('spawn')
+    runs = []
+    try:
+        for run in range(3):
+            if run == 2:
+                dropped = drop_halves(journal)
+            served = len(server.paths)
+            path = os.path.join(folder, f'run-{run}.jsonl')
+            with context.Pool(1, maxtasksperchild=1) as pool:
+                pool.apply(crawl, (server.url, journal, path))
+            runs.append((Counter(server.paths[served:]), read_rows(path)))
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(folder, ignore_errors=True)
+
+    (first, rows), (second, rerun_rows), (third, resumed_rows) = runs
+    listings = {path for path in first if path.startswith(GenyScrapeSpider.LISTING_PATH)}
+    races = len(DAYS) * 2 * 3
+    if len(rows) != races or len(listings) != len(DAYS) or \
+            sum(first.values()) != len(DAYS) + 2 * races:
+        raise AssertionError(f'The first run should scrape every race once: {first}')
+    if set(second) != listings or sum(second.values()) != len(DAYS):
+        raise AssertionError(f'The rerun should only ask for the listings: {second}')
+    # (kind, race id) of the race pages asked for, the race id being as in the journal
+    pages = {(path.split('/')[1], path.rsplit('-', 1)[-1])
+             for path in third if path not in listings}
+    if pages != dropped or sum(third.values()) != len(DAYS) + 2:
+        raise AssertionError(f'The third run should only ask for {dropped}: {third}')
+    for name, other in [('rerun', rerun_rows), ('third run', resumed_rows)]:
+        if other != rows:
+            raise AssertionError(f'The {name} wrote other rows:\n{other}\n!=\n{rows}')
+    print(f'First run: {sum(first.values())} pages, {len(rows)} races')
+    print(f'Rerun: {sum(second.values())} pages (the listings), the same {len(rerun_rows)} races')
+    print(f'Third run, 2 halves dropped: {sum(third.values())} pages, the same '
+          f'{len(resumed_rows)} races')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
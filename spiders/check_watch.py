@@ -0,0 +1,119 @@
+"""
+Checks that watch.RaceWatcher rides out what a race day throws at it, with no network and no
+real waiting: it runs on a made up clock, against the saved pages in fixtures/ served by a client
+that first fails in every way a live site can. The listing fails once, and each rapports page is
+a 503, then a dropped connection, then a page whose arrivees aren't filled in yet, then a timeout
+before it is served. The rows written must still be the golden ones, and the race with no
+rapports page must be given up on.
+To Run:  cd to this folder, then use the command "python check_watch.py".
+"""
+
+import logging
+import sys
+
+import requests
+from scrapy.http import HtmlResponse
+
+from corpus import load_golden, load_pages
+from geny_scrape import GenyScrapeSpider
+from records import RaceResult
+from watch import RaceWatcher, start_time
+
+DAY = '2018-07-30'
+
+
+class FakeClock():
+    """time.time and time.sleep, sleeping being only moving the time on."""
+
+    def __init__(self, now):
+        self.now = now
+        self.sleeps = 0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps += 1
+        self.now += seconds
+
+
+def unfinished(page):
+    """The rapports page as served before its arrivees are filled in."""
+    body = page.body.replace(b'id="arrivees"', b'id="arrivees-a-venir"')
+    return HtmlResponse(url=page.url, body=body, encoding='utf-8')
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f'{status} Server Error', response=response)
+
+
+class FailingClient():
+    """Serves the saved pages like GenyClient, after the failures scripted for each path."""
+
+    def __init__(self):
+        self.pages = {page.url.split('geny.com', 1)[1]: page for page in load_pages()}
+        listing = next(page for page in self.pages.values() if page.kind.startswith('reunions'))
+        self.listing = GenyScrapeSpider.race_links(listing.response())
+        self.failures = {'races': [requests.ConnectionError('Connection reset by peer')]}
+        for path, page in self.pages.items():
+            if page.kind == 'rapports-pmu':
+                self.failures[path] = [http_error(503), requests.ConnectionError('Refused'),
+                                       unfinished(page), requests.Timeout('Read timed out')]
+
+    def next_failure(self, key):
+        failures = self.failures.get(key)
+        if not failures:
+            return None
+        failure = failures.pop(0)
+        if isinstance(failure, Exception):
+            raise failure
+        return failure
+
+    def races(self, day):
+        self.next_failure('races')
+        return self.listing
+
+    def get(self, path):
+        return self.pages[path].response()
+
+    def get_if_changed(self, path, validators=None):
+        page = self.next_failure(path)
+        if page is not None:
+            return page, {}
+        if path not in self.pages:
+            return None, validators  # 404, not published yet
+        return self.pages[path].response(), {}
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(message)s')
+    clock = FakeClock(start_time(DAY, '12h00'))
+    client = FailingClient()
+    results = []
+
+    class Sink():
+        write = results.append
+
+    watcher = RaceWatcher(client, DAY, Sink(), poll=60, max_poll=600, clock=clock.time,
+                          sleep=clock.sleep)
+    watcher.run()
+
+    rows = [result.as_row() for result in sorted(results, key=RaceResult.sort_key)]
+    golden = load_golden()['rows'][DAY]
+    if rows != golden:
+        raise AssertionError(f'Rows differ from fixtures/golden.json:\n{rows}\n!=\n{golden}')
+    left = {key: failures for key, failures in client.failures.items() if failures}
+    if left:
+        raise AssertionError(f'Not every failure was met: {left}')
+    if sorted(watcher.found) != sorted(load_golden()['unmatched']['pronostics'] +
+                                       [result.race_id for result in results]):
+        raise AssertionError(f'Races found: {sorted(watcher.found)}')
+    print(f'{len(results)} races completed through every failure, 1 given up on, '
+          f'{clock.sleeps} sleeps over {(clock.now - start_time(DAY, "12h00")) / 3600:.1f} hours')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
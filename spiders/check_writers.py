@@ -0,0 +1,137 @@
+"""
+Checks the writers of writers.py on years of made up races (see bench_store.py), one sheet or
+file a day, with no more than 256 files open at once, as "ulimit -n 256" would allow.
+ParquetWriter must hold no more than a batch of rows, finish the files of the days it has moved
+on from while it writes, and write the rows load_frame reads back. Rows of a day coming after
+its file was finished must be added to it. XlsxWriter must keep no more than its max_open sheets
+open, and write a sheet a day with the headings of writers.HEADINGS, their merged cells and every
+row, as read back by openpyxl, late rows too.
+To Run:  cd to this folder, then use the command "python check_writers.py [days] [races a day]".
+"""
+
+import os
+import resource
+import shutil
+import sys
+import tempfile
+
+from bench_store import made_up_races
+from normalise import load_frame, to_frame
+from writers import HEADINGS, ParquetWriter, XlsxWriter
+
+OPEN_FILES = 256
+SHEETS = 300  # Days written to the .xlsx file, more than OPEN_FILES, openpyxl reading slowly
+
+
+def limit_open_files(limit=OPEN_FILES):
+    """Lowers the soft limit of open files of this process, as "ulimit -n" does."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(limit, soft), hard))
+
+
+def check_parquet(folder, results):
+    """Writes the results in day order, then a few late rows of early days, and reads them back."""
+    writer = ParquetWriter(folder)
+    days = sorted({result.day for result in results})
+    late = {days[0], days[len(days) // 2]}
+    held = 0
+    for result in results:
+        if result.day in late and result.race_id.endswith('_c0'):
+            continue  # Written at the end, once the day's file has been finished
+        writer.write(result)
+        held = max(held, len(writer.rows))
+        if len(writer.files) > writer.max_open:
+            raise AssertionError(f'{len(writer.files)} Parquet files open at once')
+    finished_early = len(writer.finished)
+    for result in results:
+        if result.day in late and result.race_id.endswith('_c0'):
+            writer.write(result)
+    writer.close()
+
+    if held >= writer.batch_size:
+        raise AssertionError(f'{held} rows held, more than a batch of {writer.batch_size}')
+    # Only the days still open or in the last batch may be unfinished
+    unfinished = writer.max_open + writer.batch_size // (len(results) // len(days)) + 1
+    if finished_early < len(days) - unfinished:
+        raise AssertionError(f'Only {finished_early} of {len(days)} days finished before close')
+    if writer.rewritten != len(late):
+        raise AssertionError(f'{writer.rewritten} days rewritten, not {len(late)}')
+    files = [name for name in os.listdir(folder) if name.endswith('.parquet')]
+    if len(files) != len(days) or len(os.listdir(folder)) != len(days):
+        raise AssertionError(f'{len(os.listdir(folder))} files for {len(days)} days')
+    columns = ['race_id', 'day', 'reunion', 'course', 'partants', 'arrivee_1', 'gagnant',
+               'super4', 'hippo']
+    written = load_frame(folder)[columns]
+    expected = to_frame(results).sort_values(['day', 'reunion', 'course'],
+                                             ignore_index=True)[columns]
+    if not written.astype(str).equals(expected.astype(str)):
+        raise AssertionError(f'Rows read back differ:\n{written}\n!=\n{expected}')
+    return finished_early, held, writer
+
+
+def check_xlsx(filename, results):
+    """Writes the results as check_parquet does, and reads them back with openpyxl."""
+    from openpyxl import load_workbook
+
+    days = sorted({result.day for result in results})
+    writer = XlsxWriter(filename, days)
+    late = {days[0], days[len(days) // 2]}
+    written = {day: [] for day in days}
+    held_back = [result.day in late and result.race_id.endswith('_c0') for result in results]
+    for result in [result for result, held in zip(results, held_back) if not held] + \
+            [result for result, held in zip(results, held_back) if held]:
+        writer.write(result)
+        written[result.day].append(result.as_row())
+        open_sheets = sum(not sheet.row_data_fh_closed for sheet in writer.sheets.values())
+        if open_sheets > writer.max_open:
+            raise AssertionError(f'{open_sheets} sheets open at once')
+    writer.close()
+    if writer.reopened != len(late):
+        raise AssertionError(f'{writer.reopened} sheets reopened, not {len(late)}')
+
+    book = load_workbook(filename)
+    if book.sheetnames != days:
+        raise AssertionError(f'Sheets {book.sheetnames[:3]}... are not the days {days[:3]}...')
+    merged = {(first_row + 1, first_col + 1, last_row + 1, last_col + 1)
+              for first_row, last_row, first_col, last_col, _, _ in HEADINGS
+              if (first_row, first_col) != (last_row, last_col)}
+    for day in days:
+        sheet = book[day]
+        for first_row, _, first_col, _, text, _ in HEADINGS:
+            if (sheet.cell(first_row + 1, first_col + 1).value or '') != text:
+                raise AssertionError(f'{day}: heading {text!r} missing')
+        ranges = {(cells.min_row, cells.min_col, cells.max_row, cells.max_col)
+                  for cells in sheet.merged_cells.ranges}
+        if ranges != merged:
+            raise AssertionError(f'{day}: merged cells {ranges} != {merged}')
+        rows = [[None if value == '' else value for value in row]
+                for row in sheet.iter_rows(min_row=3, values_only=True)]
+        expected = [[None if value == '' else value for value in row] for row in written[day]]
+        if rows != expected:
+            raise AssertionError(f'{day}: rows read back differ:\n{rows}\n!=\n{expected}')
+    return writer
+
+
+def main(days=1200, per_day=30):
+    limit_open_files()
+    results = [result for result, _ in zip(made_up_races(days // 365 + 1, per_day),
+                                            range(days * per_day))]
+    folder = tempfile.mkdtemp(prefix='geny-check-writers-')
+    try:
+        finished, held, writer = check_parquet(os.path.join(folder, 'parquet'), results)
+        sheet_days = sorted({result.day for result in results})[:SHEETS]
+        workbook = check_xlsx(os.path.join(folder, 'races.xlsx'),
+                              [result for result in results if result.day <= sheet_days[-1]])
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    print(f'{len(results)} races of {days} days, at most {OPEN_FILES} files open')
+    print(f'Parquet: {finished} days finished before close, at most {held} rows held and '
+          f'{writer.max_open} files open, {writer.rewritten} days rewritten with late rows, '
+          f'the same rows read back')
+    print(f'Xlsx: {len(workbook.sheets)} sheets, at most {workbook.max_open} open, '
+          f'{workbook.reopened} reopened for late rows, headings, merged cells and rows read back')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:3]]))
@@ -0,0 +1,165 @@
+"""
+Command line entry point, runs the crawl in this process without any windows or questions, so it
+can be run from cron on a machine with no screen. E.g.
+    python cli.py 30/07/2018 -o /data/30-07-2018.xls
+    python cli.py --start 01/07/2018 --end 31/07/2018 -o /data/july.xlsx -f xlsx
+With no dates it asks for one and for a folder to save to, like "scrapy runspider geny_scrape.py".
+
+Only argparse is imported until the arguments are known, so "--help" and mistakes in the
+arguments come back quickly. Startup budget (checked by bench_startup.py):
+"python cli.py --help" under 0.25s and "import geny_scrape" under 1.5s, without importing
+tkinter, xlwt, xlsxwriter or pyarrow.
+"""
+
+import argparse
+import sys
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Scrapes the races of a day, or days, '
+                                                 'from www.geny.com into an Excel file.')
+    parser.add_argument('dates', nargs='*', metavar='DD/MM/YYYY', help='days to scrape')
+    parser.add_argument('--start', metavar='DD/MM/YYYY', help='first day of a range to scrape')
+    parser.add_argument('--end', metavar='DD/MM/YYYY', help='last day of a range to scrape')
+    parser.add_argument('-o', '--output', help='file to save the Excel file to')
+    parser.add_argument('-f', '--format', choices=['xls', 'xlsx'], default=None,
+                        help='Excel format, by default from the output file extension')
+    parser.add_argument('--parquet', metavar='FOLDER', help='also write one Parquet file per day')
+    parser.add_argument('--store', metavar='FILE',
+                        help='also upsert the races into an indexed SQLite store, see store.py')
+    parser.add_argument('--dataset', metavar='FOLDER',
+                        help='also add the new or changed races to a dataset of one JSON lines '
+                             'file per day, see writers.DatasetWriter')
+    parser.add_argument('--runners', metavar='FILE',
+                        help='also save every runner of every race to a JSON lines file')
+    parser.add_argument('--archive', metavar='FOLDER',
+                        help='also archive every page downloaded, to re-parse them later with '
+                             'archive.py')
+    parser.add_argument('--journal', metavar='FILE',
+                        help='SQLite journal of scraped races, so reruns skip them')
+    parser.add_argument('--schedule', choices=['races', 'halves'], default='races',
+                        help='"races" requests both pages of each race together (the default), '
+                             '"halves" every partants page before any rapports page')
+    parser.add_argument('--site', metavar='URL',
+                        help='request the pages from here rather than https://www.geny.com, '
+                             'e.g. the stand-in of standin.py')
+    parser.add_argument('--parse-workers', type=int, default=0, metavar='N',
+                        help='parse pages in a pool of N workers rather than on the reactor '
+                             'thread, see parsing.py')
+    parser.add_argument('--parse-pool', choices=['thread', 'process'], default='thread',
+                        help='whether the --parse-workers are threads (the default) or processes')
+    parser.add_argument('--http2', action='store_true',
+                        help='download https pages over HTTP/2, every request sharing one '
+                             'connection (needs "pip install h2"), see keepalive.py')
+    parser.add_argument('--no-autothrottle', action='store_true',
+                        help='keep 8 requests in flight to the site however slowly it answers, '
+                             'rather than backing off with AutoThrottle')
+    parser.add_argument('--selectors', choices=['parsel', 'lxml'], default='parsel',
+                        help='run the XPaths through parsel (the default) or compiled once with '
+                             'lxml, see xpaths.py')
+    parser.add_argument('--metrics', metavar='PREFIX',
+                        help='write timings and bandwidth of the crawl to PREFIX.json and '
+                             'PREFIX.prom, see metrics.py')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='also trace memory use into the --metrics file')
+    parser.add_argument('--log-level', default='INFO',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'])
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='Scrapy setting, can be given more than once')
+    args = parser.parse_args(args)
+
+    if args.dates and args.start:
+        parser.error('give either dates or --start/--end, not both')
+    if args.end and not args.start:
+        parser.error('--end needs --start')
+    if (args.dates or args.start) and args.output is None:
+        parser.error('-o/--output is needed when dates are given')
+    if args.parse_workers < 0:
+        parser.error('--parse-workers must be 0 or more')
+    if args.tracemalloc and args.metrics is None:
+        parser.error('--tracemalloc needs --metrics')
+    if args.http2:
+        import importlib.util
+        if importlib.util.find_spec('h2') is None:
+            parser.error('--http2 needs h2, "pip install h2"')
+    if args.format is None:
+        args.format = 'xlsx' if (args.output or '').lower().endswith('.xlsx') else 'xls'
+    for setting in args.set:
+        if '=' not in setting:
+            parser.error(f'settings must be NAME=VALUE, not {setting}')
+    if args.dates or args.start:
+        # Checked here, as a bad date only fails once the spider is made, inside Twisted
+        from geny_scrape import Date
+        for day in args.dates:
+            if not Date.validate_date(day):
+                parser.error(f'not a valid DD/MM/YYYY date: {day}')
+        if args.start:
+            try:
+                Date.range(args.start, args.end or args.start)
+            except ValueError as error:
+                parser.error(f'--start/--end: {error}')
+    return args
+
+
+def spider_kwargs(args):
+    """Turns the command line arguments into GenyScrapeSpider arguments."""
+    kwargs = {'output_format': args.format, 'schedule': args.schedule}
+    if args.start:
+        kwargs['start_date'] = args.start
+        kwargs['end_date'] = args.end or args.start
+    elif args.dates:
+        kwargs['dates'] = ','.join(args.dates)
+    if args.start or args.dates:
+        kwargs['headless'] = True
+    if args.runners is not None:
+        kwargs['runners'] = True
+    if args.parse_workers:
+        kwargs['parse_workers'] = args.parse_workers
+        kwargs['parse_pool'] = args.parse_pool
+    if args.selectors != 'parsel':
+        kwargs['selectors'] = args.selectors
+    for name in ('output', 'parquet', 'store', 'dataset', 'journal', 'site'):
+        if getattr(args, name) is not None:
+            kwargs[name] = getattr(args, name)
+    return kwargs
+
+
+def main(args=None):
+    args = parse_args(args)
+
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.settings import Settings
+    from geny_scrape import GenyScrapeSpider
+
+    settings = {'LOG_LEVEL': args.log_level}
+    if args.runners is not None:
+        settings['FEEDS'] = {
+            args.runners: {'format': 'jsonlines', 'item_classes': ['records.RunnerRecord']}
+        }
+    if args.archive is not None:
+        settings['GENY_ARCHIVE'] = args.archive
+    if args.metrics is not None:
+        settings['GENY_METRICS'] = args.metrics
+        settings['GENY_METRICS_TRACEMALLOC'] = args.tracemalloc
+    settings = Settings(settings)
+    if args.no_autothrottle:
+        settings.set('AUTOTHROTTLE_ENABLED', False, priority='cmdline')
+    if args.http2:
+        from keepalive import HTTP2_HANDLER
+        handlers = dict(GenyScrapeSpider.custom_settings['DOWNLOAD_HANDLERS'], https=HTTP2_HANDLER)
+        settings.set('DOWNLOAD_HANDLERS', handlers, priority='cmdline')
+    # The priority of "scrapy -s", so they win over the spider's custom_settings
+    settings.setdict(dict(setting.split('=', 1) for setting in args.set), priority='cmdline')
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(GenyScrapeSpider)
+    process.crawl(crawler, **spider_kwargs(args))
+    process.start()
+    try:
+        finish_reason = crawler.stats.get_value('finish_reason')
+    except RuntimeError:
+        finish_reason = None  # The crawl never started, e.g. the spider couldn't be made
+    return 0 if finish_reason == 'finished' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,5 @@
-from os import system
-
-system('scrapy runspider geny_scrape.py')
+import sys
+
+from cli import main
+
+sys.exit(main())
@@ -9,22 +9,35 @@
 |                "scrapy runspider geny_scrape.py".
 |   Purpose:     Using the Scrapy framework, this program will ask the user for a date, then the
 |                program will scrape all the stats from that day from www.geny.com and put it into
-|                a formatted Excel file.
+|                a formatted Excel file. A range of dates can be passed in with
+|                "-a start_date=DD/MM/YYYY -a end_date=DD/MM/YYYY" (or "-a dates=..."),
+|                in which case every day is crawled in the same run, one sheet per day.
+|                For running without a screen (e.g. from cron) use cli.py instead.
 ====================================================================================================
 """
 
 # -*- coding: utf-8 -*-
 import scrapy
-from datetime import datetime
-import xlwt
-from tkinter import *
-from tkinter import filedialog
+from collections import defaultdict
+from datetime import datetime, timedelta
 import time
 import os
-import re
+from urllib.parse import urlsplit
+from journal import CrawlJournal
+from metrics import note_pool_extract
+from records import RacePayouts, RaceResult, RaceStats
+from store import ResultsStore
+from parsing import ParsePool, extract
+from xpaths import backend
+from writers import (HEADING_COLOURS, HEADINGS, DatasetWriter, JsonLinesWriter, ParquetWriter,
+                     XlsxWriter, replace_atomically)
 
 
 class Date():
+    def __init__(self, date=None):
+        if date is not None:
+            self.date = date
+
     def __repr__(self):
         return f'Date: {self.date}'
 
@@ -62,6 +75,11 @@ class Date():
     def year(self):
         return self.date.split('/')[2]
 
+    @property
+    def iso(self):
+        """Date in the YYYY-MM-DD format used by geny.com URLs and sheet names."""
+        return f'{self.year}-{self.month}-{self.day}'
+
     @staticmethod
     def validate_date(date):
         """Validates a given date. Needs to be in the DD/MM/YYYY format to be excepted."""
@@ -72,472 +90,425 @@ class Date():
         else:
             return True
 
+    @classmethod
+    def range(cls, start, end):
+        """Returns a Date for every day from start to end (both DD/MM/YYYY), inclusive."""
+        start_date = cls(start)
+        end_date = cls(end)
+        current = datetime.strptime(start_date.date, '%d/%m/%Y')
+        last = datetime.strptime(end_date.date, '%d/%m/%Y')
+        if current > last:
+            raise ValueError('Start date is after end date!')
+        dates = []
+        while current <= last:
+            dates.append(cls(current.strftime('%d/%m/%Y')))
+            current += timedelta(days=1)
+        return dates
+
 
 class GenyScrapeSpider(scrapy.Spider):
     name = 'geny-scrape'
     allowed_domains = ['geny.com']
-    BASE_URL = 'http://www.geny.com/reunions-courses-pmu?date='
+    # Every page is requested from the same scheme and host, so no request goes through a
+    # redirect and they all share the kept-alive connections to it
+    SITE = 'https://www.geny.com'
+    LISTING_PATH = '/reunions-courses-pmu?date='
+    # The div of each race on a day's listing page, in reunion then course order
+    RACE_LINKS = ('//div[@class="yui-g courseLiens  alternate" or '
+                  '@class="yui-g courseLiens "]')
+    SCHEDULES = ('races', 'halves')
+    custom_settings = {
+        # Pages of finished races never change, so they are only ever downloaded once
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_POLICY': 'cache.GenyCachePolicy',
+        'HTTPCACHE_STORAGE': 'cache.LRUCacheStorage',
+        'HTTPCACHE_GZIP': True,
+        'HTTPCACHE_IGNORE_HTTP_CODES': [403, 404, 408, 429, 500, 502, 503, 504],
+        'GENY_HTTPCACHE_MAX_SIZE': 512 * 1024 * 1024,
+        # At most 8 requests at a time to the site, over connections kept alive between them
+        # (see keepalive.py). AutoThrottle spaces the requests by the latency / 8, so it backs off
+        # as responses slow down, and never shortens the wait after an error. It costs some
+        # throughput while the site answers quickly (see bench_crawl.py), turned off by
+        # "cli.py --no-autothrottle"
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 8,
+        'DOWNLOAD_HANDLERS': {'http': 'keepalive.KeepAliveDownloadHandler',
+                              'https': 'keepalive.KeepAliveDownloadHandler'},
+        'AUTOTHROTTLE_ENABLED': True,
+        'AUTOTHROTTLE_START_DELAY': 0.1,
+        'AUTOTHROTTLE_TARGET_CONCURRENCY': 8,
+        'AUTOTHROTTLE_MAX_DELAY': 30,
+        # Pairs up the RaceStats and RacePayouts of each race, see race_completed
+        'ITEM_PIPELINES': {'pipelines.RaceJoinPipeline': 100},
+        # With -s GENY_ARCHIVE=folder every page downloaded is archived, see archive.py
+        'DOWNLOADER_MIDDLEWARES': {'archive.ArchiveMiddleware': 580},
+        # Callback timings, and with -s GENY_METRICS=prefix a metrics file, see metrics.py
+        'SPIDER_MIDDLEWARES': {'metrics.CallbackTimingMiddleware': 1000},
+        'EXTENSIONS': {'metrics.CrawlMetrics': 1000}
+    }
+
+    def __init__(self, start_date=None, end_date=None, dates=None, journal=None, parquet=None,
+                 output=None, output_format='xls', headless=False, schedule='races', jsonl=None,
+                 store=None, runners=False, parse_workers=0, parse_pool='thread', dataset=None,
+                 site=None, selectors='parsel', *args, **kwargs):
+        """
+        A range of days can be crawled in one run, e.g.
+            scrapy runspider geny_scrape.py -a start_date=01/07/2018 -a end_date=31/07/2018
+            scrapy runspider geny_scrape.py -a dates=01/07/2018,14/07/2018
+        Every day gets its own sheet. If no dates are given the user is asked for one.
 
-    def __init__(self):
-        self.date = Date()
-        self.book = xlwt.Workbook()
+        With "-a journal=crawl.db" every scraped race is recorded in a SQLite journal, and a
+        rerun with the same journal only requests the races that are missing or incomplete.
+
+        With "-a parquet=folder" the rows are also written to one Parquet file per day while the
+        crawl runs. "-a jsonl=file" writes them to a JSON lines file, one RaceResult per line.
+        "-a store=results.db" upserts them into an indexed SQLite store, see store.py.
+        "-a dataset=folder" adds the new or changed races to a dataset of one JSON lines file per
+        day, rewriting only the days scraped, see writers.DatasetWriter.
+
+        "-a output=file" saves the Excel file there instead of asking for a folder.
+        "-a output_format=xlsx" streams the rows to an .xlsx file as they are scraped, rather than
+        building the whole .xls workbook in memory and saving it at the end.
+        "-a output_format=none" makes no Excel file, for when the rows only go to the parquet or
+        jsonl files (as backfill.py does).
+
+        "-a schedule=races" (the default) requests the partants and rapports pages of each race
+        together, in reunion and course order, so rows complete steadily and few halves wait in
+        the join. "-a schedule=halves" requests every partants page of a day before any rapports
+        page, as it used to.
+
+        "-a runners=1" also yields a RunnerRecord for every runner of every race, e.g. for
+        "-o runners.jsonl" (cli.py --runners).
+
+        "-a parse_workers=4" parses the pages in a pool of 4 threads, or processes with
+        "-a parse_pool=process", rather than on the reactor thread, see parsing.py.
+
+        "-a site=http://127.0.0.1:8080" requests the pages from there rather than www.geny.com,
+        e.g. from the stand-in of standin.py.
+
+        "-a selectors=lxml" runs the XPaths compiled once on the lxml tree, rather than through
+        parsel (the default), see xpaths.py.
+
+        "-a headless=1" never asks anything or opens windows, so dates and output must be given.
+        tkinter and the Excel libraries are only imported once they are needed.
+        """
+        super().__init__(*args, **kwargs)
+        self.journal = CrawlJournal(journal) if journal is not None else None
+        if output_format not in ('xls', 'xlsx', 'none'):
+            raise ValueError(f'Not a valid output format: {output_format}')
+        self.output = output
+        self.output_format = output_format
+        if schedule not in self.SCHEDULES:
+            raise ValueError(f'Not a valid schedule: {schedule}')
+        self.schedule = schedule
+        self.writers = []  # Other outputs rows are streamed to as soon as they are complete
+        if parquet is not None:
+            self.writers.append(ParquetWriter(parquet))
+        if jsonl is not None:
+            self.writers.append(JsonLinesWriter(jsonl))
+        if store is not None:
+            self.writers.append(ResultsStore(store))
+        if dataset is not None:
+            self.writers.append(DatasetWriter(dataset))
+        if start_date is not None:
+            self.dates = Date.range(start_date, end_date or start_date)
+        elif dates is not None:
+            self.dates = [Date(date.strip()) for date in dates.split(',') if date.strip()]
+        else:
+            self.dates = []
+        # -a arguments are always strings
+        self.headless = str(headless).lower() not in ('', '0', 'false', 'no')
+        self.runners = str(runners).lower() not in ('', '0', 'false', 'no')
+        parse_workers = int(parse_workers)
+        self.parse_pool = ParsePool(parse_pool, parse_workers) if parse_workers > 0 else None
+        self.selectors = backend(selectors).name
+        if self.headless and (not self.dates or (output is None and output_format != 'none')):
+            raise ValueError('Dates and an output file are needed when running headless!')
+        # Scheme and host every page is requested from, see site_url
+        self.site = (site or self.SITE).rstrip('/')
+        if site is not None:
+            self.allowed_domains = self.allowed_domains + [urlsplit(self.site).hostname]
+        self.sheets = {}  # Excel sheet for each day, keyed by YYYY-MM-DD
+        self.book = None  # xlwt workbook, made by start_UI when the output is .xls
         self.row_index = 2  # First row of the Excel file starts on 3 (2 is zero point reference)
-        self.data_style = xlwt.easyxf('font: name Arial, bold on, height 160;'
-                                      'borders: top_color black, bottom_color black,'
-                                      'right_color black, left_color black,'
-                                      'left thin, right thin, top thin, bottom thin;'
-                                      'align: horiz left;')
-        self.stats = []  # For storing race stats for Excel writing
-        self.rapport_data = []  # For storing money details from rapports for Excel writing
+        self.data_style = None
+        self.results = defaultdict(list)  # For storing RaceResults for Excel writing, per day
 
     @staticmethod
-    def get_file_loc(day, month, year):
+    def get_file_loc(dates, extension='xls'):
         """Allows the user to pick a folder to save a file to. Returns the file path."""
+        first, last = dates[0], dates[-1]
+        filename = f'{first.day}-{first.month}-{first.year}'
+        if last.date != first.date:
+            filename += f'_{last.day}-{last.month}-{last.year}'
+        from tkinter import Tk, filedialog  # Only needed when there is a screen to ask on
         while True:
             root = Tk()
             root.filename = filedialog.askdirectory()
             root.withdraw()
             if root.filename != '':
-                return f'{root.filename}/{day}-{month}-{year}.xls'
+                return f'{root.filename}/{filename}.{extension}'
 
     @staticmethod
     def print_title():
         """Prints a nice heading when the program starts."""
-        with open('title.txt', 'r') as f:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'title.txt'), 'r') as f:
             for line in f:
                 print(line.rstrip())
 
-    def create_sheet_headings(self):
-        """Creates the heading rows for the Excel sheet."""
-        xlwt.add_palette_colour("colour1", 0x21)
-        xlwt.add_palette_colour("colour2", 0x22)
-        xlwt.add_palette_colour("colour3", 0x23)
-        self.book.set_colour_RGB(0x21, 150, 150, 150)
-        self.book.set_colour_RGB(0x22, 247, 150, 70)
-        self.book.set_colour_RGB(0x23, 146, 205, 220)
-        stats_style = xlwt.easyxf('font: name Arial, bold on, height 160;'
-                                  'pattern: pattern solid, fore_colour colour1;'
-                                  'borders: top_color black, bottom_color black, right_color black,'
-                                  'left_color black, left thin, right thin, top thin, bottom thin')
-        style2 = xlwt.easyxf('font: name Arial, bold on, height 160;'
-                             'pattern: pattern solid, fore_colour colour2;'
-                             'borders: top_color black, bottom_color black, right_color black,'
-                             'left_color black, left thin, right thin, top thin, bottom thin;'
-                             'align: horiz center;')
-        style3 = xlwt.easyxf('font: name Arial, bold on, height 160;'
-                             'pattern: pattern solid, fore_colour colour3;'
-                             'borders: top_color black, bottom_color black, right_color black,'
-                             'left_color black, left thin, right thin, top thin, bottom thin;'
-                             'align: horiz center;')
-        stats_row = [
-            "Date",
-            "Heure",
-            "Reunion",
-            "Hippo",
-            "Discip",
-            "Course",
-            "Partpants"
-        ]
-        rapports_row = [
-            "GAGNANT",
-            "GAGNANT PLACE",
-            "PLACE",
-            "PLACE"
-        ]
-        couples_row = [
-            "CG",
-            "CO",
-            "CP1",
-            "CP2",
-            "CP3"
-        ]
-        """
-        COL:   A  B  C  D  E  F  G  H  I  J  K  L  M  N  O  P  Q  R  S  T  U  V  W
-        INDEX: 0  1  2  3  4  5  6  7  8  9 10 11 12 13 14 15 16 17 18 19 20 21 22
-        For merging cells: write_merge(top_row, bottom_row, left_column, right_column, text, style)
-        """
-
-        # A -> G
-        # 0 -> 6
-        for col_num, col in enumerate(stats_row):
-            self.sh.write(0, col_num, col, stats_style)
-        for col_num in range(len(stats_row)):
-            self.sh.write(1, col_num, "", stats_style)
-
-        # H -> K
-        # 7 -> 10
-        self.sh.write_merge(
-            0, 0, 7, 10,
-            "ARRIVEES", style2
-        )
-        self.sh.write_merge(
-            1, 1, 7, 10,
-            "LES 4 PREMIERS CHEVAUX ARRIVES", style2
-        )
-
-        # L -> O
-        # 11 -> 14
-        self.sh.write_merge(
-            0, 0, 11, 14,
-            "RAPPORTS JEUX SIMPLES G P Pour 1€", style3
-        )
-        for col_num, col in enumerate(rapports_row):
-            self.sh.write(1, 11 + col_num, col, style3)
-
-        # P -> T
-        # 15 -> 19
-        self.sh.write_merge(
-            0, 0, 15, 19,
-            "COUPLES pour 1€", style3
-        )
-        for col_num, col in enumerate(couples_row):
-            self.sh.write(1, 15 + col_num, col, style3)
-
-        # U
-        # 20
-        self.sh.write(0, 20, "TRIOS", style3)
-        self.sh.write(1, 20, "Désordre", style3)
-
-        # V
-        # 21
-        self.sh.write(0, 21, "", style3)
-        self.sh.write(1, 21, "Ordre", style3)
-
-        # W
-        # 22
-        self.sh.write(0, 22, "SUPER4", style3)
-        self.sh.write(1, 22, "", style3)
+    def create_sheet_headings(self, sh):
+        """Creates the heading rows for the Excel sheet, laid out in writers.HEADINGS."""
+        import xlwt
+        styles = {}
+        for index, (colour, rgb) in enumerate(HEADING_COLOURS.items()):
+            xlwt.add_palette_colour(f'colour{index + 1}', 0x21 + index)
+            self.book.set_colour_RGB(0x21 + index, *rgb)
+            styles[colour] = xlwt.easyxf(
+                'font: name Arial, bold on, height 160;'
+                f'pattern: pattern solid, fore_colour colour{index + 1};'
+                'borders: top_color black, bottom_color black, right_color black,'
+                'left_color black, left thin, right thin, top thin, bottom thin'
+                + ('' if colour == 'stats' else ';align: horiz center;')
+            )
 
-        self.sh.write(0, 23, "Ecurie", style3)
-        self.sh.write(1, 23, "", style3)
+        for first_row, last_row, first_col, last_col, text, colour in HEADINGS:
+            if (first_row, first_col) == (last_row, last_col):
+                sh.write(first_row, first_col, text, styles[colour])
+            else:
+                # write_merge(top_row, bottom_row, left_column, right_column, text, style)
+                sh.write_merge(first_row, last_row, first_col, last_col, text, styles[colour])
 
-    def save_book(self, filename):
-        """Saves the XLS book and checks to see if there are permission errors."""
-        while True:
+    def save_book(self, filename, attempts=12, wait=5):
+        """
+        Saves the XLS book, to a temporary file renamed over filename so it is never left half
+        written. If it can't be replaced (e.g. it is open in Excel) it is tried again every wait
+        secs, up to attempts times, then saved next to it with the time in its name instead.
+        Returns the file saved to.
+        """
+        for attempt in range(attempts):
             try:
-                self.book.save(filename)
+                replace_atomically(filename, self.book.save)
             except PermissionError:
                 print(f"\n{filename} could not be saved! You might have it open!")
             else:
-                break
-            time.sleep(5)  # Waits 5 secs so the loop doesn't spam the console!
+                return filename
+            if attempt + 1 < attempts:
+                time.sleep(wait)  # Waits so the loop doesn't spam the console!
+        stem, extension = os.path.splitext(filename)
+        filename = f'{stem}-{datetime.now():%Y%m%d-%H%M%S}{extension}'
+        replace_atomically(filename, self.book.save)
+        print(f"Saved to {filename} instead")
+        return filename
 
     def start_UI(self):
-        self.date.get_date()
-        self.sh = self.book.add_sheet(
-            f'{self.date.year}-{self.date.month}-{self.date.day}',
-            # cell_overwrite_ok=True
-        )
-        self.create_sheet_headings()
+        if not self.dates:
+            date = Date()
+            date.get_date()
+            self.dates = [date]
+        if self.output_format == 'none':
+            return
+        if self.output_format == 'xlsx':
+            self.file_loc = self.output or self.get_file_loc(self.dates, 'xlsx')
+            self.writers.append(XlsxWriter(self.file_loc, [date.iso for date in self.dates]))
+            return
+        import xlwt
+        self.book = xlwt.Workbook()
+        self.data_style = xlwt.easyxf('font: name Arial, bold on, height 160;'
+                                      'borders: top_color black, bottom_color black,'
+                                      'right_color black, left_color black,'
+                                      'left thin, right thin, top thin, bottom thin;'
+                                      'align: horiz left;')
+        for date in self.dates:
+            self.sheets[date.iso] = self.book.add_sheet(
+                date.iso,
+                # cell_overwrite_ok=True
+            )
+            self.create_sheet_headings(self.sheets[date.iso])
 
-    def match_arrays(self, rows1, rows2):
-        """Matches two rows based of reunion and course."""
-        matched_array = []
-        for row1 in rows1:
-            for row2 in rows2:
-                if row1[0] == row2[0]:
-                    matched_array.append(row1[1:] + row2[1:])
-        return matched_array
+    def scraped(self, half, record):
+        """Records a scraped half of a race ('pronostics' or 'rapports') in the journal."""
+        if self.journal is not None:
+            self.journal.record(record.day, half, [record.race_id] + record.as_row())
+        return record
 
-    def order_rows(self, rows):
-        ordered_rows = sorted(rows, key=lambda rows: rows[5])
-        return sorted(ordered_rows, key=lambda ordered_rows: ordered_rows[2])
+    def restore_half(self, day, half, url, done):
+        """
+        Returns a half of a race (RaceStats or RacePayouts) from the journal, or None if it still
+        needs scraping.
+        """
+        race_id = url.split('-')[-1]  # Same as the end_url[-1] of parse_pronostics/parse_rapports
+        row = done.get(race_id, {}).get(half)
+        if row is None:
+            return None
+        if half == 'pronostics':
+            return RaceStats.from_row(day, row)
+        return RacePayouts.from_row(day, row)
+
+    def race_completed(self, result):
+        """Called by RaceJoinPipeline as soon as both halves of a race have been scraped."""
+        if self.output_format == 'xls':
+            # Held until the end, the .xls workbook is written at once
+            self.results[result.day].append(result)
+        for writer in self.writers:
+            writer.write(result)
+
+    @staticmethod
+    def order_rows(results):
+        """Returns the rows of the RaceResults, ordered by reunion then course."""
+        return [result.as_row() for result in sorted(results, key=RaceResult.sort_key)]
 
     def start_requests(self):
         """Tells Scrapy what requests to deal with first, method automatically called!"""
-        self.print_title()
+        if not self.headless:
+            self.print_title()
         self.start_UI()
-        yield scrapy.Request(
-            url=f'{self.BASE_URL}{self.date.year}-{self.date.month}-{self.date.day}',
-            callback=self.parse_races
-        )
+        for date in self.dates:
+            # All the days are queued at once so Scrapy crawls them concurrently
+            yield scrapy.Request(
+                url=f'{self.site}{self.LISTING_PATH}{date.iso}',
+                callback=self.parse_races,
+                cb_kwargs={'day': date.iso}
+            )
+
+    async def start(self):
+        """Scrapy 2.13 and later ask for the first requests here instead of start_requests."""
+        for request in self.start_requests():
+            yield request
 
     def closed(self, reason):
         """Tells Scrapy what to do after the spider has closed, method automatically called!"""
+        if self.parse_pool is not None:
+            self.parse_pool.close()
+        if self.journal is not None:
+            self.journal.close()  # Everything scraped is kept even if saving the workbook fails
+        for writer in self.writers:
+            writer.close()
+
+        for day, sh in self.sheets.items():
+            combined_rows = self.order_rows(self.results.pop(day, []))
+
+            # Write stats data to the day's Excel sheet
+            for row_num, row in enumerate(combined_rows):
+                for col_num, col in enumerate(row):
+                    # + 2 needed as the first row we want to write on second row first
+                    sh.write(row_num + 2, col_num, col, self.data_style)
+
+        if self.book is None and not self.writers:
+            return  # Closed before start_requests, nothing was set up to be saved
+        if self.output_format == 'xls':
+            self.file_loc = self.output or self.get_file_loc(self.dates)
+            self.file_loc = self.save_book(self.file_loc)
+        if not self.headless and self.output_format != 'none' and hasattr(os, 'startfile'):
+            os.startfile(self.file_loc)  # Opens the saved Excel file (only on Windows)
+
+    def parse_races(self, response, day):
+        if self.parse_pool is not None:
+            return self.parse_races_in_pool(response, day)
+        return self.parse_races_here(response, day)
+
+    def parse_races_here(self, response, day):
+        yield from self.race_requests(day, self.race_links(response, self.selectors))
+
+    async def parse_races_in_pool(self, response, day):
+        races = await self.extract_in_pool('races', response, day)
+        for request in self.race_requests(day, races):
+            yield request
+
+    def race_requests(self, day, races):
+        """Yields the requests for the halves of the races (see race_links) of a day."""
+        # Halves of races already scraped by an earlier run are taken from the journal
+        done = self.journal.halves(day) if self.journal is not None else {}
+
+        if self.schedule == 'races':
+            # Each race's two pages are requested together, first race first, so rows finish
+            # steadily through the crawl rather than all at the end
+            for position, links in enumerate(races):
+                priority = len(races) - position
+                for half in ('pronostics', 'rapports'):
+                    if links[half] is not None:
+                        yield self.half_request(day, half, links[half], done, priority)
+            return
+
+        # Every partants page of the day, then every rapports page
+        for half in ('pronostics', 'rapports'):
+            for links in races:
+                if links[half] is not None:
+                    yield self.half_request(day, half, links[half], done)
+
+    @classmethod
+    def race_links(cls, response, selectors='parsel'):
+        """
+        Returns the links of every race on a listing page, in reunion then course order, as
+        {'reunion': e.g. 'R2', 'pronostics': partants href, 'rapports': href or None}.
+        The rapports link is only there once the race has been run.
+        """
+        select = backend(selectors)
+        races = []
+        for race in select.nodes(select.root(response), cls.RACE_LINKS):
+            reunion = select.first(race, 'ancestor::div[starts-with(@id, "reunion")][1]/@id')
+            races.append({
+                'reunion': (reunion or '').replace('reunion', 'R'),
+                'pronostics': select.first(race, './/a[normalize-space() = "partants/stats/prono"]'
+                                                 '/@href'),
+                'rapports': select.first(race, './/a[normalize-space() = "rapports"]/@href')
+            })
+        return races
+
+    def site_url(self, href):
+        """
+        Returns the URL of a link of the site on self.site, whether the link is relative or
+        written with another scheme or host, e.g. 'http://geny.com/partants-pmu/...'.
+        """
+        link = urlsplit(href)
+        return f'{self.site}{link.path}' + (f'?{link.query}' if link.query else '')
 
-        combined_rows = self.match_arrays(self.stats, self.rapport_data)
-        combined_rows = self.order_rows(combined_rows)
-
-        # Write stats data to Excel sheet
-        for row_num, row in enumerate(combined_rows):
-            for col_num, col in enumerate(row):
-                # + 2 needed as the first row we want to write on second row first
-                self.sh.write(row_num + 2, col_num, col, self.data_style)
-
-        self.file_loc = self.get_file_loc(self.date.day, self.date.month, self.date.year)
-        self.save_book(self.file_loc)
-        os.startfile(self.file_loc)  # Opens the saved Excel file
-
-    def parse_races(self, response):
-        races = response.xpath('//div[@class="yui-g courseLiens  alternate" or '
-                               '@class="yui-g courseLiens "]'
-                               '//a[normalize-space() = "partants/stats/prono"]/@href').extract()
-        # Finds all the urls of the buttons with 'partants/stats/prono' as their text
-
-        rapports = response.xpath('//div[@class="yui-g courseLiens  alternate" or '
-                                  '@class="yui-g courseLiens "]'
-                                  '//a[normalize-space() = "rapports"]/@href').extract()
-        # Finds all the urls of the buttons with 'rapports' as their text
-
-        for race in races:
-            # Requsts from all the urls found
-            yield scrapy.Request(
-                url=f'https://www.geny.com{race}',
-                callback=self.parse_pronostics
-            )
+    def half_request(self, day, half, href, done, priority=0):
+        """
+        Returns the request for a half of a race, or the half itself if the journal already
+        has it.
+        """
+        restored = self.restore_half(day, half, href, done)
+        if restored is not None:
+            return restored
+        return scrapy.Request(
+            url=self.site_url(href),
+            callback=self.parse_pronostics if half == 'pronostics' else self.parse_rapports,
+            cb_kwargs={'day': day},
+            priority=priority
+        )
 
-        for rapport in rapports:
-            yield scrapy.Request(
-                url=f'https://www.geny.com{rapport}',
-                callback=self.parse_rapports
-            )
+    def parse_pronostics(self, response, day):
+        # RaceJoinPipeline joins it with the race's rapports
+        return self.parse_half('pronostics', response, day)
 
-    def parse_pronostics(self, response):
-        try:
-            """Splits URL up so that date from URL can be easily extracted.
-               Example: http://www.geny.com/partants-pmu/
-                        2018-07-30-clairefontaine-deauville-pmu-prix-de-la-cote-de-nacre_c991181
-            """
-            end_url = response.url.split('/')[4].split('-')
-            date = f'{end_url[2]}/{end_url[1]}/{end_url[0]}'
-        except IndexError:
-            # Needed incase the date cannot be found
-            date = ''
-        hour = response.xpath('//span[@class="infoCourse"]/strong/text()').extract_first()
-        if 'h' not in hour:
-            # Cheaks if time is in correct format
-            hour = ''
-        hippo = response.xpath('//div[@id="navigation"]/a[3]/text()').extract_first()
-        try:
-            reunion = response.xpath(
-                '//div[@id="navigation"]'
-                '/a[3]/@href'
-            ).extract_first().split('#')[1].replace('reunion', 'R')
-        except IndexError:
-            reunion = ''
-        for i in range(1, 6):
-            # The main text of info can change in terms of its XPATH reference
-            meta_text = response.xpath(f'//span[@class="infoCourse"]/text()[{i}]').extract_first()
-            if meta_text.count('-') >= 4 and '\xa0' in meta_text:
-                # Reliable way of finding the correct index for the main bit of text
-                break
-            if i == 6:
-                # If by this point the main text hasn't been found, there is an error
-                meta_text = ''
-        try:
-            meta_text = meta_text.split('\xa0')[0]
-            meta_text = ''.join([c.strip() for c in meta_text])
-            meta_text = meta_text[:-1]
-            if meta_text == 'Attelé' or meta_text == 'Monté':
-                discipline = 'T'
-            elif meta_text == 'Plat':
-                discipline = 'P'
-            elif meta_text == 'Haies' or meta_text == 'Steeple-chase':
-                discipline = 'O'
-            else:
-                discipline = ''
-        except IndexError:
-            discipline = ''
-        try:
-            course = response.xpath('//div[@class="yui-u first nomCourse"]'
-                                    '//strong/text()[1]').extract_first().strip()
-            # Removed any non digits in the case that something is not scraped correctly
-            course = ''.join([c for c in course if c.isdigit()])
-        except TypeError:
-            course = ''
-        partpants = response.xpath('//div[@class="yui-content"]'
-                                   '//tbody/tr[last()]/td[1]/text()').extract_first()
-
-        # Stores data for later saving into Excel sheet
-        self.stats.append([
-            end_url[-1],
-            date,
-            hour,
-            reunion,
-            hippo,
-            discipline,
-            int(course),
-            int(partpants)
-        ])
-
-    def parse_rapports(self, response):
-        end_url = response.url.split('/')[4].split('-')
+    def parse_rapports(self, response, day):
+        # RaceJoinPipeline joins it with the race's stats
+        return self.parse_half('rapports', response, day)
 
-        try:
-            partpants = response.xpath('//table[@id="arrivees"]//tr/td[2]/text()').extract()
-            # Cleans text and gets rid of any non digit entries
-            partpants = [
-                int(partpant.strip())
-                for partpant in partpants
-                if partpant.strip().isdigit()
-            ]
-            partpants = max(partpants)
-        except IndexError:
-            partpants = 0  # Needs to be ten to satisfy the data type of the if statement later on
-        try:
-            arrivees = response.xpath(
-                '//table[@id="arrivees"]//tr[td[1]//text() <= 4]/td[2]/text()'
-            ).extract()
-            arrivees = [int(arrivee.strip()) for arrivee in arrivees]
-            if len(arrivees) > 4:
-                arrivees = arrivees[0:4]  # Deals with any draws that may occur
-            elif len(arrivees) < 4:
-                while len(arrivees) < 4:
-                    arrivees.append('')
-            # Fills out the arrivees list, if it's not 4 in length
-        except (IndexError, ValueError):
-            arrivees = ['', '', '', '']
-
-        GAGNANT = ''
-        GAGNANT_PLACE = ''
-        PLACE1 = ''
-        PLACE2 = ''
-        CG = ''
-        CO = ''
-        CP1 = ''
-        CP2 = ''
-        CP3 = ''
-        Désordre = ''
-        Ordre = ''
-        SUPER4 = ''
-        ecurie = ''
+    def parse_half(self, half, response, day):
+        if self.parse_pool is not None:
+            return self.parse_half_in_pool(half, response, day)
+        return self.parse_half_here(half, response, day)
 
-        """
-        Example First Table:
-        +-------+---------+------+
-        | Index |         |      |
-        +-------+---------+------+
-        | 1     | Gagnant | 5,20 |
-        +-------+---------+------+
-        | 2     | Placé   | 1,80 |
-        +-------+---------+------+
-        | 3     | Placé   | 3,50 |
-        +-------+---------+------+
-        | 4     | Placé   | 2,20 |
-        +-------+---------+------+
-        """
+    def parse_half_here(self, half, response, day):
+        # The half itself, then the race's runners if asked for
+        records = extract(half, response, day, self.runners, self.selectors)
+        yield self.scraped(half, records[0])
+        yield from records[1:]
 
-        # Index 1
-        GAGNANT = response.xpath(
-            '//table[@id="lesSolos"]//tr/td[*//i[text() = "PMU"]]//'
-            'tr[*//div[normalize-space() = "Gagnant"]]/td[2]//b/text()'
-        ).extract_first()
-        # Index 2
-        GAGNANT_PLACE = response.xpath(
-            '//table[@id="lesSolos"]//tr/td[*//i[text() = "PMU"]]//'
-            'tr[*//div[normalize-space() = "Placé"]][1]/td[2]//text()'
-        ).extract_first()
-        # Index 3
-        PLACE1 = response.xpath(
-            '//table[@id="lesSolos"]//tr/td[*//i[text() = "PMU"]]//'
-            'tr[*//div[normalize-space() = "Placé"]][2]/td[2]//text()'
-        ).extract_first()
-        # Index 4
-        PLACE2 = response.xpath(
-            '//table[@id="lesSolos"]//tr/td[*//i[text() = "PMU"]]//'
-            'tr[*//div[normalize-space() = "Placé"]][3]/td[2]//text()'
-        ).extract_first()
-
-        ecurie = response.xpath(
-            '//table[@id="lesSolos"]//tr/'
-            'td[*//i[text() = "PMU"]]/div/span/text()'
-        ).extract_first()
-
-        if ecurie is not None:
-            ecurie = re.sub('\xa0', '', ecurie)  # Cleans encoding
-            ecurie = re.sub('Ecurie : ', '', ecurie)  # Makes the "ecuire" numbers easier to read
+    async def parse_half_in_pool(self, half, response, day):
+        records = await self.extract_in_pool(half, response, day)
+        yield self.scraped(half, records[0])
+        for record in records[1:]:
+            yield record
 
+    async def extract_in_pool(self, kind, response, day):
         """
-        Example Second Table:
-        +-------+---------+-------+
-        | Index |         |       |
-        +-------+---------+-------+
-        | 1     | Gagnant | 5,20  |
-        +-------+---------+-------+
-        | 2     | Placé   | 1,80  |
-        +-------+---------+-------+
-        | 3     | Placé   | 3,50  |
-        +-------+---------+-------+
-        | 4     | Placé   | 2,20  |
-        +-------+---------+-------+
-        |       |         |       |
-        +-------+---------+-------+
-        | 5     | Ordre   | 47,80 |
-        +-------+---------+-------+
+        Awaits extract of a response in the parse pool, noting the worker's time in the stats and
+        the time awaited, which isn't the callback's (see metrics.note_pool_extract).
         """
-        if partpants > 7:
-            # Index 1
-            CG = response.xpath(
-                '//table[@id="lesDuos"]//tr/td[*//i[text() = "PMU"]]//'
-                'tr[*//div[normalize-space() = "Gagnant"]]/td[2]//b/text()'
-            ).extract_first()
-            # Index 2
-            CP1 = response.xpath(
-                '//table[@id="lesDuos"]//tr/td[*//i[text() = "PMU"]]//'
-                'tr[*//div[normalize-space() = "Placé"]][1]/td[2]//text()'
-            ).extract_first()
-            # Index 3
-            CP2 = response.xpath(
-                '//table[@id="lesDuos"]//tr/td[*//i[text() = "PMU"]]//'
-                'tr[*//div[normalize-space() = "Placé"]][2]/td[2]//text()'
-            ).extract_first()
-            # Index 4
-            CP3 = response.xpath(
-                '//table[@id="lesDuos"]//tr/td[*//i[text() = "PMU"]]//'
-                'tr[*//div[normalize-space() = "Placé"]][3]/td[2]//text()'
-            ).extract_first()
-
-        Désordre = response.xpath(
-            '//table[@id="lesTrios"]//tr/td[*//i[text() = "PMU"]]/table[1]//tr[2]/td[2]/b/text()'
-        ).extract_first()
-        # Index 5
-        CO = response.xpath(
-            '//table[@id="lesDuos"]//tr/td[*//i[text() = "PMU"]]//'
-            'tr[*//div[normalize-space() = "Ordre"]]/td[2]//text()'
-        ).extract_first()
-
-        if partpants < 8:
-            Ordre = response.xpath(
-                '//table[@id="lesTrios"]//tr/td[*//i[text() = "PMU"]]//'
-                'tr[*//div[normalize-space() = "Ordre"]]/td[2]//text()'
-            ).extract_first()
-            SUPER4 = response.xpath(
-                '//table[@id="lesQuartos"]//tr/td[*//i[text() = "PMU"]]//'
-                'tr[*[normalize-space() = "Super 4"]]/td[2]//text()'
-            ).extract_first()
-
-        data = [
-            GAGNANT,
-            GAGNANT_PLACE,
-            PLACE1,
-            PLACE2,
-            CG,
-            CO,
-            CP1,
-            CP2,
-            CP3,
-            Désordre,
-            Ordre,
-            SUPER4,
-            ecurie
-        ]
-
-        data = [
-            ''
-            if d is None
-            else d
-            for d in data
-        ]
-        # Converts XPaths that couldn't be found to empty strings
-        data = [d.strip() for d in data]
-        # Cleans all strings
-
-        data = [re.sub(' €', '', d) for d in data]
-        # Gets rid of Euro sign and spaces
-        data = [re.sub(',00', '', d) for d in data]
-        # Replaces for example 3,00 with 3
-        data = [int(d) if d.isdigit() else d for d in data]
-        # Converts strings that are ints, to ints, so Excel doesn't show errors
-
-        # Stores data for later saving into Excel sheet
-        self.rapport_data.append([end_url[-1]] + arrivees + data)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        records, timing = await self.parse_pool.extract(kind, response, day, self.runners,
+                                                        self.selectors)
+        waited = (time.perf_counter() - wall, time.thread_time() - cpu)
+        note_pool_extract(getattr(self, 'crawler', None), response, kind, waited, timing)
+        return records
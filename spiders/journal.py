@@ -0,0 +1,68 @@
+"""
+SQLite journal of the races scraped so far, so a crawl that dies part way through can be rerun
+without downloading the races it had already finished.
+
+Each half of a race (the row from parse_pronostics and the row from parse_rapports) is recorded as
+soon as it has been scraped, keyed by race id and date. Writes are committed at least every
+checkpoint_secs seconds, so only the last few seconds of work can be lost.
+"""
+
+import json
+import sqlite3
+import time
+
+HALVES = ('pronostics', 'rapports')
+
+
+class CrawlJournal():
+    def __init__(self, path, checkpoint_secs=5):
+        self.path = path
+        self.checkpoint_secs = checkpoint_secs
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS races ('
+            'race_id TEXT PRIMARY KEY, day TEXT NOT NULL, pronostics TEXT, rapports TEXT)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS races_day ON races (day)')
+        self.conn.commit()
+        self.last_checkpoint = time.monotonic()
+        self.pending = 0  # Halves recorded since the last checkpoint
+
+    def __repr__(self):
+        return f'CrawlJournal: {self.path}'
+
+    def record(self, day, half, row):
+        """Records a half of a race ('pronostics' or 'rapports'), row[0] being the race id."""
+        if half not in HALVES:
+            raise ValueError(f'Not a valid half: {half}')
+        self.conn.execute(
+            f'INSERT INTO races (race_id, day, {half}) VALUES (?, ?, ?) '
+            f'ON CONFLICT (race_id) DO UPDATE SET day = excluded.day, {half} = excluded.{half}',
+            (row[0], day, json.dumps(row, ensure_ascii=False))
+        )
+        self.pending += 1
+        if time.monotonic() - self.last_checkpoint >= self.checkpoint_secs:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Commits everything recorded so far."""
+        if self.pending:
+            self.conn.commit()
+            self.pending = 0
+        self.last_checkpoint = time.monotonic()
+
+    def halves(self, day):
+        """Returns {race id: {'pronostics': row or None, 'rapports': row or None}} for a day."""
+        races = {}
+        for race_id, pronostics, rapports in self.conn.execute(
+                'SELECT race_id, pronostics, rapports FROM races WHERE day = ?', (day,)):
+            races[race_id] = {
+                'pronostics': json.loads(pronostics) if pronostics is not None else None,
+                'rapports': json.loads(rapports) if rapports is not None else None
+            }
+        return races
+
+    def close(self):
+        self.checkpoint()
+        self.conn.close()
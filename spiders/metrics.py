@@ -0,0 +1,315 @@
+"""
+Instrumentation of the crawl, to tell a network bound run from a parse bound one.
+
+CallbackTimingMiddleware times every callback (wall and CPU time) into the crawl's stats, and
+samples how many requests are waiting in the scheduler. With --parse-workers, the pool's workers
+time the pages they parse, which their callbacks only await (see note_pool_extract).
+RaceJoinPipeline adds the most halves that were waiting in the join at once. With the setting
+GENY_METRICS=prefix, CrawlMetrics also times XPath evaluation and, when the spider closes, writes
+    prefix.json  every figure below plus all of Scrapy's stats
+    prefix.prom  the figures in the Prometheus text format, for a node_exporter textfile
+    collector or to be diffed between releases
+GENY_METRICS_TRACEMALLOC=1 also traces memory with tracemalloc, adding the peak and the biggest
+allocations by line to prefix.json. E.g.
+    python cli.py 30/07/2018 -o 30-07-2018.xls --metrics metrics/30-07-2018
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+CALLBACK_STAT = 'geny/callback/{}/{}'  # Callback name, then calls, wall_seconds or cpu_seconds
+# Kind of page parsed in the parse pool (see parsing.py), then calls, wall_seconds, cpu_seconds or
+# xpath_seconds, as timed in the workers
+WORKER_STAT = 'geny/worker/{}/{}'
+WORKER_FIELDS = ('calls', 'wall_seconds', 'cpu_seconds', 'xpath_seconds')
+# Request meta of the (wall, CPU) seconds a callback spent awaiting the parse pool
+POOL_WAIT = 'geny_pool_wait'
+
+
+def pool_wait(response):
+    request = response.request
+    return request.meta.get(POOL_WAIT, (0, 0)) if request is not None else (0, 0)
+
+
+def note_pool_extract(crawler, response, kind, waited, timing):
+    """
+    Notes a page parsed in the parse pool: the (wall, CPU) seconds its callback was suspended
+    awaiting it, which CallbackTimingMiddleware leaves out of the callback's time, and the
+    (wall, CPU, XPath) seconds the worker took, added to the stats.
+    """
+    if response.request is not None:
+        wall, cpu = pool_wait(response)
+        response.request.meta[POOL_WAIT] = (wall + waited[0], cpu + waited[1])
+    if crawler is not None:
+        crawler.stats.inc_value(WORKER_STAT.format(kind, 'calls'))
+        for field, seconds in zip(WORKER_FIELDS[1:], timing):
+            crawler.stats.inc_value(WORKER_STAT.format(kind, field), seconds)
+
+
+class CallbackTimingMiddleware():
+    """
+    Spider middleware, closest to the spider, adding up the wall and CPU time each callback takes
+    to make its requests and records. A callback's body runs as its output is iterated, so the
+    time is measured around each step of that iteration. The time an async callback spends
+    awaiting the parse pool, when other callbacks run, is left out (see note_pool_extract).
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.crawler = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(crawler.stats)
+        middleware.crawler = crawler
+        return middleware
+
+    def callback_name(self, response):
+        callback = response.request.callback if response.request is not None else None
+        return getattr(callback, '__name__', 'parse')
+
+    def sample_queue(self):
+        engine = getattr(self.crawler, 'engine', None)
+        scheduler = getattr(engine, 'scheduler', None)
+        if scheduler is not None:
+            self.stats.max_value('geny/scheduler/queue_depth_max', len(scheduler))
+
+    def add_time(self, name, wall, cpu):
+        self.stats.inc_value(CALLBACK_STAT.format(name, 'wall_seconds'), wall)
+        self.stats.inc_value(CALLBACK_STAT.format(name, 'cpu_seconds'), cpu)
+
+    def process_spider_output(self, response, result):
+        name = self.callback_name(response)
+        self.stats.inc_value(CALLBACK_STAT.format(name, 'calls'))
+        self.sample_queue()
+        output = iter(result)
+        while True:
+            wall, cpu = time.perf_counter(), time.thread_time()
+            try:
+                value = next(output)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - wall, time.thread_time() - cpu)
+                return
+            self.add_time(name, time.perf_counter() - wall, time.thread_time() - cpu)
+            yield value
+
+    async def process_spider_output_async(self, response, result):
+        name = self.callback_name(response)
+        self.stats.inc_value(CALLBACK_STAT.format(name, 'calls'))
+        self.sample_queue()
+        output = result.__aiter__()
+        while True:
+            wall, cpu = time.perf_counter(), time.thread_time()
+            waited = pool_wait(response)
+            try:
+                value = await output.__anext__()
+            except StopAsyncIteration:
+                self.add_step(name, response, wall, cpu, waited)
+                return
+            self.add_step(name, response, wall, cpu, waited)
+            yield value
+
+    def add_step(self, name, response, wall, cpu, waited):
+        """Adds the time of a step of an async callback, less what it spent awaiting the pool."""
+        wall_waited, cpu_waited = pool_wait(response)
+        self.add_time(name, time.perf_counter() - wall - (wall_waited - waited[0]),
+                      time.thread_time() - cpu - (cpu_waited - waited[1]))
+
+
+class XPathTimer():
+    """
+    Adds up the time spent in the functions that evaluate XPaths, see xpath_targets. They are
+    wrapped by start and put back by stop.
+    """
+
+    def __init__(self, targets):
+        self.targets = targets  # (object, attribute name) of each function to time
+        self.originals = []
+        self.seconds = 0
+        self.calls = 0
+
+    def wrap(self, function):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - start
+                self.calls += 1
+        return timed
+
+    def start(self):
+        for owner, name in self.targets:
+            original = getattr(owner, name)
+            self.originals.append((owner, name, original))
+            setattr(owner, name, self.wrap(original))
+
+    def stop(self):
+        for owner, name, original in reversed(self.originals):
+            setattr(owner, name, original)
+        self.originals = []
+
+
+def xpath_targets():
+    """
+    The functions that evaluate XPaths: parsel's Selector.xpath, used by response.xpath and the
+    'parsel' selector backend, the nodes, all and first of the 'lxml' backend (see xpaths.py),
+    and rapports.extract_payouts and partants.extract_runners, which run precompiled lxml XPaths.
+    """
+    from parsel import Selector
+    import parsing
+    import rapports
+    from xpaths import LxmlSelectors
+
+    return [
+        (Selector, 'xpath'),
+        (LxmlSelectors, 'nodes'),
+        (LxmlSelectors, 'all'),
+        (LxmlSelectors, 'first'),
+        (rapports, 'extract_payouts'),
+        (parsing, 'extract_runners')  # Imported by name, so timed where it is called
+    ]
+
+
+def stats_values(stats):
+    """Scrapy's stats, with datetimes as ISO strings so they can go in JSON."""
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in sorted(stats.items())
+    }
+
+
+def metric_name(key):
+    """E.g. 'downloader/response_bytes' -> 'downloader_response_bytes'."""
+    return ''.join(c if c.isalnum() else '_' for c in key).strip('_').lower()
+
+
+def to_prometheus(metrics, prefix='geny'):
+    """Returns the figures of metrics in the Prometheus text format, one gauge per figure."""
+    lines = []
+
+    def gauge(name, value, labels=''):
+        lines.append(f'# TYPE {prefix}_{name} gauge')
+        lines.append(f'{prefix}_{name}{labels} {value}')
+
+    for field in ('calls', 'wall_seconds', 'cpu_seconds'):
+        lines.append(f'# TYPE {prefix}_callback_{field} gauge')
+        for callback, timing in sorted(metrics['callbacks'].items()):
+            lines.append(f'{prefix}_callback_{field}{{callback="{callback}"}} {timing[field]}')
+    for field in WORKER_FIELDS:
+        lines.append(f'# TYPE {prefix}_worker_{field} gauge')
+        for kind, timing in sorted(metrics.get('workers', {}).items()):
+            lines.append(f'{prefix}_worker_{field}{{kind="{kind}"}} {timing[field]}')
+    for name, value in metrics.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            gauge(metric_name(name), value)
+    if 'tracemalloc' in metrics:
+        gauge('tracemalloc_peak_bytes', metrics['tracemalloc']['peak_bytes'])
+    for key, value in metrics['stats'].items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            gauge(f'scrapy_{metric_name(key)}', value)
+    return '\n'.join(lines) + '\n'
+
+
+class CrawlMetrics():
+    """
+    Extension writing the figures of a crawl to prefix.json and prefix.prom when the spider
+    closes, with the setting GENY_METRICS=prefix. See the top of this file.
+    """
+
+    def __init__(self, crawler, prefix, trace_memory=False):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.prefix = prefix
+        self.trace_memory = trace_memory
+        self.xpath_timer = None
+        self.started = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        prefix = crawler.settings.get('GENY_METRICS')
+        if not prefix:
+            raise NotConfigured
+        extension = cls(crawler, prefix, crawler.settings.getbool('GENY_METRICS_TRACEMALLOC'))
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        self.xpath_timer = XPathTimer(xpath_targets())
+        self.xpath_timer.start()
+        if self.trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+        self.started = time.perf_counter()
+
+    def spider_closed(self, spider, reason):
+        self.xpath_timer.stop()
+        elapsed = time.perf_counter() - self.started
+        metrics = self.collect(elapsed)
+        if self.trace_memory:
+            metrics['tracemalloc'] = self.memory_snapshot()
+        metrics['stats'] = stats_values(self.stats.get_stats())
+
+        folder = os.path.dirname(self.prefix)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(f'{self.prefix}.json', 'w', encoding='utf-8') as f:
+            json.dump(metrics, f, indent=2, default=str)
+        with open(f'{self.prefix}.prom', 'w', encoding='utf-8') as f:
+            f.write(to_prometheus(metrics))
+        spider.logger.info(f'Crawl metrics written to {self.prefix}.json and {self.prefix}.prom '
+                           f'(parse {metrics["parse_share"]:.0%} of the crawl time)')
+
+    def collect(self, elapsed):
+        stats = self.stats
+        callbacks, workers = {}, {}
+        for key, value in stats.get_stats().items():
+            parts = key.split('/')
+            if len(parts) == 4 and parts[:2] == ['geny', 'callback']:
+                timing = callbacks.setdefault(parts[2], {'calls': 0, 'wall_seconds': 0,
+                                                         'cpu_seconds': 0})
+                timing[parts[3]] = value
+            elif len(parts) == 4 and parts[:2] == ['geny', 'worker']:
+                timing = workers.setdefault(parts[2], dict.fromkeys(WORKER_FIELDS, 0))
+                timing[parts[3]] = value
+        parse_seconds = sum(timing['wall_seconds'] for timing in callbacks.values())
+        return {
+            'elapsed_seconds': elapsed,
+            'callbacks': callbacks,
+            'parse_seconds': parse_seconds,
+            'parse_share': parse_seconds / elapsed if elapsed else 0,  # The rest is mostly waiting
+            # Time in the parse pool's workers, alongside the reactor with --parse-workers
+            'workers': workers,
+            'worker_seconds': sum(timing['wall_seconds'] for timing in workers.values()),
+            'worker_cpu_seconds': sum(timing['cpu_seconds'] for timing in workers.values()),
+            # The reactor's, and the worker processes' as timed there
+            'xpath_seconds': self.xpath_timer.seconds + sum(timing['xpath_seconds']
+                                                            for timing in workers.values()),
+            'xpath_calls': self.xpath_timer.calls,
+            'response_bytes': stats.get_value('downloader/response_bytes', 0),
+            'request_bytes': stats.get_value('downloader/request_bytes', 0),
+            'responses': stats.get_value('downloader/response_count', 0),
+            'queue_depth_max': stats.get_value('geny/scheduler/queue_depth_max', 0),
+            'join_backlog_max': stats.get_value('geny/join/backlog_max', 0),
+            'join_unmatched': stats.get_value('geny/join/unmatched', 0)
+        }
+
+    @staticmethod
+    def memory_snapshot(top=10):
+        import tracemalloc
+
+        current, peak = tracemalloc.get_traced_memory()
+        lines = tracemalloc.take_snapshot().statistics('lineno')[:top]
+        tracemalloc.stop()
+        return {
+            'current_bytes': current,
+            'peak_bytes': peak,
+            'top': [{'line': str(stat.traceback), 'bytes': stat.size, 'count': stat.count}
+                    for stat in lines]
+        }
@@ -0,0 +1,158 @@
+"""
+Normalisation of the scraped values into numbers, and pandas DataFrames of results.
+
+The rows are kept as scraped, so the Excel files look like the site (payouts such as '5,20' are
+text, '' is missing). normalise turns a RaceResult into typed values: payouts as floats (NaN when
+missing, the decimal comma handled) or Decimals, arrivees and other counts as ints (None when
+missing). to_frame and load_frame give the results as a DataFrame with these dtypes, so analysis
+can run vectorised. E.g.
+    from normalise import load_frame
+    frame = load_frame('parquet/', '2018-07-01', '2018-07-31')
+    frame.groupby('discipline')['gagnant'].mean()
+Frames need pandas ("pip install pandas"), and pyarrow for Parquet files.
+"""
+
+import glob
+import math
+import os
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from records import ARRIVEES, COLUMNS, PAYOUTS
+
+INT_COLUMNS = ['reunion', 'course', 'partants', *ARRIVEES]
+TEXT_COLUMNS = ['race_id', 'day', 'heure', 'hippo', 'discipline', 'ecurie']
+
+
+def parse_int(value):
+    """Returns value as an int, or None if it isn't one (e.g. '' for a missing arrivee)."""
+    if isinstance(value, int):
+        return value
+    digits = re.sub(r'\D', '', str(value))
+    return int(digits) if digits else None
+
+
+def parse_payout(value):
+    """Returns a payout such as '5,20', '1 254,20 €' or 3 as a Decimal, or None if missing."""
+    if isinstance(value, int):
+        return Decimal(value)
+    value = re.sub(r'[\s€]', '', str(value)).replace(',', '.')
+    try:
+        return Decimal(value) if value else None
+    except InvalidOperation:
+        return None
+
+
+def parse_float(value):
+    """Same as parse_payout, but as a float, NaN if missing."""
+    if value is None:
+        return math.nan
+    if isinstance(value, (int, float, Decimal)):
+        return float(value)
+    payout = parse_payout(value)
+    return float(payout) if payout is not None else math.nan
+
+
+def parse_date(value, day):
+    """Returns the DD/MM/YYYY date of a row, or else the YYYY-MM-DD day it was crawled for."""
+    try:
+        return datetime.strptime(value, '%d/%m/%Y').date()
+    except (TypeError, ValueError):
+        return datetime.strptime(day, '%Y-%m-%d').date()
+
+
+def normalise(result, decimal=False):
+    """
+    Returns a RaceResult's values as a dict of race_id, day and every column, typed. Payouts are
+    floats (NaN when missing), or Decimals (None when missing) if decimal is True.
+    """
+    payout = parse_payout if decimal else parse_float
+    typed = {
+        'race_id': result.race_id,
+        'day': result.day,
+        'date': parse_date(result.date, result.day),
+        'heure': result.heure or None,
+        'hippo': result.hippo or None,
+        'discipline': result.discipline or None,
+        'ecurie': str(result.ecurie) if result.ecurie != '' else None
+    }
+    for column in INT_COLUMNS:
+        typed[column] = parse_int(getattr(result, column))
+    for column in PAYOUTS:
+        typed[column] = payout(getattr(result, column))
+    return typed
+
+
+def frame_dtypes(frame):
+    """Gives a frame of results its dtypes: nullable Int16 counts, float64 payouts."""
+    import pandas
+
+    frame['date'] = pandas.to_datetime(frame['date'])
+    for column in INT_COLUMNS:
+        frame[column] = frame[column].astype('Int16')
+    for column in PAYOUTS:
+        frame[column] = frame[column].map(parse_float).astype('float64')
+    for column in TEXT_COLUMNS:
+        if column in frame:
+            frame[column] = frame[column].astype('string')
+    return frame
+
+
+def to_frame(results):
+    """Returns the RaceResults as a DataFrame, one row per race in the order given."""
+    import pandas
+
+    frame = pandas.DataFrame(
+        [normalise(result) for result in results],
+        columns=['race_id', 'day'] + list(COLUMNS)
+    )
+    return frame_dtypes(frame)
+
+
+def days_between(day, start, end):
+    return (start is None or day >= start) and (end is None or day <= end)
+
+
+def partitions(folder, extension, start=None, end=None):
+    """Returns the (day, path) of the YYYY-MM-DD<extension> files of a folder from start to end."""
+    days = []
+    for path in sorted(glob.glob(os.path.join(folder, f'*{extension}'))):
+        day = os.path.basename(path)[:-len(extension)]
+        if days_between(day, start, end):
+            days.append((day, path))
+    return days
+
+
+def load_frame(source, start=None, end=None):
+    """
+    Returns the results of the YYYY-MM-DD days from start to end (both optional, inclusive) as
+    a DataFrame, sorted by day, reunion and course. source is a folder of Parquet files written
+    by ParquetWriter (-a parquet=folder), a dataset folder written by DatasetWriter
+    (-a dataset=folder), or a JSON lines file written by JsonLinesWriter (-a jsonl=file,
+    backfill.py or watch.py).
+    """
+    import pandas
+    from writers import read_json_lines
+
+    if os.path.isdir(source) and glob.glob(os.path.join(source, '*.jsonl')):
+        # Only the days asked for are read
+        frame = to_frame(
+            result for _, path in partitions(source, '.jsonl', start, end)
+            for result in read_json_lines(path)
+        )
+    elif os.path.isdir(source):
+        frames = []
+        for day, path in partitions(source, '.parquet', start, end):
+            frame = pandas.read_parquet(path)
+            frame.insert(1, 'day', day)
+            frames.append(frame)
+        if frames:
+            frame = frame_dtypes(pandas.concat(frames, ignore_index=True))
+        else:
+            frame = to_frame([])
+    else:
+        frame = to_frame(
+            result for result in read_json_lines(source) if days_between(result.day, start, end)
+        )
+    return frame.sort_values(['day', 'reunion', 'course'], ignore_index=True)
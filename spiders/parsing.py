@@ -0,0 +1,99 @@
+"""
+Extraction of the records of a page, on the reactor thread or in a pool of threads or processes.
+
+Parsing and XPaths run wherever the callbacks run, which is the reactor thread, so while a page
+is being parsed no download is started or finished. With "-a parse_workers=4" the spider
+instead hands each response's body to a ParsePool and awaits the records, the reactor carrying
+on with the downloads meanwhile. "-a parse_pool=process" uses processes rather than threads,
+for when the GIL holds the threads back. The records of a page come back in the same order as
+they would inline, and halves are still paired up by race id in RaceJoinPipeline, so the rows
+are the same (bench_pool.py checks this, and reports the pages/sec of each pool size).
+The pool needs Scrapy's asyncio reactor, the default since Scrapy 2.13.
+"""
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from scrapy.http import HtmlResponse
+
+from partants import extract_runners, extract_stats
+from rapports import extract_race_payouts
+
+POOLS = ('thread', 'process')
+WORKER_XPATHS = None  # XPathTimer of a worker process, see start_worker
+
+
+def extract(kind, response, day, runners=False, selectors='parsel'):
+    """
+    Returns what the spider needs of a page: the links of its races for a races listing
+    ('races'), else its RaceStats (then its RunnerRecords if runners) or its RacePayouts.
+    selectors is the backend running the XPaths, see xpaths.py.
+    """
+    if kind == 'races':
+        from geny_scrape import GenyScrapeSpider
+        return GenyScrapeSpider.race_links(response, selectors)
+    if kind == 'pronostics':
+        records = [extract_stats(response, day, selectors)]
+        if runners:
+            records += extract_runners(response, day)
+        return records
+    return [extract_race_payouts(response, day, selectors)]
+
+
+def start_worker():
+    """
+    Starts a worker process of the pool timing its XPaths, which the crawl's XPathTimer (see
+    metrics.py) can't see from the reactor's process.
+    """
+    global WORKER_XPATHS
+    from metrics import XPathTimer, xpath_targets
+
+    WORKER_XPATHS = XPathTimer(xpath_targets())
+    WORKER_XPATHS.start()
+
+
+def extract_body(kind, url, body, encoding, day, runners=False, selectors='parsel'):
+    """
+    extract on a page given as its body, which is what is sent to the pool's workers. Returns
+    the records, and the wall, CPU and XPath seconds the worker took. XPath seconds are only
+    measured in worker processes, a worker thread's being counted by the crawl's XPathTimer.
+    """
+    xpaths = WORKER_XPATHS.seconds if WORKER_XPATHS is not None else 0
+    wall, cpu = time.perf_counter(), time.thread_time()
+    records = extract(kind, HtmlResponse(url=url, body=body, encoding=encoding), day, runners,
+                      selectors)
+    timing = (time.perf_counter() - wall, time.thread_time() - cpu,
+              WORKER_XPATHS.seconds - xpaths if WORKER_XPATHS is not None else 0)
+    return records, timing
+
+
+class ParsePool():
+    """A pool of worker threads (kind='thread') or processes (kind='process') running extract."""
+
+    def __init__(self, kind='thread', workers=4):
+        if kind not in POOLS:
+            raise ValueError(f'Not a valid parse pool: {kind}')
+        self.kind = kind
+        self.workers = workers
+        if kind == 'thread':
+            self.executor = ThreadPoolExecutor(workers, thread_name_prefix='geny-parse')
+        else:
+            # Spawned, as forking a process with the reactor's threads running isn't safe
+            self.executor = ProcessPoolExecutor(workers,
+                                                mp_context=multiprocessing.get_context('spawn'),
+                                                initializer=start_worker)
+
+    def __repr__(self):
+        return f'ParsePool: {self.workers} {self.kind}s'
+
+    async def extract(self, kind, response, day, runners=False, selectors='parsel'):
+        """Awaits extract_body of a response in the pool, returning the records and timings."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, extract_body, kind, response.url, response.body, response.encoding,
+            day, runners, selectors
+        )
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
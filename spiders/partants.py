@@ -0,0 +1,152 @@
+"""
+Extraction of a race's stats, and of its runners, from its www.geny.com partants page, shared by
+GenyScrapeSpider.parse_pronostics and api.py.
+
+The runners table is found once and walked row by row over the lxml elements, each cell being
+picked by the column its heading is in, rather than running an XPath per runner and field.
+"""
+
+import re
+
+from lxml import etree
+
+from records import RaceStats, RunnerRecord
+from xpaths import backend
+
+RUNNERS_TABLE = etree.XPath('//table[@id="tableau_partants"]')
+# Field of a RunnerRecord for each heading of the runners table. Headings depend on the
+# discipline, e.g. Poids and Jockey for Plat, Dist. and Driver for trotting races.
+HEADINGS = {
+    'N°': 'numero',
+    'Cheval': 'cheval',
+    'SA': 'sexe_age',
+    'Poids': 'poids',
+    'Dist.': 'distance',
+    'Poids/Dist.': 'poids',
+    'Jockey': 'jockey',
+    'Driver': 'jockey',
+    'Jockey/Driver': 'jockey',
+    'Entraîneur': 'entraineur',
+    'Cote': 'cote'
+}
+SPACE = re.compile(r'\s+')
+
+
+def cell_text(element):
+    return SPACE.sub(' ', ''.join(element.itertext())).strip()
+
+
+def as_number(text):
+    """'58' -> 58, other text is kept as it is, like the payouts of a rapports page."""
+    return int(text) if text.isdigit() else text
+
+
+def extract_runners(response, day):
+    """
+    Returns a RunnerRecord for every row of the runners table of a partants page, in table
+    order, day being the YYYY-MM-DD it is scraped for.
+    """
+    race_id = response.url.split('/')[4].split('-')[-1]  # Same as extract_stats
+    tables = RUNNERS_TABLE(response.selector.root)
+    if not tables:
+        return []
+    table = tables[0]
+    fields = [HEADINGS.get(cell_text(heading)) for heading in table.iterfind('thead/tr/th')]
+
+    runners = []
+    for row in table.iterfind('tbody/tr'):
+        values = {'poids': '', 'distance': ''}
+        for field, cell in zip(fields, row.iterfind('td')):
+            if field is not None:
+                values[field] = cell_text(cell)
+        if not values.get('numero', '').isdigit():
+            continue  # E.g. a row saying a runner has been withdrawn
+        runners.append(RunnerRecord(
+            race_id,
+            day,
+            int(values['numero']),
+            values.get('cheval', ''),
+            values.get('sexe_age', ''),
+            as_number(values['poids']),
+            as_number(values['distance']),
+            values.get('jockey', ''),
+            values.get('entraineur', ''),
+            as_number(values.get('cote', ''))
+        ))
+    return runners
+
+
+def extract_stats(response, day, selectors='parsel'):
+    """
+    Returns the RaceStats of a partants page, day being the YYYY-MM-DD it is scraped for.
+    selectors is the backend running the XPaths, see xpaths.py.
+    """
+    select = backend(selectors)
+    root = select.root(response)
+    try:
+        """Splits URL up so that date from URL can be easily extracted.
+           Example: http://www.geny.com/partants-pmu/
+                    2018-07-30-clairefontaine-deauville-pmu-prix-de-la-cote-de-nacre_c991181
+        """
+        end_url = response.url.split('/')[4].split('-')
+        date = f'{end_url[2]}/{end_url[1]}/{end_url[0]}'
+    except IndexError:
+        # Needed incase the date cannot be found
+        date = ''
+    hour = select.first(root, '//span[@class="infoCourse"]/strong/text()')
+    if 'h' not in hour:
+        # Cheaks if time is in correct format
+        hour = ''
+    hippo = select.first(root, '//div[@id="navigation"]/a[3]/text()')
+    try:
+        reunion = select.first(
+            root,
+            '//div[@id="navigation"]'
+            '/a[3]/@href'
+        ).split('#')[1].replace('reunion', 'R')
+    except IndexError:
+        reunion = ''
+    for i in range(1, 6):
+        # The main text of info can change in terms of its XPATH reference
+        meta_text = select.first(root, '//span[@class="infoCourse"]/text()[$i]', i=i)
+        if meta_text.count('-') >= 4 and '\xa0' in meta_text:
+            # Reliable way of finding the correct index for the main bit of text
+            break
+        if i == 6:
+            # If by this point the main text hasn't been found, there is an error
+            meta_text = ''
+    try:
+        meta_text = meta_text.split('\xa0')[0]
+        meta_text = ''.join([c.strip() for c in meta_text])
+        meta_text = meta_text[:-1]
+        if meta_text == 'Attelé' or meta_text == 'Monté':
+            discipline = 'T'
+        elif meta_text == 'Plat':
+            discipline = 'P'
+        elif meta_text == 'Haies' or meta_text == 'Steeple-chase':
+            discipline = 'O'
+        else:
+            discipline = ''
+    except IndexError:
+        discipline = ''
+    try:
+        course = select.first(root, '//div[@class="yui-u first nomCourse"]'
+                                    '//strong/text()[1]').strip()
+        # Removed any non digits in the case that something is not scraped correctly
+        course = ''.join([c for c in course if c.isdigit()])
+    except TypeError:
+        course = ''
+    partpants = select.first(root, '//div[@class="yui-content"]'
+                                   '//tbody/tr[last()]/td[1]/text()')
+
+    return RaceStats(
+        end_url[-1],
+        day,
+        date,
+        hour,
+        reunion,
+        hippo,
+        discipline,
+        int(course),
+        int(partpants)
+    )
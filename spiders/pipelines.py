@@ -0,0 +1,87 @@
+"""
+Item pipelines of GenyScrapeSpider.
+"""
+
+from records import RacePayouts, RaceResult, RaceStats
+
+
+class RaceJoin():
+    """
+    Joins the stats and payouts halves of each race, keyed on the race id (the end of the race's
+    URL). A RaceResult is returned as soon as both halves have arrived, so only races that are
+    still in flight are held in memory.
+    """
+
+    def __init__(self):
+        self.stats = {}  # Race id -> RaceStats waiting for its payouts
+        self.payouts = {}  # Race id -> RacePayouts waiting for its stats
+
+    def __len__(self):
+        return len(self.stats) + len(self.payouts)
+
+    def add_stats(self, stats):
+        """Adds a RaceStats. Returns the RaceResult if the payouts are already in."""
+        payouts = self.payouts.pop(stats.race_id, None)
+        if payouts is None:
+            self.stats[stats.race_id] = stats
+            return None
+        return RaceResult.from_halves(stats, payouts)
+
+    def add_payouts(self, payouts):
+        """Adds a RacePayouts. Returns the RaceResult if the stats are already in."""
+        stats = self.stats.pop(payouts.race_id, None)
+        if stats is None:
+            self.payouts[payouts.race_id] = payouts
+            return None
+        return RaceResult.from_halves(stats, payouts)
+
+    def unmatched(self):
+        """Returns the race ids of the halves that never found their other half."""
+        return {
+            'pronostics': sorted(self.stats),
+            'rapports': sorted(self.payouts)
+        }
+
+
+class RaceJoinPipeline():
+    """
+    Pairs up the halves of each race, handing every RaceResult to the spider's race_completed.
+    In a crawl the spider is the crawler's. Outside one (e.g. archive.py's replay) it is given.
+    """
+
+    def __init__(self, spider=None):
+        self.join = RaceJoin()
+        self.crawler = None
+        self.spider = spider
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls()
+        pipeline.crawler = crawler
+        return pipeline
+
+    def current_spider(self):
+        return self.crawler.spider if self.crawler is not None else self.spider
+
+    def process_item(self, item):
+        if isinstance(item, RaceStats):
+            result = self.join.add_stats(item)
+        elif isinstance(item, RacePayouts):
+            result = self.join.add_payouts(item)
+        else:
+            return item
+        if result is not None:
+            self.current_spider().race_completed(result)
+        if self.crawler is not None:
+            # Halves waiting for their other half, see metrics.py
+            self.crawler.stats.max_value('geny/join/backlog_max', len(self.join))
+        return item
+
+    def close_spider(self):
+        for half, race_ids in self.join.unmatched().items():
+            if self.crawler is not None:
+                self.crawler.stats.inc_value('geny/join/unmatched', len(race_ids))
+            if race_ids:
+                self.current_spider().logger.warning(
+                    f'{len(race_ids)} races only have their {half} half: {", ".join(race_ids)}'
+                )
@@ -0,0 +1,254 @@
+"""
+Single pass extraction of the PMU payouts from a www.geny.com rapports page.
+
+Every rapports table (lesSolos, lesDuos, lesTrios and lesQuartos) is found once and the rows of
+its PMU block are walked once into a bet type -> payout mapping, rather than searching the whole
+document again for every payout. extract_race_payouts adds the arrivees and cleans the payouts
+into a RacePayouts.
+"""
+
+import re
+
+from lxml import etree
+
+from records import RacePayouts
+from xpaths import backend
+
+RAPPORTS_TABLES = etree.XPath('//table[@id="lesSolos" or @id="lesDuos" or '
+                              '@id="lesTrios" or @id="lesQuartos"]')
+PMU_CELLS = etree.XPath('.//tr/td[*//i[text() = "PMU"]]')
+PMU_ROWS = etree.XPath('.//tr/td[*//i[text() = "PMU"]]//tr')
+# Where the bet type of a row is written, e.g. Gagnant, Placé, Ordre are in a div of a cell
+# and Super 4 is a whole cell
+BET_TYPE_ELEMENTS = {
+    'div': etree.XPath('*//div'),
+    'cell': etree.XPath('*')
+}
+PAYOUT = etree.XPath('td[2]//text()')
+BOLD_PAYOUT = etree.XPath('td[2]//b/text()')
+DESORDRE = etree.XPath('table[1]//tr[2]/td[2]/b/text()')
+ECURIE = etree.XPath('div/span/text()')
+
+# XPath's normalize-space() only treats these as white space (so not '\xa0')
+XPATH_SPACE = re.compile('[ \t\r\n]+')
+
+
+def normalize_space(element):
+    """Same as XPath's normalize-space() on an element."""
+    return XPATH_SPACE.sub(' ', ''.join(element.itertext())).strip(' ')
+
+
+def first(results):
+    return str(results[0]) if results else None
+
+
+class RapportsTables():
+    """
+    The PMU blocks of the rapports tables of a page, keyed by table id.
+
+    The page is only searched once for the tables. The rows of a table's PMU block are then
+    walked once into a bet type -> rows mapping, the first time one of its payouts is asked for.
+    A row is looked up the same way as the XPath 'tr[*//div[normalize-space() = "Placé"]][2]',
+    i.e. the second matching row of its parent table, the first of those in document order.
+    """
+
+    def __init__(self, response):
+        self.tables = {}  # Table id -> tables in document order
+        for table in RAPPORTS_TABLES(response.selector.root):
+            self.tables.setdefault(table.get('id'), []).append(table)
+        self.bets = {}  # (table id, kind) -> {bet type: {position: row}}
+
+    def cells(self, table_id):
+        """PMU cells of a table in document order."""
+        return [cell for table in self.tables.get(table_id, []) for cell in PMU_CELLS(table)]
+
+    def walk(self, table_id, kind):
+        """Walks all the rows of the PMU cells of a table once, recording their bet types."""
+        bets = {}
+        seen = set()
+        counts = {}  # (bet type, parent) -> matching rows so far
+        bet_type_elements = BET_TYPE_ELEMENTS[kind]
+        for table in self.tables.get(table_id, []):
+            for row in PMU_ROWS(table):
+                if row in seen:
+                    continue  # Already walked as part of an earlier table with the same id
+                seen.add(row)
+                parent = row.getparent()
+                for bet_type in {normalize_space(e) for e in bet_type_elements(row)}:
+                    position = counts.get((bet_type, parent), 0) + 1
+                    counts[(bet_type, parent)] = position
+                    bets.setdefault(bet_type, {}).setdefault(position, row)
+        return bets
+
+    def row(self, table_id, bet_type, position=1, kind='div'):
+        if (table_id, kind) not in self.bets:
+            self.bets[(table_id, kind)] = self.walk(table_id, kind)
+        return self.bets[(table_id, kind)].get(bet_type, {}).get(position)
+
+    def payout(self, table_id, bet_type, position=1, kind='div', bold=False):
+        """
+        Returns the payout of the position-th row of a bet type, or None if there isn't one.
+        Some payouts (e.g. Gagnant) are only the text in bold.
+        """
+        row = self.row(table_id, bet_type, position, kind)
+        if row is None:
+            return None
+        return first(BOLD_PAYOUT(row) if bold else PAYOUT(row))
+
+    def first_in_cells(self, table_id, xpath):
+        """Returns the first result of an XPath from the PMU cells of a table."""
+        for cell in self.cells(table_id):
+            result = first(xpath(cell))
+            if result is not None:
+                return result
+        return None
+
+    def desordre(self):
+        return self.first_in_cells('lesTrios', DESORDRE)
+
+    def ecurie(self):
+        return self.first_in_cells('lesSolos', ECURIE)
+
+
+def extract_payouts(response, partpants):
+    """
+    Returns the raw payouts of a rapports page, in the order of the Excel columns:
+    GAGNANT, GAGNANT PLACE, PLACE, PLACE, CG, CO, CP1, CP2, CP3, Désordre, Ordre, SUPER4, Ecurie.
+    Payouts that couldn't be found are None, or '' when they don't apply to the number of runners.
+
+    Example First Table (lesSolos):
+    +-------+---------+------+
+    | Index |         |      |
+    +-------+---------+------+
+    | 1     | Gagnant | 5,20 |
+    +-------+---------+------+
+    | 2     | Placé   | 1,80 |
+    +-------+---------+------+
+    | 3     | Placé   | 3,50 |
+    +-------+---------+------+
+    | 4     | Placé   | 2,20 |
+    +-------+---------+------+
+
+    Example Second Table (lesDuos):
+    +-------+---------+-------+
+    | Index |         |       |
+    +-------+---------+-------+
+    | 1     | Gagnant | 5,20  |
+    +-------+---------+-------+
+    | 2     | Placé   | 1,80  |
+    +-------+---------+-------+
+    | 3     | Placé   | 3,50  |
+    +-------+---------+-------+
+    | 4     | Placé   | 2,20  |
+    +-------+---------+-------+
+    |       |         |       |
+    +-------+---------+-------+
+    | 5     | Ordre   | 47,80 |
+    +-------+---------+-------+
+    """
+    tables = RapportsTables(response)
+
+    CG = ''
+    CP1 = ''
+    CP2 = ''
+    CP3 = ''
+    Ordre = ''
+    SUPER4 = ''
+
+    GAGNANT = tables.payout('lesSolos', 'Gagnant', bold=True)
+    GAGNANT_PLACE = tables.payout('lesSolos', 'Placé', 1)
+    PLACE1 = tables.payout('lesSolos', 'Placé', 2)
+    PLACE2 = tables.payout('lesSolos', 'Placé', 3)
+
+    ecurie = tables.ecurie()
+    if ecurie is not None:
+        ecurie = re.sub('\xa0', '', ecurie)  # Cleans encoding
+        ecurie = re.sub('Ecurie : ', '', ecurie)  # Makes the "ecuire" numbers easier to read
+
+    if partpants > 7:
+        CG = tables.payout('lesDuos', 'Gagnant', bold=True)
+        CP1 = tables.payout('lesDuos', 'Placé', 1)
+        CP2 = tables.payout('lesDuos', 'Placé', 2)
+        CP3 = tables.payout('lesDuos', 'Placé', 3)
+
+    Désordre = tables.desordre()
+    CO = tables.payout('lesDuos', 'Ordre')
+
+    if partpants < 8:
+        Ordre = tables.payout('lesTrios', 'Ordre')
+        SUPER4 = tables.payout('lesQuartos', 'Super 4', kind='cell')
+
+    return [
+        GAGNANT,
+        GAGNANT_PLACE,
+        PLACE1,
+        PLACE2,
+        CG,
+        CO,
+        CP1,
+        CP2,
+        CP3,
+        Désordre,
+        Ordre,
+        SUPER4,
+        ecurie
+    ]
+
+
+def extract_race_payouts(response, day, selectors='parsel'):
+    """
+    Returns the RacePayouts of a rapports page, day being the YYYY-MM-DD it is scraped for.
+    Shared by GenyScrapeSpider.parse_rapports and api.py. selectors is the backend running the
+    XPaths of the arrivees, see xpaths.py.
+    """
+    end_url = response.url.split('/')[4].split('-')
+    select = backend(selectors)
+    root = select.root(response)
+
+    try:
+        partpants = select.all(root, '//table[@id="arrivees"]//tr/td[2]/text()')
+        # Cleans text and gets rid of any non digit entries
+        partpants = [
+            int(partpant.strip())
+            for partpant in partpants
+            if partpant.strip().isdigit()
+        ]
+        partpants = max(partpants)
+    except (IndexError, ValueError):
+        # E.g. a page served before its arrivees are filled in
+        partpants = 0  # Needs to be ten to satisfy the data type of the if statement later on
+    try:
+        arrivees = select.all(
+            root, '//table[@id="arrivees"]//tr[td[1]//text() <= 4]/td[2]/text()'
+        )
+        arrivees = [int(arrivee.strip()) for arrivee in arrivees]
+        if len(arrivees) > 4:
+            arrivees = arrivees[0:4]  # Deals with any draws that may occur
+        elif len(arrivees) < 4:
+            while len(arrivees) < 4:
+                arrivees.append('')
+        # Fills out the arrivees list, if it's not 4 in length
+    except (IndexError, ValueError):
+        arrivees = ['', '', '', '']
+
+    # Every payout from the PMU blocks of the rapports tables, in one pass over the page
+    data = extract_payouts(response, partpants)
+
+    data = [
+        ''
+        if d is None
+        else d
+        for d in data
+    ]
+    # Converts XPaths that couldn't be found to empty strings
+    data = [d.strip() for d in data]
+    # Cleans all strings
+
+    data = [re.sub(' €', '', d) for d in data]
+    # Gets rid of Euro sign and spaces
+    data = [re.sub(',00', '', d) for d in data]
+    # Replaces for example 3,00 with 3
+    data = [int(d) if d.isdigit() else d for d in data]
+    # Converts strings that are ints, to ints, so Excel doesn't show errors
+
+    return RacePayouts(end_url[-1], day, *arrivees, *data)
@@ -0,0 +1,199 @@
+"""
+Typed records of a race, yielded by the spider's callbacks as Scrapy items.
+
+RaceStats is the half scraped by parse_pronostics, RacePayouts the half scraped by parse_rapports.
+RaceJoinPipeline (see pipelines.py) joins them into a RaceResult. RunnerRecords are the runners
+of a race, also from its partants page. RaceStats interns the day, date, heure, reunion and
+hippo, which the races of a day share but each page parses into strings of its own. That is most
+of what a big backfill saves over rows of lists: __slots__ take a little less than lists for the
+halves, about as much for RaceResults, which also keep the race id, see bench_records.py.
+"""
+
+import sys
+from dataclasses import dataclass
+
+# Columns of a RaceResult row, in the order of the Excel columns
+COLUMNS = (
+    'date',
+    'heure',
+    'reunion',
+    'hippo',
+    'discipline',
+    'course',
+    'partants',
+    'arrivee_1',
+    'arrivee_2',
+    'arrivee_3',
+    'arrivee_4',
+    'gagnant',
+    'gagnant_place',
+    'place_1',
+    'place_2',
+    'cg',
+    'co',
+    'cp1',
+    'cp2',
+    'cp3',
+    'trio_desordre',
+    'trio_ordre',
+    'super4',
+    'ecurie'
+)
+ARRIVEES = COLUMNS[7:11]
+PAYOUTS = COLUMNS[11:23]
+
+
+def intern(value):
+    """The interned copy of a string, other values (e.g. None, from a missing XPath) as they are."""
+    return sys.intern(value) if type(value) is str else value
+
+
+@dataclass(slots=True)
+class RaceStats:
+    """The stats of a race from its partants page."""
+    race_id: str
+    day: str  # YYYY-MM-DD the race was crawled for
+    date: str  # DD/MM/YYYY
+    heure: str
+    reunion: str
+    hippo: str
+    discipline: str
+    course: int
+    partants: int
+
+    def __post_init__(self):
+        # One copy of each for all the races, rather than one a race
+        self.day = intern(self.day)
+        self.date = intern(self.date)
+        self.heure = intern(self.heure)
+        self.reunion = intern(self.reunion)
+        self.hippo = intern(self.hippo)
+
+    def as_row(self):
+        """Values in the order of the Excel columns."""
+        return [
+            self.date,
+            self.heure,
+            self.reunion,
+            self.hippo,
+            self.discipline,
+            self.course,
+            self.partants
+        ]
+
+    @classmethod
+    def from_row(cls, day, row):
+        """Opposite of [race_id] + as_row(), as kept in the crawl journal."""
+        return cls(row[0], day, *row[1:])
+
+
+@dataclass(slots=True)
+class RacePayouts:
+    """The arrivees and the PMU payouts of a race from its rapports page."""
+    race_id: str
+    day: str  # YYYY-MM-DD the race was crawled for
+    arrivee_1: object  # int, or '' when there isn't one
+    arrivee_2: object
+    arrivee_3: object
+    arrivee_4: object
+    gagnant: object  # int for whole euros, else the text e.g. '5,20', '' when missing
+    gagnant_place: object
+    place_1: object
+    place_2: object
+    cg: object
+    co: object
+    cp1: object
+    cp2: object
+    cp3: object
+    trio_desordre: object
+    trio_ordre: object
+    super4: object
+    ecurie: str
+
+    def as_row(self):
+        """Values in the order of the Excel columns."""
+        return [
+            self.arrivee_1,
+            self.arrivee_2,
+            self.arrivee_3,
+            self.arrivee_4,
+            self.gagnant,
+            self.gagnant_place,
+            self.place_1,
+            self.place_2,
+            self.cg,
+            self.co,
+            self.cp1,
+            self.cp2,
+            self.cp3,
+            self.trio_desordre,
+            self.trio_ordre,
+            self.super4,
+            self.ecurie
+        ]
+
+    @classmethod
+    def from_row(cls, day, row):
+        """Opposite of [race_id] + as_row(), as kept in the crawl journal."""
+        return cls(row[0], day, *row[1:])
+
+
+@dataclass(slots=True)
+class RaceResult:
+    """
+    Both halves of a race, flattened into one record so a finished race costs a single object
+    and its halves can be dropped.
+    """
+    race_id: str
+    day: str
+    date: str
+    heure: str
+    reunion: str
+    hippo: str
+    discipline: str
+    course: int
+    partants: int
+    arrivee_1: object
+    arrivee_2: object
+    arrivee_3: object
+    arrivee_4: object
+    gagnant: object
+    gagnant_place: object
+    place_1: object
+    place_2: object
+    cg: object
+    co: object
+    cp1: object
+    cp2: object
+    cp3: object
+    trio_desordre: object
+    trio_ordre: object
+    super4: object
+    ecurie: str
+
+    @classmethod
+    def from_halves(cls, stats, payouts):
+        return cls(stats.race_id, stats.day, *stats.as_row(), *payouts.as_row())
+
+    def as_row(self):
+        """A row of the Excel sheet, see COLUMNS."""
+        return [getattr(self, column) for column in COLUMNS]
+
+    def sort_key(self):
+        """Results are ordered by reunion, then by course."""
+        return self.reunion, self.course
+
+
+@dataclass(slots=True)
+class RunnerRecord:
+    """A runner of a race, from the runners table of its partants page."""
+    race_id: str
+    day: str  # YYYY-MM-DD the race was crawled for
+    numero: int
+    cheval: str
+    sexe_age: str  # The SA column, e.g. 'H5' for a five year old male
+    poids: object  # Weight carried in kg, for Plat and obstacle races, e.g. 58 or '57,5'
+    distance: object  # Distance run in metres, for trotting races, e.g. 2950
+    jockey: str  # Or driver, for trotting races
+    entraineur: str
+    cote: object  # Morning odds, e.g. 12 or '8,5', '' when missing
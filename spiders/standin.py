@@ -0,0 +1,372 @@
+"""
+Local stand-in for www.geny.com, for load testing the crawl (see bench_crawl.py). It makes up
+races listing, partants and rapports pages for any day, in the same markup as the saved pages in
+fixtures/, with as many reunions and races a day as asked for. E.g.
+    python standin.py --port 8080 --reunions 8 --races 8 --latency 50 --errors 0.02
+    python cli.py 30/07/2018 -o test.xlsx --site http://127.0.0.1:8080
+A day's races are made up from the day, so every crawl of it gets the same pages. Each response
+is held back by --latency ms (give or take --jitter ms), and --errors of them (a fraction) are
+503 errors, which Scrapy retries. Pages are gzipped when the request accepts it, as the site
+does, unless --no-compression. GET /standin-stats gives the requests, connections, errors and
+bytes served so far (as sent, so compressed), as JSON.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from corpus import FIXTURES
+
+HIPPOS = ['Vincennes', 'Longchamp', 'Chantilly', 'Deauville', 'Clairefontaine-Deauville',
+          'Auteuil', 'Enghien', 'Cagnes-sur-Mer', 'Vichy', 'Pau', 'Saint-Cloud', 'Lyon-Parilly',
+          'Marseille-Borely', 'Caen', 'Cabourg', 'Laval', 'Nantes', 'Bordeaux', 'Toulouse',
+          'Compiegne']
+NAMES = ['des Sources', 'du Parc', 'de la Cote', 'des Celestins', 'de Normandie', 'du Jockey',
+         'de la Foret', 'des Lilas', 'de Diane', 'du Moulin', 'des Ecuries', "de l'Arc",
+         'de la Seine', 'du Lac', "d'Automne", 'des Haras']
+HORSES = ['Astre', 'Bijou', 'Cerise', 'Duc', 'Eclair', 'Fleur', 'Galop', 'Hermine', 'Iris',
+          'Jade', 'Kalin', 'Lune', 'Mistral', 'Nuage', 'Orage', 'Prince', 'Quartz', 'Rubis']
+PEOPLE = ['M. Abrivard', 'E. Raffin', 'D. Thomain', 'F. Nivard', 'J.-M. Bazire', 'C. Soumillon',
+          'M. Barzalona', 'P.-C. Boudot', 'T. Bachelot', 'O. Peslier', 'A. Fabre', 'F. Head',
+          'J.-C. Rouget', 'Y. Barberot', 'S. Guarato', 'P. Allaire']
+# Discipline written on the partants page, with whether it is a trotting race
+DISCIPLINES = [('Attelé', True), ('Monté', True), ('Plat', False), ('Haies', False),
+               ('Steeple-chase', False)]
+WEEKDAYS = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
+MONTHS = ['janvier', 'février', 'mars', 'avril', 'mai', 'juin', 'juillet', 'août', 'septembre',
+          'octobre', 'novembre', 'décembre']
+
+
+def page_shell():
+    """The head and the foot of a saved page, which every made up page is put between."""
+    with open(os.path.join(FIXTURES, 'reunions-courses-pmu__2018-07-30.html'),
+              encoding='utf-8') as f:
+        page = f.read()
+    head = page[:page.index('  <div id="navigation">')]
+    foot = page[page.index('  <div id="ft">'):]
+    return head[:head.index('<title>')], head[head.index('</title>') + len('</title>'):], foot
+
+
+HEAD, AFTER_TITLE, FOOT = page_shell()
+
+
+def slugify(text):
+    return ''.join(c if c.isalnum() else '-' for c in text.lower()).strip('-')
+
+
+def money(rng, low, high):
+    value = rng.uniform(low, high)
+    return f'{value:,.2f}'.replace(',', ' ').replace('.', ',')
+
+
+class Race():
+    """A made up race, the same every time for the same day, reunion and course."""
+
+    def __init__(self, day, reunion, course):
+        rng = random.Random(f'{day}-{reunion}-{course}')
+        self.day = day
+        self.reunion = reunion
+        self.course = course
+        self.hippo = HIPPOS[(date.fromisoformat(day).toordinal() + reunion) % len(HIPPOS)]
+        self.name = f'Prix {rng.choice(NAMES)}'
+        # Race number of the slug, from which the day, reunion and course can be told
+        self.number = (date.fromisoformat(day).toordinal() % 100000 * 10000 + reunion * 100
+                       + course)
+        self.slug = f'{day}-{slugify(self.hippo)}-pmu-{slugify(self.name)}_c{self.number}'
+        self.heure = f'{12 + course}h{rng.choice(["05", "15", "35", "50"])}'
+        self.discipline, self.trot = rng.choice(DISCIPLINES)
+        self.distance = rng.choice([1600, 2100, 2700, 2950, 3500])
+        self.rng = rng
+        self.runners = [
+            {
+                'numero': numero,
+                'cheval': f'{rng.choice(HORSES)} {rng.choice(NAMES)}',
+                'sexe_age': f'{rng.choice("MHF")}{rng.randint(3, 9)}',
+                'poids': self.distance + rng.choice([0, 0, 25]) if self.trot else
+                rng.randint(52, 62),
+                'jockey': rng.choice(PEOPLE),
+                'entraineur': rng.choice(PEOPLE),
+                'cote': money(rng, 1.5, 40).replace(' ', '')
+            }
+            for numero in range(1, rng.randint(6, 18) + 1)
+        ]
+        self.arrivee = rng.sample([runner['numero'] for runner in self.runners],
+                                  len(self.runners))
+
+
+def day_title(day):
+    value = date.fromisoformat(day)
+    return f'{WEEKDAYS[value.weekday()]} {value.day} {MONTHS[value.month - 1]} {value.year}'
+
+
+def navigation(race):
+    return (
+        '  <div id="navigation">\n'
+        '    <a href="/">Accueil</a> &gt;\n'
+        f'    <a href="/reunions-courses-pmu?date={race.day}">{day_title(race.day)}</a> &gt;\n'
+        f'    <a href="/reunions-courses-pmu?date={race.day}#reunion{race.reunion}">'
+        f'{race.hippo}</a> &gt;\n'
+        f'    <span>{race.name}</span>\n'
+        '  </div>\n'
+    )
+
+
+def page(title, body):
+    return f'{HEAD}<title>{title} - Geny Courses</title>{AFTER_TITLE}{body}{FOOT}'
+
+
+def listing_page(day, reunions, races):
+    parts = [
+        '  <div id="navigation">\n    <a href="/">Accueil</a> &gt;\n'
+        f'    <span>{day_title(day)}</span>\n  </div>\n  <div class="yui-content">\n'
+    ]
+    for reunion in range(1, reunions + 1):
+        for course in range(1, races + 1):
+            race = Race(day, reunion, course)
+            if course == 1:
+                parts.append(f'    <div class="reunion" id="reunion{reunion}">\n'
+                             f'      <h2>R{reunion} - {race.hippo}</h2>\n')
+            parts.append(
+                f'      <div class="yui-g courseLiens {" alternate" if course % 2 == 0 else ""}">\n'
+                f'        <div class="yui-u first">C{course} - {race.heure} - {race.name}</div>\n'
+                '        <div class="yui-u">\n'
+                f'          <a href="/partants-pmu/{race.slug}">\n'
+                '            partants/stats/prono\n          </a>\n'
+                f'          <a href="/rapports-pmu/{race.slug}">rapports</a>\n'
+                '        </div>\n      </div>\n'
+            )
+        parts.append('    </div>\n')
+    parts.append('  </div>\n')
+    return page(f'Réunions et courses PMU du {day_title(day).lower()}', ''.join(parts))
+
+
+def partants_page(race):
+    columns = ['N°', 'Cheval', 'SA', 'Dist.' if race.trot else 'Poids',
+               'Driver' if race.trot else 'Jockey', 'Entraîneur', 'Cote']
+    rows = ''.join(
+        f'        <tr class="{"pair" if runner["numero"] % 2 == 0 else "impair"}">'
+        f'<td>{runner["numero"]}</td><td class="cheval"><a href="/cheval/'
+        f'{slugify(runner["cheval"])}">{runner["cheval"]}</a></td><td>{runner["sexe_age"]}</td>'
+        f'<td>{runner["poids"]}</td><td>{runner["jockey"]}</td><td>{runner["entraineur"]}</td>'
+        f'<td class="cote">{runner["cote"]}</td></tr>\n'
+        for runner in race.runners
+    )
+    body = (
+        navigation(race)
+        + '  <div class="yui-g">\n    <div class="yui-u first nomCourse">\n'
+        f'      <strong>{race.course} - {race.name}</strong>\n    </div>\n'
+        '    <div class="yui-u">\n'
+        f'      <span class="infoCourse">Départ à <strong>{race.heure}</strong><br>'
+        f'{race.discipline} -&nbsp;{race.rng.randint(10, 90)}.000 € - {race.distance} mètres - '
+        'Corde à gauche - Pour 4 ans et plus - Départ autostart</span>\n    </div>\n  </div>\n'
+        '  <div class="yui-content">\n    <h2>Partants</h2>\n'
+        '    <table id="tableau_partants" class="tableauLine">\n      <thead>\n        <tr>'
+        + ''.join(f'<th>{column}</th>' for column in columns)
+        + '</tr>\n      </thead>\n      <tbody>\n' + rows + '      </tbody>\n    </table>\n'
+        '  </div>\n'
+    )
+    return page(f'Partants PMU {race.name} - {race.hippo}', body)
+
+
+def rapport_rows(rows):
+    return ''.join(
+        f'            <tr><td><div class="pari">{bet}</div></td><td class="right">'
+        + (f'<b>{payout} €</b>' if bold else f'{payout} €') + '</td></tr>\n'
+        for bet, payout, bold in rows
+    )
+
+
+def rapports_table(table_id, rows, ecurie=''):
+    return (
+        f'    <table id="{table_id}" class="rapports">\n      <tr>\n        <td class="pmu">\n'
+        '          <div class="entete"><i>PMU</i></div>\n          <table class="rapport">\n'
+        + rows + '          </table>\n' + ecurie + '        </td>\n      </tr>\n    </table>\n'
+    )
+
+
+def rapports_page(race):
+    rng = race.rng
+    by_numero = {runner['numero']: runner for runner in race.runners}
+    arrivees = ''.join(
+        f'        <tr><td>{place}</td><td> {numero} </td><td>{by_numero[numero]["cheval"]}</td>'
+        f'<td>{by_numero[numero]["jockey"]}</td><td>{by_numero[numero]["entraineur"]}</td></tr>\n'
+        for place, numero in enumerate(race.arrivee, start=1)
+    )
+    many = len(race.runners) > 7
+    places = 3 if many else 2
+    ecurie = ''
+    if rng.random() < 0.2:
+        ecurie = (f'          <div class="ecurie"><span>Ecurie : {race.arrivee[1]}&nbsp;-&nbsp;'
+                  f'{race.arrivee[2]}</span></div>\n')
+    duos = [('Gagnant', money(rng, 5, 90), True)]
+    if many:
+        duos += [('Placé', money(rng, 2, 30), False) for _ in range(3)]
+    body = (
+        navigation(race)
+        + '  <div class="yui-g">\n    <div class="yui-u first nomCourse">\n'
+        f'      <strong>{race.course} - {race.name}</strong>\n    </div>\n  </div>\n'
+        '  <div class="yui-content">\n    <h2>Arrivée officielle</h2>\n'
+        '    <table id="arrivees" class="tableauLine">\n      <thead>\n'
+        '        <tr><th>Place</th><th>N°</th><th>Cheval</th><th>Jockey</th><th>Entraîneur</th>'
+        '</tr>\n      </thead>\n      <tbody>\n' + arrivees + '      </tbody>\n    </table>\n\n'
+        '    <h2>Rapports</h2>\n'
+        + rapports_table('lesSolos', rapport_rows(
+            [('Gagnant', money(rng, 1.1, 30), True)]
+            + [('Placé', money(rng, 1.1, 12), False) for _ in range(places)]
+        ), ecurie)
+        + rapports_table('lesDuos', rapport_rows(duos)
+                         + '            <tr><td colspan="2">&nbsp;</td></tr>\n'
+                         + rapport_rows([('Ordre', money(rng, 10, 300), False)]))
+        + rapports_table('lesTrios', rapport_rows([('Ordre', money(rng, 20, 3000), False),
+                                                   ('Désordre', money(rng, 5, 500), True)]))
+        + rapports_table('lesQuartos', '            <tr><td>Super 4</td><td class="right">'
+                         f'{money(rng, 100, 90000)} €</td></tr>\n')
+        + '  </div>\n'
+    )
+    return page(f'Rapports PMU {race.name} - {race.hippo}', body)
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+    disable_nagle_algorithm = True  # Else a kept-alive connection waits on delayed ACKs
+
+    def setup(self):
+        super().setup()
+        self.server.count('connections')
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        if url.path == '/standin-stats':
+            self.send_body(json.dumps(server.stats()).encode(), 'application/json')
+            return
+        server.count('requests')
+        time.sleep(max(0, server.latency + random.uniform(-server.jitter, server.jitter)))
+        if random.random() < server.errors:
+            server.count('errors')
+            self.send_error(503)
+            return
+        body = self.make_page(url)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_body(body.encode('utf-8'), 'text/html; charset=utf-8', server.compression)
+
+    def make_page(self, url):
+        server = self.server
+        try:
+            if url.path == '/reunions-courses-pmu':
+                day = parse_qs(url.query)['date'][0]
+                date.fromisoformat(day)
+                return listing_page(day, server.reunions, server.races)
+            kind, slug = url.path.strip('/').split('/')
+            number = int(slug.rsplit('_c', 1)[1])
+            race = Race(slug[:10], number // 100 % 100, number % 100)
+        except (KeyError, ValueError, IndexError):
+            return None
+        if race.slug != slug or not (1 <= race.reunion <= server.reunions) or \
+                not (1 <= race.course <= server.races):
+            return None
+        if kind == 'partants-pmu':
+            return partants_page(race)
+        if kind == 'rapports-pmu':
+            return rapports_page(race)
+        return None
+
+    def send_body(self, body, content_type, compression=False):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        if compression and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=6)
+            self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count('bytes', len(body))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandinServer(ThreadingHTTPServer):
+    """The stand-in, serving in threads and counting what it serves."""
+    daemon_threads = True
+
+    def __init__(self, address, reunions=8, races=8, latency=0, jitter=0, errors=0,
+                 compression=True):
+        super().__init__(address, StandinHandler)
+        self.reunions = reunions
+        self.races = races
+        self.latency = latency  # Seconds
+        self.jitter = jitter
+        self.errors = errors  # Fraction of responses that are 503 errors
+        self.compression = compression  # Whether pages are gzipped for requests accepting it
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'connections': 0, 'errors': 0, 'bytes': 0}
+
+    @property
+    def url(self):
+        return f'http://{self.server_address[0]}:{self.server_port}'
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counts[name] += value
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+def serve(reunions=8, races=8, latency=0, jitter=0, errors=0, compression=True, host='127.0.0.1',
+          port=0):
+    """Starts the stand-in in a thread, on a free port by default. Returns the server."""
+    server = StandinServer((host, port), reunions, races, latency, jitter, errors, compression)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080, help='0 for any free port')
+    parser.add_argument('--reunions', type=int, default=8, help='reunions a day')
+    parser.add_argument('--races', type=int, default=8, help='races a reunion, at most 99')
+    parser.add_argument('--latency', type=float, default=0, help='ms added to every response')
+    parser.add_argument('--jitter', type=float, default=0, help='ms the latency varies by')
+    parser.add_argument('--errors', type=float, default=0,
+                        help='fraction of responses that are 503 errors, e.g. 0.02')
+    parser.add_argument('--no-compression', dest='compression', action='store_false',
+                        help='never gzip the pages')
+    args = parser.parse_args(args)
+    if not (1 <= args.reunions <= 99 and 1 <= args.races <= 99):
+        parser.error('--reunions and --races must be from 1 to 99')
+    if not 0 <= args.errors <= 1:
+        parser.error('--errors must be from 0 to 1')
+    return args
+
+
+def main(args=None):
+    args = parse_args(args)
+    server = StandinServer((args.host, args.port), args.reunions, args.races,
+                           args.latency / 1000, args.jitter / 1000, args.errors, args.compression)
+    print(f'Serving on {server.url}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
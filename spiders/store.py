@@ -0,0 +1,211 @@
+"""
+Indexed SQLite store of the combined race rows, to query years of races at once rather than
+opening a file per day. E.g.
+    scrapy runspider geny_scrape.py -a dates=30/07/2018 -a store=results.db
+    python store.py results.db --import july.jsonl
+    python store.py results.db --start 2018-01-01 --end 2018-12-31 --hippo Vincennes \
+        --discipline T --bet super4 --above 1000
+
+Every race is one row keyed by its race id, so rescraping a race updates it (an upsert). Values
+are stored typed (see normalise.py): payouts as REAL, missing ones as NULL. There are indexes on
+the date, on the hippodrome and on the discipline (both with the date), bench_store.py checks
+that queries over years of races stay under 100ms.
+"""
+
+import argparse
+import csv
+import sqlite3
+import sys
+import time
+
+from normalise import normalise
+from records import ARRIVEES, COLUMNS, PAYOUTS
+
+# SQLite type of each column, the rest are TEXT
+TYPES = dict(
+    {column: 'TEXT' for column in COLUMNS},
+    hippo='TEXT COLLATE NOCASE',
+    reunion='INTEGER',
+    course='INTEGER',
+    partants='INTEGER'
+)
+TYPES.update({column: 'INTEGER' for column in ARRIVEES})
+TYPES.update({column: 'REAL' for column in PAYOUTS})
+FIELDS = ['race_id', 'day'] + list(COLUMNS)
+
+
+class ResultsStore():
+    """
+    The store, which is also a writer (see writers.py), so the spider can upsert into it as races
+    complete. Writes are committed at least every checkpoint_secs seconds.
+    """
+
+    def __init__(self, path, checkpoint_secs=5):
+        self.path = path
+        self.checkpoint_secs = checkpoint_secs
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS races (race_id TEXT PRIMARY KEY, day TEXT NOT NULL, '
+            + ', '.join(f'{column} {TYPES[column]}' for column in COLUMNS) + ')'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS races_date ON races (date)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS races_hippo ON races (hippo, date)')
+        self.conn.execute(
+            'CREATE INDEX IF NOT EXISTS races_discipline ON races (discipline, date)'
+        )
+        self.conn.commit()
+        self.upsert = (
+            f'INSERT INTO races ({", ".join(FIELDS)}) VALUES ({", ".join("?" * len(FIELDS))}) '
+            'ON CONFLICT (race_id) DO UPDATE SET '
+            + ', '.join(f'{field} = excluded.{field}' for field in FIELDS[1:])
+        )
+        self.last_checkpoint = time.monotonic()
+        self.pending = 0  # Races written since the last checkpoint
+
+    def __repr__(self):
+        return f'ResultsStore: {self.path}'
+
+    @staticmethod
+    def values(result):
+        typed = normalise(result, decimal=True)
+        typed['date'] = typed['date'].isoformat()
+        return [
+            float(typed[field]) if field in PAYOUTS and typed[field] is not None else typed[field]
+            for field in FIELDS
+        ]
+
+    def write(self, result):
+        """Adds a RaceResult, or updates it if the race is already stored."""
+        self.conn.execute(self.upsert, self.values(result))
+        self.pending += 1
+        if time.monotonic() - self.last_checkpoint >= self.checkpoint_secs:
+            self.checkpoint()
+
+    def write_many(self, results):
+        """Adds or updates many RaceResults in one transaction."""
+        with self.conn:
+            self.conn.executemany(self.upsert, (self.values(result) for result in results))
+        # Updates the statistics SQLite picks indexes with, else it can pick a poor one
+        self.conn.execute('ANALYZE')
+
+    def checkpoint(self):
+        """Commits everything written so far."""
+        if self.pending:
+            self.conn.commit()
+            self.pending = 0
+        self.last_checkpoint = time.monotonic()
+
+    @staticmethod
+    def where(start=None, end=None, hippo=None, discipline=None, bet=None, above=None,
+              below=None):
+        """Returns the WHERE clause (or '') and its parameters for the filters of query."""
+        where = []
+        params = []
+        if start is not None:
+            where.append('date >= ?')
+            params.append(start)
+        if end is not None:
+            where.append('date <= ?')
+            params.append(end)
+        if hippo is not None:
+            where.append('hippo = ?')
+            params.append(hippo)
+        if discipline is not None:
+            where.append('discipline = ?')
+            params.append(discipline)
+        if bet is not None:
+            if bet not in PAYOUTS:
+                raise ValueError(f'Not a bet type: {bet}, use one of {", ".join(PAYOUTS)}')
+            where.append(f'{bet} IS NOT NULL')
+            if above is not None:
+                where.append(f'{bet} > ?')
+                params.append(above)
+            if below is not None:
+                where.append(f'{bet} < ?')
+                params.append(below)
+        elif above is not None or below is not None:
+            raise ValueError('A bet type is needed for above or below')
+        return (' WHERE ' + ' AND '.join(where) if where else ''), params
+
+    def query(self, start=None, end=None, hippo=None, discipline=None, bet=None, above=None,
+              below=None, limit=None):
+        """
+        Returns the races (as dicts of race_id, day and every column) from the YYYY-MM-DD start
+        to end dates, at a hippodrome (any case), of a discipline ('T', 'P' or 'O') and with the
+        payout of a bet type (a payout column, e.g. 'super4') above or below an amount, ordered
+        by date, reunion and course. Every filter is optional.
+        """
+        where, params = self.where(start, end, hippo, discipline, bet, above, below)
+        sql = f'SELECT {", ".join(FIELDS)} FROM races{where} ORDER BY date, reunion, course'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return [dict(zip(FIELDS, row)) for row in self.conn.execute(sql, params)]
+
+    def count(self, *args, **kwargs):
+        """Returns how many races query would, taking the same filters (but no limit)."""
+        where, params = self.where(*args, **kwargs)
+        return self.conn.execute(f'SELECT COUNT(*) FROM races{where}', params).fetchone()[0]
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM races').fetchone()[0]
+
+    def close(self):
+        self.checkpoint()
+        self.conn.execute('PRAGMA optimize')
+        self.conn.close()
+
+
+def import_file(store, path):
+    """Upserts the races of a JSON lines file (see writers.JsonLinesWriter). Returns how many."""
+    from writers import read_json_lines
+
+    results = list(read_json_lines(path))
+    store.write_many(results)
+    return len(results)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('store', help='SQLite file of the store')
+    parser.add_argument('--import', dest='import_files', action='append', default=[],
+                        metavar='FILE', help='JSON lines file of races to add, can be repeated')
+    parser.add_argument('--start', metavar='YYYY-MM-DD')
+    parser.add_argument('--end', metavar='YYYY-MM-DD')
+    parser.add_argument('--hippo')
+    parser.add_argument('--discipline', choices=['T', 'P', 'O'])
+    parser.add_argument('--bet', choices=PAYOUTS)
+    parser.add_argument('--above', type=float, help='payout of --bet above this')
+    parser.add_argument('--below', type=float, help='payout of --bet below this')
+    parser.add_argument('--limit', type=int)
+    args = parser.parse_args(args)
+    if (args.above is not None or args.below is not None) and args.bet is None:
+        parser.error('--above and --below need --bet')
+    return args
+
+
+def main(args=None):
+    args = parse_args(args)
+    store = ResultsStore(args.store)
+    try:
+        for path in args.import_files:
+            print(f'{import_file(store, path)} races imported from {path}', file=sys.stderr)
+        if args.import_files and not any((args.start, args.end, args.hippo, args.discipline,
+                                          args.bet)):
+            return 0
+        start = time.perf_counter()
+        races = store.query(args.start, args.end, args.hippo, args.discipline, args.bet,
+                            args.above, args.below, args.limit)
+        seconds = time.perf_counter() - start
+        writer = csv.DictWriter(sys.stdout, FIELDS)
+        writer.writeheader()
+        writer.writerows(races)
+        print(f'{len(races)} races in {seconds * 1000:.1f}ms', file=sys.stderr)
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+Watches a race day, writing each race's row as soon as its rapports are published, rather than
+rerunning the whole spider. E.g.
+    python watch.py -o today.jsonl
+    python watch.py 30/07/2018 -o - --poll 30
+The day's races are found once from its listing (see GenyScrapeSpider.race_links) and their
+partants pages scraped once, for the time each race starts. After that only the rapports pages
+of the races still waiting for them are asked for: none before a race's start time, then every
+--poll seconds, backing off up to --max-poll seconds while a page hasn't changed. The requests
+are conditional (If-None-Match/If-Modified-Since), so an unchanged page costs no download.
+A page that fails to download (a 5xx, a dropped connection, a timeout) is asked for again
+later with the same backoff, rather than ending the watch. check_watch.py checks this.
+Rows are appended to a JSON lines file (see writers.JsonLinesWriter) and flushed at once;
+races already in the file are skipped, so the watch can be restarted.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import date, datetime
+
+import requests
+
+from api import GenyClient
+from geny_scrape import Date
+from partants import extract_stats
+from rapports import extract_race_payouts
+from records import RaceResult
+from writers import JsonLinesWriter, read_json_lines
+
+logger = logging.getLogger('geny-watch')
+
+
+class WatchedRace():
+    """A race waiting for its rapports."""
+
+    def __init__(self, stats, rapports, next_poll, give_up):
+        self.stats = stats
+        self.rapports = rapports  # Path of the rapports page
+        self.next_poll = next_poll  # Time (time.time()) to next ask for the rapports page
+        self.give_up = give_up
+        self.wait = None  # Seconds between polls, None until the first poll
+        self.validators = {}  # ETag and Last-Modified of the last rapports page
+
+    def __repr__(self):
+        return f'WatchedRace: {self.stats.race_id}'
+
+
+def start_time(day, heure):
+    """
+    Returns the time a race starts, from its YYYY-MM-DD day and heure (e.g. '15h15'). The heure
+    is French time, taken here as the local time, so the watch needs to run on French time.
+    """
+    try:
+        hours, minutes = (int(part) for part in heure.split('h'))
+    except ValueError:
+        hours, minutes = 0, 0  # Unknown, so polled straight away
+    return datetime.combine(date.fromisoformat(day), datetime.min.time()).replace(
+        hour=hours, minute=minutes
+    ).timestamp()
+
+
+def finished(payouts):
+    """A race's rapports are complete once they have the winner and its payout."""
+    return payouts.arrivee_1 != '' and payouts.gagnant != ''
+
+
+class RaceWatcher():
+    """
+    Polls the rapports of a day's races until each is published, handing every RaceResult to
+    sink (a writer, see writers.py) as soon as it is complete. clock and sleep are time.time and
+    time.sleep, unless a test needs them to be otherwise.
+    """
+
+    def __init__(self, client, day, sink, poll=60, max_poll=600, delay=120,
+                 give_up=3 * 60 * 60, skip=(), clock=time.time, sleep=time.sleep):
+        self.client = client
+        self.day = day
+        self.sink = sink
+        self.poll = poll
+        self.max_poll = max_poll
+        self.delay = delay  # Seconds after a race starts before its rapports are asked for
+        self.give_up_after = give_up  # Seconds after a race starts to stop waiting for it
+        self.skip = set(skip)  # Race ids already written
+        self.clock = clock
+        self.sleep = sleep
+        self.waiting = []
+        self.found = set()  # Race ids of the races found by discover
+
+    def discover(self):
+        """
+        Finds the day's races and scrapes their partants pages, once each. Returns False if a
+        page couldn't be downloaded, for run to call it again later for the races still missing.
+        """
+        try:
+            races = self.client.races(self.day)
+        except requests.RequestException as error:
+            logger.warning(f'Could not get the races of {self.day}: {error}')
+            return False
+        complete = True
+        for links in races:
+            if links['pronostics'] is None:
+                continue
+            race_id = links['pronostics'].split('-')[-1]
+            if race_id in self.skip or race_id in self.found:
+                continue
+            try:
+                stats = extract_stats(self.client.get(links['pronostics']), self.day)
+            except requests.RequestException as error:
+                logger.warning(f'Could not get the partants of {race_id}: {error}')
+                complete = False
+                continue
+            self.found.add(race_id)
+            starts = start_time(self.day, stats.heure)
+            slug = links['pronostics'].split('/')[-1]
+            self.waiting.append(WatchedRace(
+                stats,
+                links['rapports'] or f'/rapports-pmu/{slug}',
+                starts + self.delay,
+                starts + self.give_up_after
+            ))
+        self.waiting.sort(key=lambda race: race.next_poll)
+        logger.info(f'Watching {len(self.waiting)} races of {self.day}')
+        return complete
+
+    def check(self, race):
+        """Polls a race's rapports page. Returns the RaceResult if the race is complete."""
+        try:
+            page, race.validators = self.client.get_if_changed(race.rapports, race.validators)
+        except requests.RequestException as error:
+            logger.warning(f'Could not get the rapports of {race.stats.race_id}: {error}')
+            page = None
+        if page is not None:
+            payouts = extract_race_payouts(page, self.day)
+            if finished(payouts):
+                return RaceResult.from_halves(race.stats, payouts)
+        # Not there yet, unchanged since last time or failed, so the next poll can wait longer
+        race.wait = self.poll if race.wait is None else min(race.wait * 2, self.max_poll)
+        race.next_poll = self.clock() + race.wait
+        return None
+
+    def poll_due(self):
+        """Polls every race that is due. Returns how many races were completed."""
+        completed = 0
+        now = self.clock()
+        for race in [race for race in self.waiting if race.next_poll <= now]:
+            result = self.check(race)
+            if result is not None:
+                self.sink.write(result)
+                self.waiting.remove(race)
+                completed += 1
+                logger.info(f'{result.race_id} ({result.reunion}C{result.course}) completed')
+            elif self.clock() >= race.give_up:
+                self.waiting.remove(race)
+                logger.warning(f'Gave up waiting for the rapports of {race.stats.race_id}')
+        return completed
+
+    def run(self):
+        """
+        Watches until every race is completed or given up on. Races that couldn't be found are
+        looked for again with the same backoff as the polls, for up to give_up seconds.
+        """
+        started = self.clock()
+        discovered = self.discover()
+        wait = self.poll
+        next_discovery = started + wait
+        while self.waiting or not discovered:
+            if not discovered and self.clock() >= next_discovery:
+                discovered = self.discover()
+                if not discovered and self.clock() - started >= self.give_up_after:
+                    logger.warning(f'Gave up looking for the races of {self.day}')
+                    discovered = True
+                wait = min(wait * 2, self.max_poll)
+                next_discovery = self.clock() + wait
+            self.poll_due()
+            due = [race.next_poll for race in self.waiting]
+            if not discovered:
+                due.append(next_discovery)
+            if due:
+                self.sleep(max(0, min(due) - self.clock()))
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('date', nargs='?', metavar='DD/MM/YYYY',
+                        help='day to watch, by default today')
+    parser.add_argument('-o', '--output', default='-',
+                        help="JSON lines file to append the rows to, '-' for stdout (default)")
+    parser.add_argument('--poll', type=float, default=60,
+                        help='seconds between polls of a race, to start with')
+    parser.add_argument('--max-poll', type=float, default=600,
+                        help='most seconds between polls of a race')
+    parser.add_argument('--base-url', default='https://www.geny.com')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(name)s] %(message)s')
+    day = Date(args.date).iso if args.date else date.today().isoformat()
+    skip = []
+    if args.output != '-' and os.path.exists(args.output):
+        skip = [result.race_id for result in read_json_lines(args.output)]
+
+    client = GenyClient(args.base_url)
+    sink = JsonLinesWriter(args.output, live=True)
+    try:
+        RaceWatcher(client, day, sink, poll=args.poll, max_poll=args.max_poll, skip=skip).run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+        client.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
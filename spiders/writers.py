@@ -0,0 +1,356 @@
+"""
+Writers that the combined race rows are streamed to while the crawl runs.
+
+A writer has write(result), called with the RaceResult (see records.py) as soon as a race has
+both its halves, and close(), called when the spider closes. result.as_row() is in the same order
+as the Excel columns, see records.COLUMNS.
+"""
+
+import json
+import os
+import sys
+import tempfile
+from collections import OrderedDict, defaultdict
+from dataclasses import asdict
+
+from normalise import normalise
+from records import ARRIVEES, PAYOUTS, RaceResult
+
+
+# Colours of the heading bands of the Excel sheets, as RGB
+HEADING_COLOURS = {
+    'stats': (150, 150, 150),
+    'arrivees': (247, 150, 70),
+    'rapports': (146, 205, 220)
+}
+"""
+Heading cells of the Excel sheets, in row order, as
+(first_row, last_row, first_col, last_col, text, colour). Cells spanning more than one column
+are merged.
+COL:   A  B  C  D  E  F  G  H  I  J  K  L  M  N  O  P  Q  R  S  T  U  V  W  X
+INDEX: 0  1  2  3  4  5  6  7  8  9 10 11 12 13 14 15 16 17 18 19 20 21 22 23
+"""
+HEADINGS = (
+    # A -> G
+    [
+        (0, 0, col, col, text, 'stats')
+        for col, text in enumerate(['Date', 'Heure', 'Reunion', 'Hippo', 'Discip', 'Course',
+                                    'Partpants'])
+    ]
+    + [
+        (0, 0, 7, 10, 'ARRIVEES', 'arrivees'),  # H -> K
+        (0, 0, 11, 14, 'RAPPORTS JEUX SIMPLES G P Pour 1€', 'rapports'),  # L -> O
+        (0, 0, 15, 19, 'COUPLES pour 1€', 'rapports'),  # P -> T
+        (0, 0, 20, 20, 'TRIOS', 'rapports'),  # U
+        (0, 0, 21, 21, '', 'rapports'),  # V
+        (0, 0, 22, 22, 'SUPER4', 'rapports'),  # W
+        (0, 0, 23, 23, 'Ecurie', 'rapports')  # X
+    ]
+    + [(1, 1, col, col, '', 'stats') for col in range(7)]
+    + [(1, 1, 7, 10, 'LES 4 PREMIERS CHEVAUX ARRIVES', 'arrivees')]
+    + [
+        (1, 1, col, col, text, 'rapports')
+        for col, text in enumerate(['GAGNANT', 'GAGNANT PLACE', 'PLACE', 'PLACE', 'CG', 'CO',
+                                    'CP1', 'CP2', 'CP3', 'Désordre', 'Ordre', '', ''], start=11)
+    ]
+)
+
+
+def read_json_lines(path):
+    """Yields the RaceResults of a file written by JsonLinesWriter."""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield RaceResult(**json.loads(line))
+
+
+def replace_atomically(path, save):
+    """
+    Calls save with the path of a temporary file next to path, then renames it over path, so
+    readers see the old file or the new one, never half of one.
+    """
+    folder, name = os.path.split(os.path.abspath(path))
+    handle, temp = tempfile.mkstemp(dir=folder, prefix=f'.{name}.', suffix='.tmp')
+    os.close(handle)
+    try:
+        save(temp)
+        if os.path.exists(path):
+            mode = os.stat(path).st_mode & 0o777
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(temp, mode)  # mkstemp makes it private, so it keeps the permissions of a file
+        with open(temp, 'rb') as f:
+            os.fsync(f.fileno())  # On disk before it replaces the old file
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+class JsonLinesWriter():
+    """
+    Writes each RaceResult as a line of JSON, with the race_id, day and every column, in the
+    order races finished scraping. read_json_lines reads them back. A filename of '-' writes to
+    stdout. With live=True every line is flushed as soon as it is written, for whatever is
+    reading the file as it grows (see watch.py).
+    """
+
+    def __init__(self, filename, live=False):
+        self.filename = filename
+        if filename == '-':
+            self.file = sys.stdout
+            self.live = True
+            return
+        folder = os.path.dirname(filename)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.file = open(filename, 'a' if live else 'w', encoding='utf-8')
+        self.live = live
+
+    def __repr__(self):
+        return f'JsonLinesWriter: {self.filename}'
+
+    def write(self, result):
+        self.file.write(json.dumps(asdict(result), ensure_ascii=False) + '\n')
+        if self.live:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class DatasetWriter():
+    """
+    Keeps a growing dataset of every race scraped, for daily runs feeding a master dataset: a
+    folder of one JSON lines file per day, <folder>/YYYY-MM-DD.jsonl, the races in reunion and
+    course order. Races are keyed by day and race id. On close only the days with new or changed
+    races are rewritten, merged with the races already there, so a run's work depends on the
+    days it scraped rather than on the size of the dataset. Each day is replaced atomically.
+    normalise.load_frame and read_json_lines read the days back.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.days = defaultdict(dict)  # Day -> race id -> RaceResult
+        self.updated = {}  # Day -> races new or changed, once closed
+
+    def __repr__(self):
+        return f'DatasetWriter: {self.folder}'
+
+    def path(self, day):
+        return os.path.join(self.folder, f'{day}.jsonl')
+
+    def write(self, result):
+        self.days[result.day][result.race_id] = result
+
+    def save_day(self, day, results):
+        def save(temp):
+            with open(temp, 'w', encoding='utf-8') as f:
+                for result in sorted(results, key=lambda result: (*result.sort_key(),
+                                                                  result.race_id)):
+                    f.write(json.dumps(asdict(result), ensure_ascii=False) + '\n')
+        replace_atomically(self.path(day), save)
+
+    def close(self):
+        os.makedirs(self.folder, exist_ok=True)
+        for day, scraped in sorted(self.days.items()):
+            path = self.path(day)
+            kept = {}
+            if os.path.exists(path):
+                kept = {result.race_id: result for result in read_json_lines(path)}
+            changed = [
+                race_id for race_id, result in scraped.items() if kept.get(race_id) != result
+            ]
+            if changed:
+                kept.update(scraped)
+                self.save_day(day, kept.values())
+                self.updated[day] = len(changed)
+        self.days = defaultdict(dict)
+
+
+class ParquetWriter():
+    """
+    Writes the rows to one Parquet file per day, <folder>/YYYY-MM-DD.parquet, with a typed
+    schema. Rows are written out in batches of batch_size while the crawl runs, whatever their
+    days, so no more than batch_size rows are held. The files of the max_open days written to
+    last are kept open, the others are finished, so a long backfill doesn't run out of file
+    handles. Should more rows of a finished day come, its file is rewritten with them.
+    Needs pyarrow ("pip install pyarrow").
+    """
+
+    def __init__(self, folder, batch_size=500, max_open=16):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('pyarrow is needed for the Parquet export, use "pip install pyarrow"')
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.folder = folder
+        self.batch_size = batch_size
+        self.max_open = max_open
+        self.schema = pyarrow.schema(
+            [
+                ('race_id', pyarrow.string()),
+                ('date', pyarrow.date32()),
+                ('heure', pyarrow.string()),
+                ('reunion', pyarrow.int16()),
+                ('hippo', pyarrow.string()),
+                ('discipline', pyarrow.string()),
+                ('course', pyarrow.int16()),
+                ('partants', pyarrow.int16())
+            ]
+            + [(column, pyarrow.int16()) for column in ARRIVEES]
+            + [(column, pyarrow.decimal128(9, 2)) for column in PAYOUTS]
+            + [('ecurie', pyarrow.string())]
+        )
+        self.rows = []  # (day, row) waiting to be written
+        # Day -> (open pyarrow.parquet.ParquetWriter, path it writes to), least recently used
+        # first
+        self.files = OrderedDict()
+        self.finished = set()  # Days whose file has been written and closed
+        self.rewritten = 0  # Times a finished day's file was rewritten with more rows
+
+    def __repr__(self):
+        return f'ParquetWriter: {self.folder}'
+
+    def path(self, day):
+        return os.path.join(self.folder, f'{day}.parquet')
+
+    def write(self, result):
+        self.rows.append((result.day, normalise(result, decimal=True)))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the rows waiting, one table per day."""
+        days = defaultdict(list)
+        for day, row in self.rows:
+            days[day].append(row)
+        self.rows = []
+        for day, rows in days.items():
+            self.open(day).write_table(self.pa.Table.from_pylist(rows, schema=self.schema))
+
+    def open(self, day):
+        """Returns the open writer of a day's file, finishing the least recently used one."""
+        if day in self.files:
+            self.files.move_to_end(day)
+            return self.files[day][0]
+        os.makedirs(self.folder, exist_ok=True)
+        if day in self.finished:
+            # Written next to the finished file, then renamed over it with its rows first
+            path = os.path.join(self.folder, f'.{day}.parquet.tmp')
+            parquet_file = self.pq.ParquetWriter(path, self.schema)
+            parquet_file.write_table(self.pq.read_table(self.path(day), schema=self.schema))
+            self.finished.discard(day)
+            self.rewritten += 1
+        else:
+            path = self.path(day)
+            parquet_file = self.pq.ParquetWriter(path, self.schema)
+        self.files[day] = (parquet_file, path)
+        while len(self.files) > self.max_open:
+            self.finish(next(iter(self.files)))
+        return parquet_file
+
+    def finish(self, day):
+        parquet_file, path = self.files.pop(day)
+        parquet_file.close()
+        if path != self.path(day):
+            os.replace(path, self.path(day))
+        self.finished.add(day)
+
+    def close(self):
+        self.flush()
+        for day in list(self.files):
+            self.finish(day)
+
+
+class XlsxWriter():
+    """
+    Streams the rows to an .xlsx file as they are scraped, one sheet per day with the same
+    headings as the .xls workbook. Rows go straight to disk (xlsxwriter's constant_memory mode),
+    so memory stays flat however many rows are written. They are in the order races finished
+    scraping, not sorted like the .xls workbook. Needs xlsxwriter ("pip install xlsxwriter").
+
+    constant_memory mode keeps a temp file open per sheet, so only the max_open sheets last
+    written to are kept open, the others being closed as xlsxwriter's close does, and reopened
+    if a late row of their day comes. Years of days fit in the open files a process may have.
+    """
+
+    def __init__(self, filename, days, max_open=16):
+        try:
+            import xlsxwriter
+        except ImportError:
+            raise ImportError('xlsxwriter is needed for .xlsx output, use "pip install xlsxwriter"')
+        self.filename = filename
+        self.book = xlsxwriter.Workbook(filename, {'constant_memory': True})
+        cell = {
+            'font_name': 'Arial',
+            'bold': True,
+            'font_size': 8,
+            'border': 1,
+            'border_color': 'black'
+        }
+        # Formats are made once and shared by every cell
+        self.heading_formats = {
+            colour: self.book.add_format(dict(
+                cell,
+                pattern=1,
+                bg_color='#{:02X}{:02X}{:02X}'.format(*rgb),
+                **({} if colour == 'stats' else {'align': 'center'})
+            ))
+            for colour, rgb in HEADING_COLOURS.items()
+        }
+        self.data_format = self.book.add_format(dict(cell, align='left'))
+        self.max_open = max_open
+        self.sheets = {}
+        self.next_rows = {}
+        self.open_sheets = OrderedDict()  # Days with their sheet's temp file open, by last use
+        self.reopened = 0
+        for day in days:
+            self.add_sheet(day)
+
+    def __repr__(self):
+        return f'XlsxWriter: {self.filename}'
+
+    def add_sheet(self, day):
+        sheet = self.book.add_worksheet(day)
+        for first_row, last_row, first_col, last_col, text, colour in HEADINGS:
+            if (first_row, first_col) == (last_row, last_col):
+                sheet.write(first_row, first_col, text, self.heading_formats[colour])
+            else:
+                sheet.merge_range(first_row, first_col, last_row, last_col, text,
+                                  self.heading_formats[colour])
+        self.sheets[day] = sheet
+        self.next_rows[day] = 2  # Rows start under the two heading rows
+        self.use(day)
+
+    def use(self, day):
+        """Makes day's sheet the last used, reopening its temp file and closing the oldest's."""
+        if day in self.open_sheets:
+            self.open_sheets.move_to_end(day)
+            return
+        sheet = self.sheets[day]
+        if sheet.row_data_fh_closed:
+            sheet._opt_reopen()
+            if self.next_rows[day] > 2:
+                self.reopened += 1  # For a late row, the day's others having been written
+        self.open_sheets[day] = sheet
+        while len(self.open_sheets) > self.max_open:
+            _, sheet = self.open_sheets.popitem(last=False)
+            sheet._opt_close()
+
+    def write(self, result):
+        day = result.day
+        if day not in self.sheets:
+            self.add_sheet(day)
+        self.use(day)
+        self.sheets[day].write_row(self.next_rows[day], 0, result.as_row(), self.data_format)
+        self.next_rows[day] += 1
+
+    def close(self):
+        self.book.close()
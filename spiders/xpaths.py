@@ -0,0 +1,76 @@
+"""
+Selector backends, which run the XPaths of extract_stats, extract_race_payouts and race_links.
+
+'parsel' (the default) runs them through Scrapy's selectors, as response.xpath does: every call
+compiles its expression again and wraps every result in a Selector. 'lxml' runs the same
+expressions on the lxml tree Scrapy has already parsed, each compiled once into an etree.XPath
+and reused for every page, and gets plain strings back. The expressions being the same, so are
+the values, which bench_parsers.py checks on the fixtures (and reports the pages/sec of each).
+Chosen with "-a selectors=lxml" (cli.py --selectors lxml), e.g.
+    select = backend('lxml')
+    root = select.root(response)
+    hippo = select.first(root, '//div[@id="navigation"]/a[3]/text()')
+Queries take XPath variables as keywords, e.g. select.first(root, 'text()[$i]', i=2).
+"""
+
+from lxml import etree
+
+SELECTORS = ('parsel', 'lxml')
+
+
+class ParselSelectors():
+    """XPaths run by parsel, on the response's Selector."""
+    name = 'parsel'
+
+    def root(self, response):
+        return response.selector
+
+    def nodes(self, node, query, **variables):
+        """The nodes a query selects, to run more queries from."""
+        return node.xpath(query, **variables)
+
+    def all(self, node, query, **variables):
+        """Every string a query selects."""
+        return node.xpath(query, **variables).getall()
+
+    def first(self, node, query, **variables):
+        """The first string a query selects, or None."""
+        return node.xpath(query, **variables).get()
+
+
+class LxmlSelectors():
+    """XPaths compiled once, run on the response's lxml tree."""
+    name = 'lxml'
+
+    def __init__(self):
+        self.compiled = {}  # Query -> etree.XPath
+
+    def xpath(self, query):
+        compiled = self.compiled.get(query)
+        if compiled is None:
+            compiled = self.compiled[query] = etree.XPath(query, smart_strings=False)
+        return compiled
+
+    def root(self, response):
+        return response.selector.root
+
+    def nodes(self, node, query, **variables):
+        return self.xpath(query)(node, **variables)
+
+    def all(self, node, query, **variables):
+        return [str(value) for value in self.xpath(query)(node, **variables)]
+
+    def first(self, node, query, **variables):
+        values = self.xpath(query)(node, **variables)
+        return str(values[0]) if values else None
+
+
+BACKENDS = {'parsel': ParselSelectors(), 'lxml': LxmlSelectors()}
+
+
+def backend(name='parsel'):
+    """Returns the selector backend called name, one of SELECTORS."""
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f'Not a valid selector backend: {name}') from None